@@ -22,6 +22,9 @@ log = logging.getLogger("happines_course")
 ADMIN_MENU_STEP = "admin_menu"
 ADMIN_WIZARD_STEP = "admin_wizard"
 
+# Broadcast fan-out status message is edited at most this often.
+_BROADCAST_PROGRESS_EVERY_SEC = 2.0
+
 # Reply buttons (admin UI)
 BTN_LIST = "📋 Список"
 BTN_CREATE = "➕ Создать"
@@ -206,6 +209,17 @@ def register_admin_handlers(app, settings: Settings, services: dict):
         except Exception:
             return False
 
+    async def _is_admin_async(update: Update) -> bool:
+        try:
+            uid = update.effective_user.id if update.effective_user else None
+            if not uid or not admin_svc:
+                return False
+            if hasattr(admin_svc, "is_admin_async"):
+                return bool(await admin_svc.is_admin_async(uid))
+            return bool(admin_svc.is_admin(uid))
+        except Exception:
+            return False
+
     def _is_owner(update: Update) -> bool:
         try:
             uid = update.effective_user.id if update.effective_user else None
@@ -216,6 +230,7 @@ def register_admin_handlers(app, settings: Settings, services: dict):
     state = user_svc.state
     qsvc = services["questionnaire"]
     schedule = services["schedule"]
+    planner = services.get("planner")
     lesson_repo = schedule.lesson
     quest_repo = schedule.quest
     extra_repo = getattr(schedule, "extra", None)
@@ -292,6 +307,84 @@ def register_admin_handlers(app, settings: Settings, services: dict):
         except Exception:
             log.exception("Daily pack regenerate scheduling failed (trigger=%s)", trigger)
 
+    async def _run_questionnaire_broadcast(context: ContextTypes.DEFAULT_TYPE, actor_id: int, status_msg, qid: int, hhmm: str):
+        loop = asyncio.get_running_loop()
+        edits = []
+        last_edit = [0.0]
+
+        async def _edit(text: str):
+            try:
+                await status_msg.edit_text(text)
+            except Exception:
+                log.debug("Broadcast status edit failed (qid=%s)", qid, exc_info=True)
+
+        def _progress(done: int, total: int, created: int):
+            # Called from the planning thread after every batch; Telegram
+            # limits edits, so report at most every couple of seconds.
+            now = loop.time()
+            if now - last_edit[0] < _BROADCAST_PROGRESS_EVERY_SEC:
+                return
+            last_edit[0] = now
+            text = f"⏳ Рассылка анкеты ID={qid}: обработано {done} из {total}, запланировано {created}"
+            edits.append(asyncio.run_coroutine_threadsafe(_edit(text), loop))
+
+        try:
+            created = await asyncio.to_thread(
+                schedule.schedule_questionnaire_broadcast,
+                qid,
+                hhmm,
+                optional=True,
+                progress=_progress,
+            )
+        except Exception:
+            log.exception("Questionnaire broadcast failed (qid=%s)", qid)
+            await asyncio.gather(*(asyncio.wrap_future(f) for f in edits), return_exceptions=True)
+            await _edit(f"❌ Рассылка анкеты ID={qid} прервалась. Подробности в логах.")
+            return
+
+        await asyncio.gather(*(asyncio.wrap_future(f) for f in edits), return_exceptions=True)
+        await _edit(f"✅ Запланировано. Анкета ID={qid}. Получателей: {created}")
+        await _emit_admin_event(
+            context,
+            actor_id,
+            "Запланирована рассылка анкеты",
+            "\n".join(
+                [
+                    f"• ID: {qid}",
+                    f"• Время отправки: {hhmm}",
+                    f"• Получателей: {created}",
+                    "• Тип: broadcast_optional",
+                ]
+            ),
+        )
+
+    def _questionnaire_days(*rows) -> list:
+        # Only manual/daily questionnaires count as unfinished course items.
+        return [r.get("day_index") for r in rows if r and r.get("qtype") in ("manual", "daily")]
+
+    async def _refresh_open_items(reason: str, days):
+        try:
+            await asyncio.to_thread(schedule.open_items.refresh_days, days)
+        except Exception:
+            log.exception("Open items refresh failed (reason=%s)", reason)
+
+    def _course_content_changed(reason: str, days=()):
+        # Lessons, quests and day questionnaires form users' open items
+        # (None = legacy daily questionnaire, listed under every day).
+        # A refresh of all days touches every user: keep it off the event loop.
+        if days:
+            try:
+                asyncio.create_task(_refresh_open_items(reason, None if None in days else list(days)))
+            except Exception:
+                log.exception("Open items refresh scheduling failed (reason=%s)", reason)
+        # Day content feeds every enrolled user's plan: queue them for replanning.
+        if not planner:
+            return
+        try:
+            planner.enqueue_enrolled(reason)
+        except Exception:
+            log.exception("Planner enqueue failed (reason=%s)", reason)
+
     async def _send_events_chat_invite_to_admin(
         context: ContextTypes.DEFAULT_TYPE,
         *,
@@ -1139,7 +1232,7 @@ def register_admin_handlers(app, settings: Settings, services: dict):
     # Reply-based menu router
     # ----------------------------
     async def admin_menu_pick(update: Update, context: ContextTypes.DEFAULT_TYPE):
-        if not _is_admin(update):
+        if not await _is_admin_async(update):
             return
 
         text = (update.effective_message.text or "").strip()
@@ -1147,7 +1240,7 @@ def register_admin_handlers(app, settings: Settings, services: dict):
             return
 
         uid = update.effective_user.id
-        st = state.get_state(uid) or {}
+        st = (await user_svc.get_step_async(uid)) or {}
 
         # If we're in wizard, don't handle anything here.
         # wizard_text (group=-10) will handle Back and input.
@@ -1348,13 +1441,13 @@ def register_admin_handlers(app, settings: Settings, services: dict):
     # Wizard text (adapted from previous implementation; reply keyboards only)
     # ----------------------------
     async def wizard_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
-        if not _is_admin(update):
+        if not await _is_admin_async(update):
             return
         text = (update.effective_message.text or "").strip()
         if not text or text.startswith("/"):
             return
         uid = update.effective_user.id
-        st = state.get_state(uid)
+        st = await user_svc.get_step_async(uid)
 
         # ✅ Wizard handler must only run when we are really inside the wizard.
         if not st or st.get("step") != ADMIN_WIZARD_STEP:
@@ -1588,6 +1681,7 @@ def register_admin_handlers(app, settings: Settings, services: dict):
                 ok = lesson_repo.delete_day(day)
                 if ok:
                     _schedule_daily_pack_regenerate("lesson_deleted")
+                    _course_content_changed("lesson_deleted", [day])
                 state.clear_state(update.effective_user.id)
                 await _show_lessons_menu(update)
                 await update.effective_message.reply_text("✅ Удалено" if ok else "⚠️ Не найдено")
@@ -1723,6 +1817,7 @@ def register_admin_handlers(app, settings: Settings, services: dict):
             if source_day != day:
                 lesson_repo.delete_day(source_day)
             _schedule_daily_pack_regenerate("lesson_updated" if old else "lesson_added")
+            _course_content_changed("lesson_updated" if old else "lesson_added", [day, source_day])
             state.clear_state(update.effective_user.id)
             await _show_lessons_menu(update)
             await update.effective_message.reply_text("✅ Сохранено.")
@@ -1753,6 +1848,8 @@ def register_admin_handlers(app, settings: Settings, services: dict):
             if mode == "qst_delete_day":
                 old = quest_repo.get_by_day(day)
                 ok = quest_repo.delete_day(day)
+                if ok:
+                    _course_content_changed("quest_deleted", [day])
                 state.clear_state(update.effective_user.id)
                 await _show_quests_menu(update)
                 await update.effective_message.reply_text("✅ Удалено" if ok else "⚠️ Не найдено")
@@ -1887,6 +1984,7 @@ def register_admin_handlers(app, settings: Settings, services: dict):
             except Exception:
                 await update.effective_message.reply_text("⚠️ Упс, ошибка. Попробуй ещё раз.")
                 raise ApplicationHandlerStop
+            _course_content_changed("quest_updated" if old else "quest_added", [day, source_day])
             state.clear_state(update.effective_user.id)
             await _show_quests_menu(update)
             await update.effective_message.reply_text("✅ Сохранено.")
@@ -1918,6 +2016,8 @@ def register_admin_handlers(app, settings: Settings, services: dict):
             if mode == "ext_delete_day":
                 old = extra_repo.get_by_day(day)
                 ok = extra_repo.delete_day(day)
+                if ok:
+                    _course_content_changed("extra_deleted")
                 state.clear_state(update.effective_user.id)
                 await _show_extras_menu(update)
                 await update.effective_message.reply_text("✅ Удалено" if ok else "⚠️ Не найдено")
@@ -2090,6 +2190,7 @@ def register_admin_handlers(app, settings: Settings, services: dict):
             except Exception:
                 await update.effective_message.reply_text("⚠️ Упс, ошибка. Попробуй ещё раз.")
                 raise ApplicationHandlerStop
+            _course_content_changed("extra_updated" if old else "extra_added")
             state.clear_state(update.effective_user.id)
             await _show_extras_menu(update)
             await update.effective_message.reply_text("✅ Сохранено.")
@@ -2154,6 +2255,7 @@ def register_admin_handlers(app, settings: Settings, services: dict):
                 update.effective_user.id,
                 day_index=day_index,
             )
+            _course_content_changed("questionnaire_added", [day_index])
             item = qsvc.get(qid)
             state.clear_state(update.effective_user.id)
             await _show_q_menu(update)
@@ -2264,6 +2366,10 @@ def register_admin_handlers(app, settings: Settings, services: dict):
                 points,
                 day_index=day_index,
             )
+            _course_content_changed(
+                "questionnaire_updated",
+                _questionnaire_days(old, {"qtype": str(payload.get("qtype") or "manual"), "day_index": day_index}),
+            )
             state.clear_state(update.effective_user.id)
             await _show_q_menu(update)
             await update.effective_message.reply_text("✅ Анкета обновлена.")
@@ -2292,6 +2398,8 @@ def register_admin_handlers(app, settings: Settings, services: dict):
             qid = int(text)
             old = qsvc.get(qid)
             ok = qsvc.delete(qid)
+            if ok:
+                _course_content_changed("questionnaire_deleted", _questionnaire_days(old))
             state.clear_state(update.effective_user.id)
             await _show_q_menu(update)
             await update.effective_message.reply_text("✅ Удалено" if ok else "⚠️ Не найдено")
@@ -2742,23 +2850,12 @@ def register_admin_handlers(app, settings: Settings, services: dict):
                 int(payload["points"]),
                 update.effective_user.id,
             )
-            created = schedule.schedule_questionnaire_broadcast(qid, hhmm, optional=True)
             state.clear_state(update.effective_user.id)
             await _show_q_menu(update)
-            await update.effective_message.reply_text(f"✅ Запланировано. Анкета ID={qid}. Получателей: {created}")
-            await _emit_admin_event(
-                context,
-                uid,
-                "Запланирована рассылка анкеты",
-                "\n".join(
-                    [
-                        f"• ID: {qid}",
-                        f"• Время отправки: {hhmm}",
-                        f"• Получателей: {created}",
-                        "• Тип: broadcast_optional",
-                    ]
-                ),
-            )
+            status_msg = await update.effective_message.reply_text(f"⏳ Планирую рассылку анкеты ID={qid}…")
+            # Fan-out runs in the background: the admin keeps using the bot
+            # and sees progress in status_msg.
+            context.application.create_task(_run_questionnaire_broadcast(context, uid, status_msg, qid, hhmm))
             return
 
         # --- Admins owner wizard ---
@@ -2857,10 +2954,10 @@ def register_admin_handlers(app, settings: Settings, services: dict):
         raise ApplicationHandlerStop
 
     async def wizard_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
-        if not _is_admin(update):
+        if not await _is_admin_async(update):
             return
         uid = update.effective_user.id
-        st = state.get_state(uid)
+        st = await user_svc.get_step_async(uid)
         if not st or st.get("step") != ADMIN_WIZARD_STEP:
             return
 
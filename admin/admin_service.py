@@ -1,6 +1,8 @@
 from __future__ import annotations
 
-from entity.repositories.admins_repo import AdminsRepo
+import asyncio
+
+from entity.repositories.admins_repo import AdminsRepo, AsyncAdminsRepo
 from entity.repositories.questionnaire_repo import QuestionnaireRepo
 
 
@@ -16,6 +18,7 @@ class AdminService:
         self.settings = settings
 
         self.admins = AdminsRepo(db)
+        self.admins_async = AsyncAdminsRepo(db.aio)
         self.q = QuestionnaireRepo(db)
 
     def _configured_owner_uid(self) -> int | None:
@@ -110,6 +113,17 @@ class AdminService:
 
         return False
 
+    async def is_admin_async(self, user_id: int) -> bool:
+        """Awaitable is_admin: DB fast path, env lazy-seed falls back to a thread."""
+
+        uid = int(user_id)
+        if await self.admins_async.is_admin(uid):
+            return True
+        ids = getattr(self.settings, "admin_tg_ids", []) or []
+        if uid in ids or uid == self._configured_owner_uid():
+            return await asyncio.to_thread(self.is_admin, uid)
+        return False
+
     def is_owner(self, user_id: int) -> bool:
         uid = int(user_id)
         if not self.is_admin(uid):
@@ -6,6 +6,7 @@ from entity.repositories.habits_repo import HabitsRepo
 from entity.repositories.habit_occurrences_repo import HabitOccurrencesRepo
 from entity.repositories.points_repo import PointsRepo
 from entity.repositories.outbox_repo import OutboxRepo
+from entity.repositories.planner_queue_repo import PlannerQueueRepo
 
 
 class HabitService:
@@ -17,6 +18,7 @@ class HabitService:
         self.occ = HabitOccurrencesRepo(db)
         self.points = PointsRepo(db)
         self.outbox = OutboxRepo(db)
+        self.planner_queue = PlannerQueueRepo(db)
 
     # ----------------------------
     # CRUD
@@ -27,7 +29,10 @@ class HabitService:
         frequency = (frequency or "daily").strip()
         if frequency not in ("daily", "weekdays", "weekends"):
             frequency = "daily"
-        return self.habits.create(user_id, title, remind_time, frequency)
+        habit_id = self.habits.create(user_id, title, remind_time, frequency)
+        # Habit-only users also need daily rollover planning.
+        self.planner_queue.enqueue([user_id], "habits")
+        return habit_id
 
     def list_for_user(self, user_id: int):
         return self.habits.list_for_user(user_id)
@@ -38,6 +43,8 @@ class HabitService:
             return False
         new_active = not bool(h.get("is_active"))
         self.habits.set_active(habit_id, user_id, new_active)
+        if new_active:
+            self.planner_queue.enqueue([user_id], "habits")
         return True
 
     def delete(self, user_id: int, habit_id: int) -> bool:
@@ -22,11 +22,7 @@ class MoodService:
         self.users = UsersRepo(db)
 
     def _user_tz(self, user_id: int) -> ZoneInfo:
-        tz_name = self.users.get_timezone(user_id) or self.settings.default_timezone
-        try:
-            return ZoneInfo(tz_name)
-        except Exception:
-            return ZoneInfo(self.settings.default_timezone)
+        return self.users.get_zone(user_id)
 
     def _today_local_date(self, user_id: int):
         tz = self._user_tz(user_id)
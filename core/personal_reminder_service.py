@@ -18,11 +18,7 @@ class PersonalReminderService:
         self.outbox = OutboxRepo(db)
 
     def _user_tz(self, user_id: int) -> ZoneInfo:
-        tz_name = self.users.get_timezone(user_id) or self.settings.default_timezone
-        try:
-            return ZoneInfo(tz_name)
-        except Exception:
-            return ZoneInfo(self.settings.default_timezone)
+        return self.users.get_zone(user_id)
 
     @staticmethod
     def _parse_local_datetime(raw: str) -> datetime:
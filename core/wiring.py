@@ -0,0 +1,77 @@
+"""Service wiring shared by the bot (main.py), the outbox worker and the planner.
+
+Each process builds the same `services` dict, so handlers, delivery and
+planning can run in one process or in separate ones:
+
+    python main.py                  # polling + handlers (+ outbox/planner unless disabled)
+    python -m scheduling.worker     # outbox delivery only
+    python -m scheduling.planner    # planning passes only
+"""
+
+import logging
+
+from entity.db import Database
+from entity.settings import get_settings
+
+from admin.admin_service import AdminService
+from analytics.admin_analytics_service import AdminAnalyticsService
+from analytics.analytics_service import AnalyticsService
+from core.achievement_service import AchievementService
+from core.ai_feedback_service import AiFeedbackService
+from core.daily_pack_service import DailyPackService
+from core.habit_service import HabitService
+from core.mood_service import MoodService
+from core.personal_reminder_service import PersonalReminderService
+from core.support_service import SupportService
+from learning.learning_service import LearningService
+from questionnaires.questionnaire_service import QuestionnaireService
+from scheduling.habit_schedule_service import HabitScheduleService
+from scheduling.personal_reminder_schedule_service import PersonalReminderScheduleService
+from scheduling.planner_service import PlannerService
+from scheduling.schedule_service import ScheduleService
+from user.user_service import UserService
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+
+def build_services(db: Database, settings) -> dict:
+    services = {
+        "user": UserService(db, settings),
+        "learning": LearningService(db, settings),
+        "schedule": ScheduleService(db, settings),
+        "analytics": AnalyticsService(db, settings),
+        "admin_analytics": AdminAnalyticsService(db, settings),
+        "questionnaire": QuestionnaireService(db, settings),
+        "admin": AdminService(db, settings),
+        "ai": AiFeedbackService(),
+        "achievement": AchievementService(db, settings),
+        "habit": HabitService(db, settings),
+        "habit_schedule": HabitScheduleService(db, settings),
+        "personal_reminder": PersonalReminderService(db, settings),
+        "personal_reminder_schedule": PersonalReminderScheduleService(db, settings),
+        "support": SupportService(db, settings),
+        "mood": MoodService(db, settings),
+    }
+
+    # Daily packs (quote/tip/image/film/book) generated by UTC day.
+    services["daily_pack"] = DailyPackService(db, settings, services["ai"], services["schedule"])
+
+    # Incremental planning: only users queued by a change or a local-date rollover.
+    services["planner"] = PlannerService(
+        db,
+        settings,
+        services["schedule"],
+        services["habit_schedule"],
+        services["personal_reminder_schedule"],
+    )
+    return services
+
+
+def bootstrap():
+    """Settings, a migrated Database and the services dict for a process entry point."""
+
+    logging.basicConfig(level=logging.INFO, format=LOG_FORMAT)
+    settings = get_settings()
+    db = Database(settings)
+    db.init_schema()
+    return settings, db, build_services(db, settings)
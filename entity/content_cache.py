@@ -0,0 +1,116 @@
+import logging
+import threading
+import time
+
+log = logging.getLogger("content_cache")
+
+
+def _copy(value):
+    # Rows are plain dicts: hand out copies so callers cannot edit cached ones.
+    if isinstance(value, dict):
+        return dict(value)
+    if isinstance(value, list):
+        return [_copy(v) for v in value]
+    return value
+
+
+class ContentCache:
+    """Read-through cache of course content (lessons, quests, extras, questionnaires).
+
+    Entries are keyed by (name, day_index) and also cache misses, since
+    most days have no extra material. Coherence:
+    - content writes call `invalidate(cur)`: the local entries are dropped
+      and content_version.version is bumped in the writer's transaction;
+    - every process re-reads that version at most every `check_sec` and
+      drops its entries when it moved (other replicas, admin bot);
+    - `ttl_sec` bounds the age of any entry as a safety net; 0 disables caching.
+    """
+
+    def __init__(self, db, ttl_sec: float = 300.0, check_sec: float = 5.0, clock=time.monotonic):
+        self.db = db
+        self.ttl_sec = float(ttl_sec)
+        self.check_sec = float(check_sec)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: dict = {}
+        self._generation = 0
+        self._version: int | None = None
+        self._checked_at: float | None = None
+
+    def get_many(self, keys: list, load) -> dict:
+        """key -> value; `load(missing_keys)` returns key -> value (absent keys cache as None)."""
+
+        if self.ttl_sec <= 0:
+            loaded = load(list(keys))
+            return {k: loaded.get(k) for k in keys}
+
+        self._check_version()
+        now = self._clock()
+        out, missing = {}, []
+        with self._lock:
+            generation = self._generation
+            for k in keys:
+                hit = self._entries.get(k)
+                if hit is not None and hit[0] > now:
+                    out[k] = _copy(hit[1])
+                else:
+                    missing.append(k)
+        if missing:
+            loaded = load(missing)
+            expires_at = self._clock() + self.ttl_sec
+            with self._lock:
+                # Invalidated while loading: serve the rows but do not keep them.
+                keep = generation == self._generation
+                for k in missing:
+                    value = loaded.get(k)
+                    if keep:
+                        self._entries[k] = (expires_at, value)
+                    out[k] = _copy(value)
+        return out
+
+    def by_days(self, name: str, day_indexes, load) -> dict:
+        """day_index -> cached `name` value; `load(missing_days)` returns day_index -> value."""
+
+        keys = [(name, int(d)) for d in day_indexes]
+        got = self.get_many(keys, lambda missing: {(name, d): v for d, v in load([d for _, d in missing]).items()})
+        return {d: v for (_, d), v in got.items()}
+
+    def invalidate(self, cur=None):
+        """Drop cached content and bump the shared version (on `cur`, i.e. in the writer's transaction)."""
+
+        if cur is not None:
+            cur.execute("UPDATE content_version SET version = version + 1, updated_at = NOW() WHERE id = 1")
+        else:
+            with self.db.cursor() as own:
+                own.execute("UPDATE content_version SET version = version + 1, updated_at = NOW() WHERE id = 1")
+        with self._lock:
+            self._clear()
+            # Readers may refill from rows the write has not committed yet:
+            # forgetting the version clears once more at the next check.
+            self._version = None
+
+    def _clear(self):
+        self._entries.clear()
+        self._generation += 1
+
+    def _check_version(self):
+        now = self._clock()
+        with self._lock:
+            if self._checked_at is not None and now - self._checked_at < self.check_sec:
+                return
+            self._checked_at = now
+        try:
+            with self.db.cursor() as cur:
+                cur.execute("SELECT version FROM content_version WHERE id = 1")
+                row = cur.fetchone()
+            version = int(row["version"]) if row else 0
+        except Exception:
+            # Entries still expire by TTL; try again at the next check.
+            log.exception("content version check failed")
+            return
+        with self._lock:
+            if version != self._version:
+                if self._version is not None:
+                    log.info("content version %s -> %s, cache cleared", self._version, version)
+                self._clear()
+                self._version = version
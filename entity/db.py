@@ -1,7 +1,18 @@
-from contextlib import contextmanager
+import asyncio
+import itertools
+import logging
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
 import psycopg
 from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool, ConnectionPool
+from entity.content_cache import ContentCache
 from entity.settings import Settings
+from entity.user_profile_cache import UserProfileCache
+
+log = logging.getLogger("db")
 
 SCHEMA_SQL = r'''
 CREATE TABLE IF NOT EXISTS users (
@@ -382,23 +393,520 @@ MIGRATIONS_SQL = [
     "CREATE INDEX IF NOT EXISTS idx_user_material_messages_lookup ON user_material_messages(user_id, day_index, kind, sent_at DESC)",
 ]
 
+# Version 1 is the baseline: SCHEMA_SQL + the legacy MIGRATIONS_SQL above.
+# New schema changes go to VERSIONED_MIGRATIONS as (version, name, statements):
+# append only, never edit an entry that may already be applied somewhere.
+BASELINE_VERSION = 1
+
+# LISTEN/NOTIFY channel the outbox worker waits on (see migration 4).
+OUTBOX_NOTIFY_CHANNEL = "outbox_jobs"
+VERSIONED_MIGRATIONS: list[tuple[int, str, list[str]]] = [
+    (
+        2,
+        "outbox_job_key_column",
+        [
+            "ALTER TABLE outbox_jobs ADD COLUMN IF NOT EXISTS job_key TEXT",
+            "UPDATE outbox_jobs SET job_key = payload_json->>'job_key' WHERE job_key IS NULL AND payload_json ? 'job_key'",
+            # Older check-then-insert planners could race; keep one live row per key
+            # (a sent one wins over pending) before enforcing uniqueness.
+            """
+            UPDATE outbox_jobs o
+               SET status='cancelled'
+              FROM (
+                    SELECT id,
+                           ROW_NUMBER() OVER (
+                               PARTITION BY user_id, job_key
+                               ORDER BY (status='sent') DESC, id ASC
+                           ) AS rn
+                      FROM outbox_jobs
+                     WHERE job_key IS NOT NULL
+                       AND status IN ('pending','sent')
+                   ) d
+             WHERE o.id = d.id
+               AND d.rn > 1
+            """,
+            """
+            CREATE UNIQUE INDEX IF NOT EXISTS uq_outbox_live_job_key
+                ON outbox_jobs(user_id, job_key)
+             WHERE job_key IS NOT NULL AND status IN ('pending','sent')
+            """,
+        ],
+    ),
+    (
+        3,
+        "outbox_leases",
+        [
+            "ALTER TABLE outbox_jobs ADD COLUMN IF NOT EXISTS lease_owner TEXT",
+            "ALTER TABLE outbox_jobs ADD COLUMN IF NOT EXISTS lease_expires_at TIMESTAMPTZ",
+            "CREATE INDEX IF NOT EXISTS idx_outbox_processing_lease ON outbox_jobs(lease_expires_at) WHERE status='processing'",
+            "CREATE INDEX IF NOT EXISTS idx_outbox_processing_user ON outbox_jobs(user_id) WHERE status='processing'",
+            # A claimed (processing) job is still live for planner dedup.
+            "DROP INDEX IF EXISTS uq_outbox_live_job_key",
+            """
+            CREATE UNIQUE INDEX uq_outbox_live_job_key
+                ON outbox_jobs(user_id, job_key)
+             WHERE job_key IS NOT NULL AND status IN ('pending','processing','sent')
+            """,
+        ],
+    ),
+    (
+        4,
+        "outbox_insert_notify",
+        [
+            # One NOTIFY per inserting statement, and only if it actually
+            # inserted rows (ON CONFLICT DO NOTHING passes are silent).
+            f"""
+            CREATE OR REPLACE FUNCTION notify_outbox_jobs() RETURNS trigger AS $$
+            BEGIN
+                IF EXISTS (SELECT 1 FROM new_rows) THEN
+                    PERFORM pg_notify('{OUTBOX_NOTIFY_CHANNEL}', '');
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+            """,
+            "DROP TRIGGER IF EXISTS trg_outbox_jobs_notify ON outbox_jobs",
+            """
+            CREATE TRIGGER trg_outbox_jobs_notify
+                AFTER INSERT ON outbox_jobs
+                REFERENCING NEW TABLE AS new_rows
+                FOR EACH STATEMENT EXECUTE FUNCTION notify_outbox_jobs()
+            """,
+        ],
+    ),
+    (
+        5,
+        "planner_queue",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS planner_queue (
+              user_id BIGINT PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+              reason TEXT NOT NULL,
+              next_replan_at TIMESTAMPTZ NOT NULL,
+              reschedule BOOLEAN NOT NULL DEFAULT FALSE,
+              updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_planner_queue_next ON planner_queue(next_replan_at)",
+            # Everyone with something to plan starts dirty; horizons take over from there.
+            """
+            INSERT INTO planner_queue(user_id, reason, next_replan_at)
+            SELECT user_id, 'initial', NOW() FROM enrollments WHERE is_active=TRUE
+            UNION
+            SELECT user_id, 'initial', NOW() FROM habits WHERE is_active=TRUE
+            UNION
+            SELECT user_id, 'initial', NOW() FROM personal_reminders WHERE is_active=TRUE
+            ON CONFLICT (user_id) DO NOTHING
+            """,
+        ],
+    ),
+    (
+        6,
+        "backlog_lookup_indexes",
+        [
+            # Anti-joins of the set-based backlog query (BacklogRepo).
+            "CREATE INDEX IF NOT EXISTS idx_points_ledger_user_source ON points_ledger(user_id, source_type, source_key)",
+            "CREATE INDEX IF NOT EXISTS idx_quest_answers_user_day ON quest_answers(user_id, day_index)",
+            "CREATE INDEX IF NOT EXISTS idx_questionnaire_responses_user_q ON questionnaire_responses(user_id, questionnaire_id)",
+        ],
+    ),
+    (
+        7,
+        "user_open_items",
+        [
+            # Starts empty: the planner opens days as it reaches them
+            # (OpenItemsRepo.open_through), which backfills existing users.
+            """
+            CREATE TABLE IF NOT EXISTS user_open_items (
+              user_id BIGINT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+              day_index INT NOT NULL,
+              kind TEXT NOT NULL, -- lesson | quest | questionnaire
+              item_id INT NOT NULL DEFAULT 0, -- questionnaire id; 0 for lesson/quest
+              PRIMARY KEY (user_id, day_index, kind, item_id)
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS user_open_items_state (
+              user_id BIGINT PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+              opened_through_day INT NOT NULL DEFAULT 0,
+              updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            )
+            """,
+        ],
+    ),
+    (
+        8,
+        "content_version",
+        [
+            # Bumped by every course content write; processes poll it to
+            # drop their ContentCache entries.
+            """
+            CREATE TABLE IF NOT EXISTS content_version (
+              id SMALLINT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+              version BIGINT NOT NULL DEFAULT 0,
+              updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            )
+            """,
+            "INSERT INTO content_version(id, version) VALUES (1, 0) ON CONFLICT (id) DO NOTHING",
+        ],
+    ),
+    (
+        9,
+        "content_snapshots",
+        [
+            # Lesson/quest/extra bodies referenced by outbox payloads
+            # (snapshot_id) instead of being copied into every job.
+            """
+            CREATE TABLE IF NOT EXISTS content_snapshots (
+              id BIGSERIAL PRIMARY KEY,
+              kind TEXT NOT NULL,
+              content_hash TEXT NOT NULL UNIQUE,
+              body JSONB NOT NULL,
+              created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            )
+            """,
+        ],
+    ),
+    (
+        10,
+        "habits_planned_until",
+        [
+            # Last reminder slot HabitScheduleService has planned; later
+            # passes only plan past it. NULL: plan the whole horizon.
+            "ALTER TABLE habits ADD COLUMN IF NOT EXISTS planned_until TIMESTAMPTZ",
+        ],
+    ),
+    (
+        11,
+        "personal_reminders_due_window",
+        [
+            # PersonalReminderScheduleService only reads active reminders
+            # starting within its look-ahead window; fired ones are deactivated.
+            "CREATE INDEX IF NOT EXISTS idx_personal_reminders_active_start ON personal_reminders(start_at) WHERE is_active",
+            # One-time reminders whose moment has passed were never planned
+            # again; drop them out of the active set. Those with a job still
+            # pending or in flight (retries) are left to the worker's bookkeeping.
+            """
+            UPDATE personal_reminders r
+               SET is_active=FALSE, updated_at=NOW()
+             WHERE r.is_active AND r.start_at < NOW()
+               AND NOT EXISTS (
+                   SELECT 1 FROM outbox_jobs o
+                    WHERE o.user_id = r.user_id
+                      AND o.status IN ('pending','processing')
+                      AND o.payload_json->>'kind' = 'personal_reminder'
+                      AND (o.payload_json->>'reminder_id')::int = r.id
+               )
+            """,
+        ],
+    ),
+    (
+        12,
+        "outbox_lanes",
+        [
+            # Priority lane of a job (0 interactive, 1 reminders, 2 day
+            # content, 3 admin broadcasts), set by the writers (see
+            # outbox_repo.job_lane). A plain nullable column: no table
+            # rewrite. NULL means the content lane until the worker has
+            # backfilled older pending rows (AsyncOutboxRepo.backfill_lanes).
+            "ALTER TABLE outbox_jobs ADD COLUMN IF NOT EXISTS lane SMALLINT",
+            "CREATE INDEX IF NOT EXISTS idx_outbox_pending_lane_run ON outbox_jobs((COALESCE(lane, 2)), run_at, id) WHERE status='pending'",
+        ],
+    ),
+    (
+        13,
+        "users_unreachable",
+        [
+            # Set when Telegram answers Forbidden (bot blocked, account
+            # deleted): planning and delivery skip the user until their next
+            # update clears it. See UsersRepo.mark_reachable.
+            "ALTER TABLE users ADD COLUMN IF NOT EXISTS unreachable_at TIMESTAMPTZ",
+        ],
+    ),
+]
+
+SCHEMA_MIGRATIONS_SQL = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+  version INT PRIMARY KEY,
+  name TEXT NOT NULL,
+  applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  duration_ms INT NOT NULL DEFAULT 0
+)
+"""
+
+# pg_advisory_lock key: serializes migration runs across bot replicas.
+MIGRATIONS_LOCK_KEY = 7_301_226_505
+
+
+def _apply_baseline(conn):
+    conn.execute(SCHEMA_SQL)
+    for stmt in MIGRATIONS_SQL:
+        try:
+            # Savepoint per legacy statement: one failure must not abort the rest.
+            with conn.transaction():
+                conn.execute(stmt)
+        except Exception as e:
+            log.debug("baseline statement skipped: %s", e)
+
+
+def run_migrations(conn, migrations: list[tuple[int, str, list[str]]] | None = None) -> list[int]:
+    """Apply pending migrations on an autocommit connection; return applied versions.
+
+    Each migration runs in its own transaction together with its
+    schema_migrations row, under a session advisory lock.
+    """
+
+    pending_source = VERSIONED_MIGRATIONS if migrations is None else migrations
+    conn.execute("SELECT pg_advisory_lock(%s)", (MIGRATIONS_LOCK_KEY,))
+    try:
+        conn.execute(SCHEMA_MIGRATIONS_SQL)
+        rows = conn.execute("SELECT version FROM schema_migrations").fetchall()
+        done = {int(r["version"]) for r in rows}
+
+        steps = [(BASELINE_VERSION, "baseline", None)]
+        steps += sorted(pending_source, key=lambda m: m[0])
+        applied = []
+        for version, name, statements in steps:
+            if version in done:
+                continue
+            started = time.monotonic()
+            with conn.transaction():
+                if statements is None:
+                    _apply_baseline(conn)
+                else:
+                    for stmt in statements:
+                        conn.execute(stmt)
+                duration_ms = int((time.monotonic() - started) * 1000)
+                conn.execute(
+                    "INSERT INTO schema_migrations(version, name, duration_ms) VALUES (%s, %s, %s)",
+                    (version, name, duration_ms),
+                )
+            log.info("migration applied version=%s name=%s duration_ms=%s", version, name, duration_ms)
+            applied.append(version)
+        return applied
+    finally:
+        conn.execute("SELECT pg_advisory_unlock(%s)", (MIGRATIONS_LOCK_KEY,))
+
+def _conn_kwargs(settings: Settings) -> dict:
+    return {
+        "host": settings.db_host,
+        "port": settings.db_port,
+        "dbname": settings.db_name,
+        "user": settings.db_user,
+        "password": settings.db_password,
+    }
+
+
+def _pool_options(settings: Settings) -> dict:
+    min_size = max(0, int(getattr(settings, "db_pool_min_size", 1)))
+    max_size = max(1, min_size, int(getattr(settings, "db_pool_max_size", 10)))
+    return {
+        "kwargs": {**_conn_kwargs(settings), "row_factory": dict_row},
+        "min_size": min_size,
+        "max_size": max_size,
+        "max_idle": float(getattr(settings, "db_pool_max_idle_sec", 300)),
+        "timeout": float(getattr(settings, "db_pool_timeout_sec", 30)),
+    }
+
+
+_savepoint_ids = itertools.count(1)
+
+
+class _CheckoutStats:
+    """Thread-safe pool checkout latency counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._checkouts = 0
+        self._ms_total = 0.0
+        self._ms_max = 0.0
+
+    def note(self, elapsed_ms: float):
+        with self._lock:
+            self._checkouts += 1
+            self._ms_total += elapsed_ms
+            if elapsed_ms > self._ms_max:
+                self._ms_max = elapsed_ms
+
+    def snapshot(self, pool_stats: dict, reset: bool = False) -> dict:
+        size = int(pool_stats.get("pool_size") or 0)
+        available = int(pool_stats.get("pool_available") or 0)
+        with self._lock:
+            checkouts = self._checkouts
+            avg_ms = (self._ms_total / checkouts) if checkouts else 0.0
+            max_ms = self._ms_max
+            if reset:
+                self._checkouts = 0
+                self._ms_total = 0.0
+                self._ms_max = 0.0
+        return {
+            "size": size,
+            "in_use": max(0, size - available),
+            "available": available,
+            "waiting": int(pool_stats.get("requests_waiting") or 0),
+            "checkouts": checkouts,
+            "checkout_avg_ms": round(avg_ms, 2),
+            "checkout_max_ms": round(max_ms, 2),
+            "errors": int(pool_stats.get("requests_errors") or 0) + int(pool_stats.get("connections_errors") or 0),
+        }
+
+
+def _log_stats(name: str, s: dict):
+    log.info(
+        "db pool=%s size=%s in_use=%s available=%s waiting=%s checkouts=%s checkout_avg_ms=%s checkout_max_ms=%s errors=%s",
+        name,
+        s["size"],
+        s["in_use"],
+        s["available"],
+        s["waiting"],
+        s["checkouts"],
+        s["checkout_avg_ms"],
+        s["checkout_max_ms"],
+        s["errors"],
+    )
+
+
 class Database:
+    """Postgres access point shared by all repositories.
+
+    Connections are borrowed from a bounded pool (see DB_POOL_* settings),
+    so repeated `cursor()` calls reuse warm connections instead of paying
+    TCP + auth for each repository call.
+
+    `transaction()` opens a unit of work: every repository call made inside
+    the block (in the same thread / task context) joins one connection and
+    one commit.
+    """
+
     def __init__(self, settings: Settings):
         self.settings = settings
+        self._pool: ConnectionPool | None = None
+        self._pool_lock = threading.Lock()
+        self._stats = _CheckoutStats()
+        self._aio: AsyncDatabase | None = None
+        self._content_cache: ContentCache | None = None
+        self._user_profiles: UserProfileCache | None = None
+        self._tx_conn: ContextVar = ContextVar(f"db_tx_{id(self)}", default=None)
+
+    @property
+    def aio(self) -> "AsyncDatabase":
+        """Async counterpart sharing the same settings and user profile cache (its pool opens on first use)."""
+
+        if self._aio is None:
+            user_profiles = self.user_profiles  # takes _pool_lock itself
+            with self._pool_lock:
+                if self._aio is None:
+                    self._aio = AsyncDatabase(self.settings, user_profiles=user_profiles)
+        return self._aio
+
+    @property
+    def content_cache(self) -> ContentCache:
+        """Course content cache shared by the content repositories of this process."""
+
+        if self._content_cache is None:
+            with self._pool_lock:
+                if self._content_cache is None:
+                    self._content_cache = ContentCache(
+                        self,
+                        ttl_sec=self.settings.content_cache_ttl_sec,
+                        check_sec=self.settings.content_cache_check_sec,
+                    )
+        return self._content_cache
+
+    @property
+    def user_profiles(self) -> UserProfileCache:
+        """User profile cache of this process, shared with the async repositories."""
+
+        if self._user_profiles is None:
+            with self._pool_lock:
+                if self._user_profiles is None:
+                    self._user_profiles = UserProfileCache(
+                        max_size=self.settings.user_cache_size,
+                        ttl_sec=self.settings.user_cache_ttl_sec,
+                    )
+        return self._user_profiles
 
     def connect(self):
-        return psycopg.connect(
-            host=self.settings.db_host,
-            port=self.settings.db_port,
-            dbname=self.settings.db_name,
-            user=self.settings.db_user,
-            password=self.settings.db_password,
-            row_factory=dict_row,
-        )
+        """Open a dedicated (non-pooled) connection."""
+
+        return psycopg.connect(**_conn_kwargs(self.settings), row_factory=dict_row)
+
+    def pool(self) -> ConnectionPool:
+        if self._pool is not None:
+            return self._pool
+        with self._pool_lock:
+            if self._pool is None:
+                opts = _pool_options(self.settings)
+                self._pool = ConnectionPool(
+                    **opts,
+                    # Health check on checkout: broken connections are replaced transparently.
+                    check=ConnectionPool.check_connection,
+                    name="main",
+                    open=True,
+                )
+                log.info("db pool opened min_size=%s max_size=%s", opts["min_size"], opts["max_size"])
+        return self._pool
+
+    def close(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.close()
+                self._pool = None
+
+    def pool_stats(self, reset: bool = False) -> dict:
+        """Pool usage snapshot: size, in-use, waiting and checkout latency.
+
+        With reset=True the checkout latency counters start over, so periodic
+        log lines show per-interval values.
+        """
+
+        pool_stats = self._pool.get_stats() if self._pool is not None else {}
+        return self._stats.snapshot(pool_stats, reset=reset)
+
+    def log_pool_stats(self):
+        _log_stats("main", self.pool_stats(reset=True))
+        if self._aio is not None and self._aio.is_open():
+            _log_stats("async", self._aio.pool_stats(reset=True))
+
+    @contextmanager
+    def transaction(self):
+        """Unit of work: repositories used inside the block share one connection and commit.
+
+        Nested blocks become savepoints, so a failing inner block can be caught
+        without aborting the outer unit of work.
+        """
+
+        conn = self._tx_conn.get()
+        if conn is not None:
+            name = f"sp_{next(_savepoint_ids)}"
+            conn.execute(f"SAVEPOINT {name}")
+            try:
+                yield conn
+            except Exception:
+                conn.execute(f"ROLLBACK TO SAVEPOINT {name}")
+                raise
+            conn.execute(f"RELEASE SAVEPOINT {name}")
+            return
+
+        with self.session() as conn:
+            token = self._tx_conn.set(conn)
+            try:
+                yield conn
+            finally:
+                self._tx_conn.reset(token)
 
     @contextmanager
     def session(self):
-        conn = self.connect()
+        conn = self._tx_conn.get()
+        if conn is not None:
+            # Join the surrounding unit of work; it commits or rolls back.
+            yield conn
+            return
+
+        pool = self.pool()
+        started = time.monotonic()
+        conn = pool.getconn()
+        self._stats.note((time.monotonic() - started) * 1000.0)
         try:
             yield conn
             conn.commit()
@@ -406,7 +914,7 @@ class Database:
             conn.rollback()
             raise
         finally:
-            conn.close()
+            pool.putconn(conn)
 
     @contextmanager
     def cursor(self):
@@ -417,13 +925,145 @@ class Database:
             finally:
                 cur.close()
 
+    @contextmanager
+    def autonomous_cursor(self):
+        """cursor() on its own connection and commit, even inside a unit of work.
+
+        For writes that must survive the caller's rollback (e.g. rows that
+        in-process caches already point to).
+        """
+
+        token = self._tx_conn.set(None)
+        try:
+            with self.cursor() as cur:
+                yield cur
+        finally:
+            self._tx_conn.reset(token)
+
     def init_schema(self):
-        with self.session() as conn:
+        """Apply pending versioned migrations (see VERSIONED_MIGRATIONS)."""
+
+        started = time.monotonic()
+        # Dedicated connection: the advisory lock is session-scoped.
+        conn = self.connect()
+        try:
+            conn.autocommit = True
+            applied = run_migrations(conn)
+        finally:
+            conn.close()
+        log.info(
+            "schema ready applied=%s duration_ms=%s",
+            applied,
+            int((time.monotonic() - started) * 1000),
+        )
+
+
+class AsyncDatabase:
+    """Async (psycopg AsyncConnection) counterpart of Database.
+
+    Used by the async repositories so Telegram handlers and the worker can
+    await queries instead of blocking the event loop.
+    """
+
+    def __init__(self, settings: Settings, user_profiles: UserProfileCache | None = None):
+        self.settings = settings
+        self._pool: AsyncConnectionPool | None = None
+        self._pool_lock: asyncio.Lock | None = None
+        self._stats = _CheckoutStats()
+        self._tx_conn: ContextVar = ContextVar(f"adb_tx_{id(self)}", default=None)
+        self.user_profiles = user_profiles or UserProfileCache(
+            max_size=settings.user_cache_size,
+            ttl_sec=settings.user_cache_ttl_sec,
+        )
+
+    def is_open(self) -> bool:
+        return self._pool is not None
+
+    async def connect(self) -> psycopg.AsyncConnection:
+        """Open a dedicated (non-pooled) autocommit connection, e.g. for LISTEN."""
+
+        return await psycopg.AsyncConnection.connect(
+            **_conn_kwargs(self.settings),
+            row_factory=dict_row,
+            autocommit=True,
+        )
+
+    async def pool(self) -> AsyncConnectionPool:
+        if self._pool is not None:
+            return self._pool
+        if self._pool_lock is None:
+            self._pool_lock = asyncio.Lock()
+        async with self._pool_lock:
+            if self._pool is None:
+                opts = _pool_options(self.settings)
+                pool = AsyncConnectionPool(
+                    **opts,
+                    check=AsyncConnectionPool.check_connection,
+                    name="async",
+                    open=False,
+                )
+                await pool.open()
+                self._pool = pool
+                log.info("async db pool opened min_size=%s max_size=%s", opts["min_size"], opts["max_size"])
+        return self._pool
+
+    async def close(self):
+        if self._pool is not None:
+            pool, self._pool = self._pool, None
+            await pool.close()
+
+    def pool_stats(self, reset: bool = False) -> dict:
+        pool_stats = self._pool.get_stats() if self._pool is not None else {}
+        return self._stats.snapshot(pool_stats, reset=reset)
+
+    @asynccontextmanager
+    async def transaction(self):
+        """Async unit of work, same semantics as Database.transaction()."""
+
+        conn = self._tx_conn.get()
+        if conn is not None:
+            name = f"sp_{next(_savepoint_ids)}"
+            await conn.execute(f"SAVEPOINT {name}")
+            try:
+                yield conn
+            except Exception:
+                await conn.execute(f"ROLLBACK TO SAVEPOINT {name}")
+                raise
+            await conn.execute(f"RELEASE SAVEPOINT {name}")
+            return
+
+        async with self.session() as conn:
+            token = self._tx_conn.set(conn)
+            try:
+                yield conn
+            finally:
+                self._tx_conn.reset(token)
+
+    @asynccontextmanager
+    async def session(self):
+        conn = self._tx_conn.get()
+        if conn is not None:
+            yield conn
+            return
+
+        pool = await self.pool()
+        started = time.monotonic()
+        conn = await pool.getconn()
+        self._stats.note((time.monotonic() - started) * 1000.0)
+        try:
+            yield conn
+            await conn.commit()
+        except Exception:
+            await conn.rollback()
+            raise
+        finally:
+            await pool.putconn(conn)
+
+    @asynccontextmanager
+    async def cursor(self):
+        async with self.session() as conn:
             cur = conn.cursor()
-            cur.execute(SCHEMA_SQL)
-            for stmt in MIGRATIONS_SQL:
-                try:
-                    cur.execute(stmt)
-                except Exception:
-                    pass
-            cur.close()
+            try:
+                yield cur
+            finally:
+                await cur.close()
@@ -1,4 +1,4 @@
-from entity.db import Database
+from entity.db import AsyncDatabase, Database
 
 
 class AdminsRepo:
@@ -59,3 +59,13 @@ class AdminsRepo:
             cur.execute("SELECT user_id FROM admins ORDER BY created_at DESC")
             rows = cur.fetchall() or []
             return [int(r["user_id"]) for r in rows]
+
+
+class AsyncAdminsRepo:
+    def __init__(self, db: AsyncDatabase):
+        self.db = db
+
+    async def is_admin(self, user_id: int) -> bool:
+        async with self.db.cursor() as cur:
+            await cur.execute("SELECT 1 FROM admins WHERE user_id=%s", (user_id,))
+            return (await cur.fetchone()) is not None
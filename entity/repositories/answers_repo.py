@@ -1,4 +1,4 @@
-from entity.db import Database
+from entity.db import AsyncDatabase, Database
 
 class AnswersRepo:
     def __init__(self, db: Database):
@@ -18,3 +18,23 @@ class AnswersRepo:
                 (user_id, day_index),
             )
             return cur.fetchone() is not None
+
+
+class AsyncAnswersRepo:
+    def __init__(self, db: AsyncDatabase):
+        self.db = db
+
+    async def save(self, user_id: int, day_index: int, answer_text: str):
+        async with self.db.cursor() as cur:
+            await cur.execute(
+                "INSERT INTO quest_answers(user_id, day_index, answer_text) VALUES (%s,%s,%s)",
+                (user_id, day_index, answer_text),
+            )
+
+    async def exists_for_day(self, user_id: int, day_index: int) -> bool:
+        async with self.db.cursor() as cur:
+            await cur.execute(
+                "SELECT 1 FROM quest_answers WHERE user_id=%s AND day_index=%s LIMIT 1",
+                (user_id, day_index),
+            )
+            return (await cur.fetchone()) is not None
@@ -0,0 +1,111 @@
+from entity.db import AsyncDatabase, Database
+
+# Unfinished course items over a `days(user_id, day_index)` CTE supplied by
+# the caller: lessons without a lesson_viewed points entry, quests without an
+# answer and unanswered manual/daily questionnaires (legacy daily
+# questionnaires without day_index count for every day). item_id is the
+# questionnaire id, 0 for lessons/quests (one per day).
+UNFINISHED_IN_DAYS_SQL = """
+SELECT days.user_id, days.day_index, 'lesson' AS kind, 0 AS item_id
+  FROM days
+  JOIN lessons l ON l.day_index = days.day_index
+ WHERE NOT EXISTS (
+       SELECT 1 FROM points_ledger p
+        WHERE p.user_id = days.user_id
+          AND p.source_type = 'lesson_viewed'
+          AND p.source_key = 'day:' || days.day_index
+ )
+UNION ALL
+SELECT days.user_id, days.day_index, 'quest', 0
+  FROM days
+  JOIN quests q ON q.day_index = days.day_index
+ WHERE NOT EXISTS (
+       SELECT 1 FROM quest_answers a
+        WHERE a.user_id = days.user_id AND a.day_index = days.day_index
+ )
+UNION ALL
+SELECT days.user_id, days.day_index, 'questionnaire', qn.id
+  FROM days
+  JOIN questionnaires qn
+    ON (qn.day_index = days.day_index AND qn.qtype IN ('manual', 'daily'))
+    OR (qn.day_index IS NULL AND qn.qtype = 'daily')
+ WHERE NOT EXISTS (
+       SELECT 1 FROM questionnaire_responses r
+        WHERE r.user_id = days.user_id AND r.questionnaire_id = qn.id
+ )
+"""
+
+# Backlog of days 1..upto for each user (largest upto given for that user),
+# one row per day and kind: for questionnaires the first unanswered one.
+# Rows come ordered by user, day and kind ('lesson' < 'quest' < 'questionnaire').
+BACKLOG_SQL = f"""
+WITH req AS (
+    SELECT user_id, MAX(upto) AS upto
+      FROM unnest(%s::bigint[], %s::int[]) AS r(user_id, upto)
+     GROUP BY user_id
+),
+days AS (
+    SELECT req.user_id, d.day_index
+      FROM req, generate_series(1, GREATEST(req.upto, 1)) AS d(day_index)
+),
+items AS ({UNFINISHED_IN_DAYS_SQL})
+SELECT user_id, day_index, kind, MIN(item_id) AS item_id
+  FROM items
+ GROUP BY user_id, day_index, kind
+ ORDER BY 1, 2, 3
+"""
+
+
+def _params(items: list[tuple[int, int]]):
+    return ([int(u) for u, _ in items], [int(d) for _, d in items])
+
+
+def _group(rows) -> dict[int, list[dict]]:
+    out: dict[int, list[dict]] = {}
+    for r in rows:
+        out.setdefault(int(r["user_id"]), []).append(
+            {
+                "day_index": int(r["day_index"]),
+                "kind": r["kind"],
+                "questionnaire_id": int(r["item_id"]) if r["kind"] == "questionnaire" else None,
+            }
+        )
+    return out
+
+
+class BacklogRepo:
+    """Unfinished lessons/quests/questionnaires, evaluated set-based."""
+
+    def __init__(self, db: Database):
+        self.db = db
+
+    def unfinished_bulk(self, items: list[tuple[int, int]]) -> dict[int, list[dict]]:
+        """(user_id, up_to_day_index) pairs -> user_id -> unfinished items, ordered by day.
+
+        A user listed with several days gets items up to the largest one;
+        filter by day_index for the smaller ones. Users with no backlog are absent.
+        """
+
+        if not items:
+            return {}
+        with self.db.cursor() as cur:
+            cur.execute(BACKLOG_SQL, _params(items))
+            return _group(cur.fetchall())
+
+    def unfinished(self, user_id: int, day_index: int) -> list[dict]:
+        return self.unfinished_bulk([(user_id, day_index)]).get(int(user_id), [])
+
+
+class AsyncBacklogRepo:
+    def __init__(self, db: AsyncDatabase):
+        self.db = db
+
+    async def unfinished_bulk(self, items: list[tuple[int, int]]) -> dict[int, list[dict]]:
+        if not items:
+            return {}
+        async with self.db.cursor() as cur:
+            await cur.execute(BACKLOG_SQL, _params(items))
+            return _group(await cur.fetchall())
+
+    async def unfinished(self, user_id: int, day_index: int) -> list[dict]:
+        return (await self.unfinished_bulk([(user_id, day_index)])).get(int(user_id), [])
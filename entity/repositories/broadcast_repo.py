@@ -0,0 +1,101 @@
+from entity.db import Database
+from entity.repositories.outbox_repo import LANE_BROADCAST
+
+# One batch of a questionnaire broadcast, planned in the database: reachable
+# users after `after_id` (None: from the start) in id order, run_at = today's
+# HH:MM in each user's stored timezone (unknown/invalid zones fall back to
+# the default), or in 5 seconds if that moment has already passed locally.
+# The job_key matches the one ScheduleService used to build per user, so
+# re-running a broadcast is a no-op.
+QUESTIONNAIRE_BROADCAST_BATCH_SQL = """
+WITH batch AS (
+    SELECT u.id AS user_id, COALESCE(z.name, %(default_tz)s) AS tz
+      FROM users u
+      LEFT JOIN pg_timezone_names z ON z.name = u.timezone
+     WHERE u.unreachable_at IS NULL
+       AND (%(after_id)s::bigint IS NULL OR u.id > %(after_id)s::bigint)
+     ORDER BY u.id
+     LIMIT %(limit)s
+),
+slots AS (
+    SELECT user_id, tz,
+           NOW() AT TIME ZONE tz AS now_local,
+           (NOW() AT TIME ZONE tz)::date + %(hhmm)s::time AS target_local
+      FROM batch
+),
+runs AS (
+    SELECT user_id,
+           CASE WHEN target_local < now_local THEN NOW() + INTERVAL '5 seconds'
+                ELSE target_local AT TIME ZONE tz END AS run_at,
+           'qcast:' || %(questionnaire_id)s::text || ':'
+             || to_char(CASE WHEN target_local < now_local THEN now_local + INTERVAL '5 seconds'
+                             ELSE target_local END, 'YYYY-MM-DD')
+             || ':' || %(hhmm)s AS job_key
+      FROM slots
+),
+ins AS (
+    INSERT INTO outbox_jobs(user_id, run_at, payload_json, job_key, status, lane)
+    SELECT user_id, run_at,
+           jsonb_build_object(
+               'kind', 'questionnaire_broadcast',
+               'job_key', job_key,
+               'questionnaire_id', %(questionnaire_id)s::int,
+               'optional', %(optional)s::boolean
+           ),
+           job_key, 'pending', %(lane)s::smallint
+      FROM runs
+    ON CONFLICT (user_id, job_key) WHERE job_key IS NOT NULL AND status IN ('pending','processing','sent')
+    DO NOTHING
+    RETURNING 1
+)
+SELECT (SELECT COUNT(*) FROM batch) AS scanned,
+       (SELECT MAX(user_id) FROM batch) AS last_id,
+       (SELECT COUNT(*) FROM ins) AS created
+"""
+
+
+class BroadcastRepo:
+    """Set-based fan-out of admin broadcasts into outbox_jobs."""
+
+    def __init__(self, db: Database):
+        self.db = db
+
+    def count_recipients(self) -> int:
+        with self.db.cursor() as cur:
+            cur.execute("SELECT COUNT(*) AS n FROM users WHERE unreachable_at IS NULL")
+            return int(cur.fetchone()["n"])
+
+    def questionnaire_batch(
+        self,
+        questionnaire_id: int,
+        hhmm: str,
+        optional: bool,
+        default_tz: str,
+        after_id: int | None = None,
+        limit: int = 5000,
+    ) -> dict:
+        """Plan the next batch of recipients; returns {scanned, last_id, created}.
+
+        Each batch commits on its own, so a long broadcast never holds one
+        big transaction and can be resumed from `last_id`.
+        """
+
+        with self.db.cursor() as cur:
+            cur.execute(
+                QUESTIONNAIRE_BROADCAST_BATCH_SQL,
+                {
+                    "questionnaire_id": int(questionnaire_id),
+                    "hhmm": hhmm,
+                    "optional": bool(optional),
+                    "default_tz": default_tz,
+                    "after_id": after_id,
+                    "limit": int(limit),
+                    "lane": LANE_BROADCAST,
+                },
+            )
+            row = cur.fetchone()
+            return {
+                "scanned": int(row["scanned"] or 0),
+                "last_id": int(row["last_id"]) if row["last_id"] is not None else None,
+                "created": int(row["created"] or 0),
+            }
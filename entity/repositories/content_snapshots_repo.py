@@ -0,0 +1,77 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from entity.db import AsyncDatabase, Database
+
+# Lesson/quest/extra bodies shared by many outbox jobs. A snapshot is
+# addressed by the hash of its kind + body and never changes, so jobs carry
+# only its id and both the id and the body can be cached without expiry.
+
+
+def snapshot_hash(kind: str, body: dict) -> str:
+    canonical = json.dumps({"kind": kind, "body": body}, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ContentSnapshotsRepo:
+    def __init__(self, db: Database, cache_size: int = 1024):
+        self.db = db
+        self.cache_size = cache_size
+        self._ids: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def ensure(self, kind: str, body: dict) -> int:
+        """Id of the snapshot holding `body`, stored on first use."""
+
+        h = snapshot_hash(kind, body)
+        with self._lock:
+            snapshot_id = self._ids.get(h)
+            if snapshot_id is not None:
+                self._ids.move_to_end(h)
+                return snapshot_id
+        # Committed on its own: the id is cached, so it must not vanish
+        # with a rolled back planning transaction.
+        with self.db.autonomous_cursor() as cur:
+            cur.execute(
+                """
+                INSERT INTO content_snapshots(kind, content_hash, body)
+                VALUES (%s, %s, %s::jsonb)
+                ON CONFLICT (content_hash) DO UPDATE SET kind = EXCLUDED.kind
+                RETURNING id
+                """,
+                (kind, h, json.dumps(body, ensure_ascii=False, default=str)),
+            )
+            snapshot_id = int(cur.fetchone()["id"])
+        with self._lock:
+            self._ids[h] = snapshot_id
+            while len(self._ids) > self.cache_size:
+                self._ids.popitem(last=False)
+        return snapshot_id
+
+
+class AsyncContentSnapshotsRepo:
+    def __init__(self, db: AsyncDatabase, cache_size: int = 1024):
+        self.db = db
+        self.cache_size = cache_size
+        self._bodies: OrderedDict = OrderedDict()
+
+    async def get(self, snapshot_id: int) -> dict | None:
+        snapshot_id = int(snapshot_id)
+        body = self._bodies.get(snapshot_id)
+        if body is not None:
+            self._bodies.move_to_end(snapshot_id)
+            return dict(body)
+        async with self.db.cursor() as cur:
+            await cur.execute("SELECT body FROM content_snapshots WHERE id=%s", (snapshot_id,))
+            row = await cur.fetchone()
+        if not row:
+            return None
+        body = row["body"]
+        if isinstance(body, str):
+            body = json.loads(body)
+        self._bodies[snapshot_id] = body
+        while len(self._bodies) > self.cache_size:
+            self._bodies.popitem(last=False)
+        return dict(body)
@@ -1,4 +1,5 @@
 from entity.db import Database
+from entity.repositories.users_repo import UsersRepo
 
 class EnrollmentRepo:
     def __init__(self, db: Database):
@@ -16,13 +17,37 @@ class EnrollmentRepo:
                 ''',
                 (user_id, delivery_time),
             )
+        self.db.user_profiles.invalidate(user_id)
 
     def get(self, user_id: int):
-        with self.db.cursor() as cur:
-            cur.execute("SELECT * FROM enrollments WHERE user_id=%s AND is_active=TRUE", (user_id,))
-            return cur.fetchone()
+        """The active enrollment, served from the user profile cache."""
+
+        profile = UsersRepo(self.db).get_profile(user_id)
+        return profile["enrollment"] if profile else None
 
     def list_active(self):
         with self.db.cursor() as cur:
             cur.execute("SELECT * FROM enrollments WHERE is_active=TRUE")
             return cur.fetchall()
+
+    def list_active_with_timezone(self, user_ids: list[int] | None = None):
+        """Active enrollments plus users.timezone, for set-based planning.
+
+        `user_ids` narrows the result to those users (incremental planning).
+        Unreachable users (bot blocked) are left out.
+        """
+
+        ids = None if user_ids is None else list(user_ids)
+        with self.db.cursor() as cur:
+            cur.execute(
+                """
+                SELECT e.*, u.timezone
+                  FROM enrollments e
+                  JOIN users u ON u.id = e.user_id
+                 WHERE e.is_active=TRUE
+                   AND u.unreachable_at IS NULL
+                   AND (%s::bigint[] IS NULL OR e.user_id = ANY(%s::bigint[]))
+                """,
+                (ids, ids),
+            )
+            return cur.fetchall()
@@ -5,6 +5,10 @@ class ExtraMaterialRepo:
     def __init__(self, db: Database):
         self.db = db
 
+    @property
+    def cache(self):
+        return self.db.content_cache
+
     def upsert(
         self,
         day_index: int,
@@ -30,12 +34,20 @@ class ExtraMaterialRepo:
                 """,
                 (day_index, content_text, points, link_url, photo_file_id, bool(is_active)),
             )
-            return int(cur.fetchone()["id"])
+            extra_id = int(cur.fetchone()["id"])
+            self.cache.invalidate(cur)
+            return extra_id
 
-    def get_by_day(self, day_index: int):
+    def _load_by_days(self, day_indexes: list[int]) -> dict:
         with self.db.cursor() as cur:
-            cur.execute("SELECT * FROM extra_materials WHERE day_index=%s", (day_index,))
-            return cur.fetchone()
+            cur.execute("SELECT * FROM extra_materials WHERE day_index = ANY(%s)", (list(day_indexes),))
+            return {int(r["day_index"]): r for r in cur.fetchall()}
+
+    def get_by_day(self, day_index: int):
+        return self.cache.by_days("extra", [day_index], self._load_by_days).get(int(day_index))
+
+    def list_by_days(self, day_indexes: list[int]):
+        return [r for r in self.cache.by_days("extra", day_indexes, self._load_by_days).values() if r]
 
     def list_latest(self, limit: int = 200):
         with self.db.cursor() as cur:
@@ -45,4 +57,7 @@ class ExtraMaterialRepo:
     def delete_day(self, day_index: int) -> bool:
         with self.db.cursor() as cur:
             cur.execute("DELETE FROM extra_materials WHERE day_index=%s", (day_index,))
-            return cur.rowcount > 0
+            deleted = cur.rowcount > 0
+            if deleted:
+                self.cache.invalidate(cur)
+            return deleted
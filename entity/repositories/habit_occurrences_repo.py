@@ -26,6 +26,31 @@ class HabitOccurrencesRepo:
             row = cur.fetchone()
             return int(row["id"]) if row else None
 
+    def insert_planned_bulk(self, rows: list[tuple[int, int, str]]) -> dict[tuple[int, datetime], int]:
+        """Insert (habit_id, user_id, scheduled_at_iso) occurrences in one statement.
+
+        Returns (habit_id, scheduled_at) -> id for rows that are new, or were
+        cancelled and are planned again; existing live occurrences are left
+        untouched (they already have their job).
+        """
+
+        if not rows:
+            return {}
+        with self.db.cursor() as cur:
+            cur.execute(
+                """
+                INSERT INTO habit_occurrences(habit_id, user_id, scheduled_at, status)
+                SELECT h, u, s, 'planned'
+                  FROM unnest(%s::int[], %s::bigint[], %s::timestamptz[]) AS t(h, u, s)
+                ON CONFLICT (habit_id, scheduled_at) DO UPDATE
+                   SET status='planned', action_at=NULL
+                 WHERE habit_occurrences.status='cancelled'
+                RETURNING id, habit_id, scheduled_at
+                """,
+                ([r[0] for r in rows], [r[1] for r in rows], [r[2] for r in rows]),
+            )
+            return {(int(r["habit_id"]), r["scheduled_at"]): int(r["id"]) for r in cur.fetchall()}
+
     def get(self, occurrence_id: int):
         with self.db.cursor() as cur:
             cur.execute("SELECT * FROM habit_occurrences WHERE id=%s", (occurrence_id,))
@@ -67,6 +92,20 @@ class HabitOccurrencesRepo:
             )
             return cur.rowcount > 0
 
+    def cancel_future_for_user(self, user_id: int, from_utc_iso: str) -> int:
+        with self.db.cursor() as cur:
+            cur.execute(
+                """
+                UPDATE habit_occurrences
+                   SET status='cancelled'
+                 WHERE user_id=%s
+                   AND status IN ('planned','sent')
+                   AND scheduled_at >= %s
+                """,
+                (user_id, from_utc_iso),
+            )
+            return cur.rowcount
+
     def cancel_future_for_habit(self, habit_id: int, from_utc_iso: str) -> int:
         with self.db.cursor() as cur:
             cur.execute(
@@ -38,7 +38,7 @@ class HabitsRepo:
             cur.execute(
                 """
                 UPDATE habits
-                   SET is_active=%s, updated_at=NOW()
+                   SET is_active=%s, planned_until=NULL, updated_at=NOW()
                  WHERE id=%s AND user_id=%s
                 """,
                 (is_active, habit_id, user_id),
@@ -67,7 +67,7 @@ class HabitsRepo:
             cur.execute(
                 """
                 UPDATE habits
-                   SET remind_time=%s, updated_at=NOW()
+                   SET remind_time=%s, planned_until=NULL, updated_at=NOW()
                  WHERE id=%s AND user_id=%s
                 """,
                 (remind_time, habit_id, user_id),
@@ -79,16 +79,62 @@ class HabitsRepo:
             cur.execute(
                 """
                 UPDATE habits
-                   SET frequency=%s, updated_at=NOW()
+                   SET frequency=%s, planned_until=NULL, updated_at=NOW()
                  WHERE id=%s AND user_id=%s
                 """,
                 (frequency, habit_id, user_id),
             )
             return cur.rowcount
 
-    def list_active(self):
+    def list_active(self, user_ids: list[int] | None = None):
+        """Active habits to plan, skipping unreachable users (bot blocked)."""
+
+        with self.db.cursor() as cur:
+            if user_ids is None:
+                cur.execute(
+                    """
+                    SELECT h.* FROM habits h
+                      JOIN users u ON u.id = h.user_id AND u.unreachable_at IS NULL
+                     WHERE h.is_active=TRUE
+                     ORDER BY h.user_id, h.id
+                    """,
+                )
+            else:
+                cur.execute(
+                    """
+                    SELECT h.* FROM habits h
+                      JOIN users u ON u.id = h.user_id AND u.unreachable_at IS NULL
+                     WHERE h.is_active=TRUE AND h.user_id = ANY(%s)
+                     ORDER BY h.user_id, h.id
+                    """,
+                    (list(user_ids),),
+                )
+            return cur.fetchall()
+
+    def reset_planned_for_user(self, user_id: int) -> int:
+        """Forget how far the user's habits are planned (timezone moved every slot)."""
+
         with self.db.cursor() as cur:
             cur.execute(
-                "SELECT * FROM habits WHERE is_active=TRUE ORDER BY user_id, id",
+                "UPDATE habits SET planned_until=NULL WHERE user_id=%s AND planned_until IS NOT NULL",
+                (user_id,),
             )
-            return cur.fetchall()
+            return cur.rowcount
+
+    def set_planned_until(self, until_by_habit: dict[int, str]) -> int:
+        """Move the planned horizon edge of many habits in one statement."""
+
+        if not until_by_habit:
+            return 0
+        ids = list(until_by_habit)
+        with self.db.cursor() as cur:
+            cur.execute(
+                """
+                UPDATE habits h
+                   SET planned_until = t.until
+                  FROM unnest(%s::int[], %s::timestamptz[]) AS t(id, until)
+                 WHERE h.id = t.id
+                """,
+                (ids, [until_by_habit[i] for i in ids]),
+            )
+            return cur.rowcount
@@ -4,6 +4,10 @@ class LessonRepo:
     def __init__(self, db: Database):
         self.db = db
 
+    @property
+    def cache(self):
+        return self.db.content_cache
+
     def upsert_lesson(self, day_index: int, title: str, description: str, video_url: str, points_viewed: int) -> int:
         with self.db.cursor() as cur:
             cur.execute(
@@ -19,12 +23,20 @@ class LessonRepo:
                 ''',
                 (day_index, title, description, video_url, points_viewed),
             )
-            return int(cur.fetchone()["id"])
+            lesson_id = int(cur.fetchone()["id"])
+            self.cache.invalidate(cur)
+            return lesson_id
 
-    def get_by_day(self, day_index: int):
+    def _load_by_days(self, day_indexes: list[int]) -> dict:
         with self.db.cursor() as cur:
-            cur.execute("SELECT * FROM lessons WHERE day_index=%s", (day_index,))
-            return cur.fetchone()
+            cur.execute("SELECT * FROM lessons WHERE day_index = ANY(%s)", (list(day_indexes),))
+            return {int(r["day_index"]): r for r in cur.fetchall()}
+
+    def get_by_day(self, day_index: int):
+        return self.cache.by_days("lesson", [day_index], self._load_by_days).get(int(day_index))
+
+    def list_by_days(self, day_indexes: list[int]):
+        return [r for r in self.cache.by_days("lesson", day_indexes, self._load_by_days).values() if r]
 
     def list_latest(self, limit: int = 30):
         with self.db.cursor() as cur:
@@ -40,4 +52,7 @@ class LessonRepo:
     def delete_day(self, day_index: int) -> bool:
         with self.db.cursor() as cur:
             cur.execute("DELETE FROM lessons WHERE day_index=%s", (day_index,))
-            return cur.rowcount > 0
+            deleted = cur.rowcount > 0
+            if deleted:
+                self.cache.invalidate(cur)
+            return deleted
@@ -0,0 +1,165 @@
+from entity.db import AsyncDatabase, Database
+from entity.repositories.backlog_repo import UNFINISHED_IN_DAYS_SQL
+
+# Materialized backlog. user_open_items holds the unfinished lessons, quests
+# and questionnaires of days 1..opened_through_day (user_open_items_state):
+# days are opened as the planner reaches them, items are closed when the user
+# views/answers, and admin content edits refresh the affected days.
+# Multi-statement methods run on one cursor, i.e. in one transaction.
+
+
+class OpenItemsRepo:
+    def __init__(self, db: Database):
+        self.db = db
+
+    def open_through(self, items: list[tuple[int, int]]) -> int:
+        """Open days up to day_index for (user_id, day_index) pairs; return rows added.
+
+        Only days past the user's opened_through_day are computed, so
+        repeated planning passes cost nothing once a day is open.
+        """
+
+        if not items:
+            return 0
+        with self.db.cursor() as cur:
+            cur.execute(
+                f"""
+                WITH req AS (
+                    SELECT user_id, MAX(upto) AS upto
+                      FROM unnest(%s::bigint[], %s::int[]) AS r(user_id, upto)
+                     GROUP BY user_id
+                ),
+                rng AS (
+                    SELECT req.user_id, COALESCE(s.opened_through_day, 0) AS opened, req.upto
+                      FROM req
+                      LEFT JOIN user_open_items_state s ON s.user_id = req.user_id
+                     WHERE req.upto > COALESCE(s.opened_through_day, 0)
+                ),
+                days AS (
+                    SELECT rng.user_id, d.day_index
+                      FROM rng, generate_series(rng.opened + 1, rng.upto) AS d(day_index)
+                ),
+                state AS (
+                    INSERT INTO user_open_items_state(user_id, opened_through_day)
+                    SELECT user_id, upto FROM rng
+                    ON CONFLICT (user_id) DO UPDATE
+                      SET opened_through_day = GREATEST(user_open_items_state.opened_through_day, EXCLUDED.opened_through_day),
+                          updated_at = NOW()
+                )
+                INSERT INTO user_open_items(user_id, day_index, kind, item_id)
+                {UNFINISHED_IN_DAYS_SQL}
+                ON CONFLICT DO NOTHING
+                """,
+                ([int(u) for u, _ in items], [int(d) for _, d in items]),
+            )
+            return cur.rowcount
+
+    def with_open_items(self, items: list[tuple[int, int]]) -> set[tuple[int, int]]:
+        """Which (user_id, day_index) pairs have anything open in days 1..day_index."""
+
+        if not items:
+            return set()
+        with self.db.cursor() as cur:
+            cur.execute(
+                """
+                SELECT k.user_id, k.day_index
+                  FROM unnest(%s::bigint[], %s::int[]) AS k(user_id, day_index)
+                 WHERE EXISTS (
+                       SELECT 1 FROM user_open_items o
+                        WHERE o.user_id = k.user_id AND o.day_index <= k.day_index
+                 )
+                """,
+                ([int(u) for u, _ in items], [int(d) for _, d in items]),
+            )
+            return {(int(r["user_id"]), int(r["day_index"])) for r in cur.fetchall()}
+
+    def has_open(self, user_id: int, day_index: int) -> bool:
+        return (int(user_id), int(day_index)) in self.with_open_items([(user_id, day_index)])
+
+    def close(self, user_id: int, kind: str, day_index: int | None = None, item_id: int = 0):
+        """Drop a finished item (a questionnaire is closed for every day it is listed under)."""
+
+        with self.db.cursor() as cur:
+            cur.execute(
+                """
+                DELETE FROM user_open_items
+                 WHERE user_id=%s AND kind=%s AND item_id=%s
+                   AND (%s::int IS NULL OR day_index=%s::int)
+                """,
+                (user_id, kind, item_id, day_index, day_index),
+            )
+
+    def refresh_days(self, day_indexes: list[int] | None = None) -> int:
+        """Recompute open items of the given days (None: all days) for every user.
+
+        Called after admin content edits; users only get days they have opened.
+        """
+
+        days = None if day_indexes is None else sorted({int(d) for d in day_indexes})
+        with self.db.cursor() as cur:
+            cur.execute(
+                "DELETE FROM user_open_items WHERE %s::int[] IS NULL OR day_index = ANY(%s::int[])",
+                (days, days),
+            )
+            cur.execute(
+                f"""
+                WITH days AS (
+                    SELECT s.user_id, d.day_index
+                      FROM user_open_items_state s, generate_series(1, s.opened_through_day) AS d(day_index)
+                     WHERE %s::int[] IS NULL OR d.day_index = ANY(%s::int[])
+                )
+                INSERT INTO user_open_items(user_id, day_index, kind, item_id)
+                {UNFINISHED_IN_DAYS_SQL}
+                ON CONFLICT DO NOTHING
+                """,
+                (days, days),
+            )
+            return cur.rowcount
+
+    def rebuild(self, opened_through: dict[int, int]) -> int:
+        """Reconcile: reset users to `opened_through` (user_id -> current day) and recompute from scratch.
+
+        Users missing from the mapping lose their rows and state.
+        """
+
+        user_ids = list(opened_through)
+        with self.db.cursor() as cur:
+            cur.execute("DELETE FROM user_open_items")
+            cur.execute("DELETE FROM user_open_items_state")
+            if not user_ids:
+                return 0
+            cur.execute(
+                """
+                INSERT INTO user_open_items_state(user_id, opened_through_day)
+                SELECT u, d FROM unnest(%s::bigint[], %s::int[]) AS t(u, d)
+                """,
+                (user_ids, [int(opened_through[u]) for u in user_ids]),
+            )
+            cur.execute(
+                f"""
+                WITH days AS (
+                    SELECT s.user_id, d.day_index
+                      FROM user_open_items_state s, generate_series(1, s.opened_through_day) AS d(day_index)
+                )
+                INSERT INTO user_open_items(user_id, day_index, kind, item_id)
+                {UNFINISHED_IN_DAYS_SQL}
+                ON CONFLICT DO NOTHING
+                """
+            )
+            return cur.rowcount
+
+
+class AsyncOpenItemsRepo:
+    def __init__(self, db: AsyncDatabase):
+        self.db = db
+
+    async def close(self, user_id: int, kind: str, day_index: int | None = None, item_id: int = 0):
+        async with self.db.cursor() as cur:
+            await cur.execute(
+                """
+                DELETE FROM user_open_items
+                 WHERE user_id=%s AND kind=%s AND item_id=%s
+                   AND (%s::int IS NULL OR day_index=%s::int)
+                """,
+                (user_id, kind, item_id, day_index, day_index),
+            )
@@ -1,5 +1,64 @@
 import json
-from entity.db import Database
+from entity.db import AsyncDatabase, Database
+
+# First key of the per-user pg_try_advisory_xact_lock taken while claiming jobs.
+OUTBOX_CLAIM_LOCK_CLASS = 7301
+
+# Priority lanes (outbox_jobs.lane, see migration 12). A payload may pin its
+# lane with "lane"; otherwise it follows from the kind (job_lane). A NULL
+# lane (rows written before the column existed) counts as LANE_CONTENT.
+LANE_INTERACTIVE = 0  # user/admin asked for it right now
+LANE_REMINDER = 1  # habit and personal reminders: time-critical
+LANE_CONTENT = 2  # planned day content and daily reminders
+LANE_BROADCAST = 3  # admin questionnaire broadcasts
+
+# Share of a claim batch per lane when all lanes have due jobs; an idle
+# lane's share goes to the others.
+DEFAULT_LANE_WEIGHTS = {LANE_INTERACTIVE: 8.0, LANE_REMINDER: 4.0, LANE_CONTENT: 2.0, LANE_BROADCAST: 1.0}
+
+
+_LANES = {str(lane) for lane in DEFAULT_LANE_WEIGHTS}
+_REMINDER_KINDS = ("habit_reminder", "personal_reminder")
+
+# job_lane() in SQL, for backfilling rows written before the lane column.
+PAYLOAD_LANE_SQL = """
+CASE
+    WHEN payload_json->>'lane' IN ('0','1','2','3') THEN (payload_json->>'lane')::smallint
+    WHEN payload_json->>'kind' IN ('habit_reminder','personal_reminder') THEN 1
+    WHEN payload_json->>'kind' = 'questionnaire_broadcast'
+         AND COALESCE(payload_json->>'day_index', '0') IN ('', '0') THEN 3
+    ELSE 2
+END
+"""
+
+
+def job_lane(payload: dict) -> int:
+    """Lane of a job: an explicit payload "lane" wins, admin questionnaire broadcasts (no day) go last."""
+
+    lane = payload.get("lane")
+    if lane is not None and not isinstance(lane, bool) and str(lane) in _LANES:
+        return int(lane)
+    kind = payload.get("kind")
+    if kind in _REMINDER_KINDS:
+        return LANE_REMINDER
+    if kind == "questionnaire_broadcast" and str(payload.get("day_index") or 0) in ("", "0"):
+        return LANE_BROADCAST
+    return LANE_CONTENT
+
+
+def parse_lane_weights(raw: str | None) -> dict[int, float]:
+    """OUTBOX_LANE_WEIGHTS, e.g. "8,4,2,1": weights of lanes 0..3 (missing/invalid: defaults)."""
+
+    weights = dict(DEFAULT_LANE_WEIGHTS)
+    for lane, part in enumerate((raw or "").split(",")):
+        try:
+            value = float(part)
+        except ValueError:
+            continue
+        if lane in weights and value > 0:
+            weights[lane] = value
+    return weights
+
 
 class OutboxRepo:
     def __init__(self, db: Database):
@@ -8,14 +67,81 @@ class OutboxRepo:
     def create_job(self, user_id: int, run_at_iso: str, payload: dict):
         with self.db.cursor() as cur:
             cur.execute(
-                "INSERT INTO outbox_jobs(user_id, run_at, payload_json, status) VALUES (%s,%s,%s::jsonb,'pending')",
-                (user_id, run_at_iso, json.dumps(payload)),
+                "INSERT INTO outbox_jobs(user_id, run_at, payload_json, job_key, status, lane) VALUES (%s,%s,%s::jsonb,%s,'pending',%s)",
+                (user_id, run_at_iso, json.dumps(payload), payload.get("job_key"), job_lane(payload)),
+            )
+
+    def create_job_if_absent(self, user_id: int, run_at_iso: str, payload: dict) -> bool:
+        """Insert a job unless a live (pending/processing/sent) one with the same job_key exists.
+
+        Atomic replacement for exists_job_for() + create_job(): concurrent
+        planners are deduplicated by the partial unique index. Returns True if
+        a row was inserted.
+        """
+
+        with self.db.cursor() as cur:
+            cur.execute(
+                """
+                INSERT INTO outbox_jobs(user_id, run_at, payload_json, job_key, status, lane)
+                VALUES (%s,%s,%s::jsonb,%s,'pending',%s)
+                ON CONFLICT (user_id, job_key) WHERE job_key IS NOT NULL AND status IN ('pending','processing','sent')
+                DO NOTHING
+                RETURNING id
+                """,
+                (user_id, run_at_iso, json.dumps(payload), payload.get("job_key"), job_lane(payload)),
+            )
+            return cur.fetchone() is not None
+
+    def live_job_keys(self, keys: list[tuple[int, str]]) -> set[tuple[int, str]]:
+        """Which of the (user_id, job_key) pairs already have a live job (bulk exists_job_for)."""
+
+        if not keys:
+            return set()
+        with self.db.cursor() as cur:
+            cur.execute(
+                """
+                SELECT o.user_id, o.job_key
+                  FROM outbox_jobs o
+                  JOIN unnest(%s::bigint[], %s::text[]) AS k(user_id, job_key)
+                    ON o.user_id = k.user_id AND o.job_key = k.job_key
+                 WHERE o.status IN ('pending','processing','sent')
+                """,
+                ([k[0] for k in keys], [k[1] for k in keys]),
             )
+            return {(int(r["user_id"]), r["job_key"]) for r in cur.fetchall()}
+
+    def create_jobs_bulk(self, jobs: list[tuple[int, str, dict]]) -> set[tuple[int, str]]:
+        """Multi-row create_job_if_absent(): one INSERT for (user_id, run_at_iso, payload) rows.
+
+        Returns the (user_id, job_key) pairs actually inserted.
+        """
+
+        if not jobs:
+            return set()
+        with self.db.cursor() as cur:
+            cur.execute(
+                """
+                INSERT INTO outbox_jobs(user_id, run_at, payload_json, job_key, status, lane)
+                SELECT u, r, p::jsonb, k, 'pending', l
+                  FROM unnest(%s::bigint[], %s::timestamptz[], %s::text[], %s::text[], %s::smallint[]) AS t(u, r, p, k, l)
+                ON CONFLICT (user_id, job_key) WHERE job_key IS NOT NULL AND status IN ('pending','processing','sent')
+                DO NOTHING
+                RETURNING user_id, job_key
+                """,
+                (
+                    [j[0] for j in jobs],
+                    [j[1] for j in jobs],
+                    [json.dumps(j[2]) for j in jobs],
+                    [j[2].get("job_key") for j in jobs],
+                    [job_lane(j[2]) for j in jobs],
+                ),
+            )
+            return {(int(r["user_id"]), r["job_key"]) for r in cur.fetchall()}
 
     def fetch_due_pending(self, limit: int = 50):
         with self.db.cursor() as cur:
             cur.execute(
-                "SELECT * FROM outbox_jobs WHERE status='pending' AND run_at<=NOW() ORDER BY run_at ASC LIMIT %s",
+                "SELECT * FROM outbox_jobs WHERE status='pending' AND run_at<=NOW() ORDER BY run_at ASC, id ASC LIMIT %s",
                 (limit,),
             )
             return cur.fetchall()
@@ -23,19 +149,22 @@ class OutboxRepo:
     def exists_job_for(self, user_id: int, key: str):
         with self.db.cursor() as cur:
             cur.execute(
-                "SELECT 1 FROM outbox_jobs WHERE user_id=%s AND payload_json->>'job_key'=%s AND status IN ('pending','sent') LIMIT 1",
+                "SELECT 1 FROM outbox_jobs WHERE user_id=%s AND job_key=%s AND status IN ('pending','processing','sent') LIMIT 1",
                 (user_id, key),
             )
             return cur.fetchone() is not None
 
     def mark_sent(self, job_id: int):
         with self.db.cursor() as cur:
-            cur.execute("UPDATE outbox_jobs SET status='sent' WHERE id=%s", (job_id,))
+            cur.execute(
+                "UPDATE outbox_jobs SET status='sent', lease_owner=NULL, lease_expires_at=NULL WHERE id=%s",
+                (job_id,),
+            )
 
     def mark_failed(self, job_id: int, err: str):
         with self.db.cursor() as cur:
             cur.execute(
-                "UPDATE outbox_jobs SET status='failed', attempts=attempts+1, last_error=%s WHERE id=%s",
+                "UPDATE outbox_jobs SET status='failed', attempts=attempts+1, last_error=%s, lease_owner=NULL, lease_expires_at=NULL WHERE id=%s",
                 (err[:1000], job_id),
             )
 
@@ -107,8 +236,225 @@ class OutboxRepo:
                    AND status='pending'
                    AND run_at >= %s
                    AND payload_json->>'kind'='questionnaire_broadcast'
-                   AND payload_json->>'job_key' LIKE 'questionnaire:%%'
+                   AND job_key LIKE 'questionnaire:%%'
                 """,
                 (user_id, from_utc_iso),
             )
             return cur.rowcount
+
+
+class AsyncOutboxRepo:
+    """Awaitable outbox operations used by the delivery loop."""
+
+    def __init__(self, db: AsyncDatabase, lane_weights: dict[int, float] | None = None):
+        self.db = db
+        self.lane_weights = dict(lane_weights or DEFAULT_LANE_WEIGHTS)
+
+    async def seconds_until_next_due(self) -> float | None:
+        """Seconds until the earliest pending run_at (<= 0 if overdue), None if the queue is empty."""
+
+        async with self.db.cursor() as cur:
+            await cur.execute(
+                "SELECT EXTRACT(EPOCH FROM (MIN(run_at) - NOW())) AS wait_sec FROM outbox_jobs WHERE status='pending'"
+            )
+            row = await cur.fetchone()
+        if not row or row["wait_sec"] is None:
+            return None
+        return float(row["wait_sec"])
+
+    async def schedule_retry(self, job_id: int, err: str, delay_sec: float):
+        """Count the failed attempt and put the job back to pending at NOW() + delay."""
+
+        async with self.db.cursor() as cur:
+            await cur.execute(
+                """
+                UPDATE outbox_jobs
+                   SET status='pending',
+                       attempts=attempts+1,
+                       last_error=%s,
+                       run_at=NOW() + make_interval(secs => %s),
+                       lease_owner=NULL,
+                       lease_expires_at=NULL
+                 WHERE id=%s
+                """,
+                (err[:1000], delay_sec, job_id),
+            )
+
+    async def claim_due(self, owner: str, limit: int = 50, lease_sec: int = 120):
+        """Atomically lease due pending jobs to `owner`; return them in (run_at, id) order.
+
+        Lanes share the batch by weighted fair queuing: the n-th due job of a
+        lane gets virtual time n / weight and the batch takes the smallest
+        ones, so a large broadcast only gets its share while reminders are due.
+
+        SKIP LOCKED lets several workers claim disjoint batches. A user with a
+        job already in processing is skipped, and the per-user advisory lock
+        keeps two concurrent claims from splitting one user's jobs, so
+        per-user delivery order holds across workers.
+
+        Each row carries the user's current `unreachable_at`, read here rather
+        than from the per-process profile cache.
+        """
+
+        lanes = sorted(self.lane_weights)
+        async with self.db.cursor() as cur:
+            await cur.execute(
+                """
+                WITH lanes AS (
+                    SELECT * FROM unnest(%(lanes)s::smallint[], %(weights)s::float8[]) AS l(lane, weight)
+                ),
+                cand AS (
+                    SELECT c.id, l.lane, c.run_at, l.weight
+                      FROM lanes l
+                      CROSS JOIN LATERAL (
+                          SELECT o.id, o.run_at
+                            FROM outbox_jobs o
+                           WHERE o.status='pending'
+                             -- Same expression as idx_outbox_pending_lane_run (2 = LANE_CONTENT).
+                             AND COALESCE(o.lane, 2)=l.lane
+                             AND o.run_at<=NOW()
+                             AND NOT EXISTS (
+                                 SELECT 1 FROM outbox_jobs p WHERE p.user_id=o.user_id AND p.status='processing'
+                             )
+                             AND pg_try_advisory_xact_lock(%(lock_class)s, hashtext(o.user_id::text))
+                           ORDER BY o.run_at ASC, o.id ASC
+                           LIMIT %(limit)s
+                             FOR UPDATE SKIP LOCKED
+                      ) c
+                ),
+                due AS (
+                    SELECT id
+                      FROM (
+                            SELECT id, lane, run_at,
+                                   ROW_NUMBER() OVER (PARTITION BY lane ORDER BY run_at, id) / weight AS vtime
+                              FROM cand
+                           ) v
+                     ORDER BY vtime, lane, run_at, id
+                     LIMIT %(limit)s
+                )
+                UPDATE outbox_jobs j
+                   SET status='processing',
+                       lease_owner=%(owner)s,
+                       lease_expires_at=NOW() + make_interval(secs => %(lease_sec)s)
+                  FROM due
+                 WHERE j.id=due.id
+                RETURNING j.*, (SELECT u.unreachable_at FROM users u WHERE u.id=j.user_id) AS unreachable_at
+                """,
+                {
+                    "lanes": lanes,
+                    "weights": [self.lane_weights[lane] for lane in lanes],
+                    "lock_class": OUTBOX_CLAIM_LOCK_CLASS,
+                    "limit": limit,
+                    "owner": owner,
+                    "lease_sec": lease_sec,
+                },
+            )
+            rows = await cur.fetchall()
+        return sorted(rows, key=lambda r: (r["run_at"], r["id"]))
+
+    async def backfill_lanes(self, batch_size: int = 1000) -> int:
+        """Set the lane of pending jobs written before the lane column, one small commit per batch."""
+
+        total = 0
+        while True:
+            async with self.db.cursor() as cur:
+                await cur.execute(
+                    f"""
+                    UPDATE outbox_jobs
+                       SET lane = {PAYLOAD_LANE_SQL}
+                     WHERE id IN (
+                           SELECT id FROM outbox_jobs
+                            WHERE status='pending' AND lane IS NULL
+                            LIMIT %s
+                              FOR UPDATE SKIP LOCKED
+                     )
+                    """,
+                    (batch_size,),
+                )
+                updated = cur.rowcount
+            total += updated
+            if updated < batch_size:
+                return total
+
+    async def renew_leases(self, owner: str, lease_sec: int = 120) -> int:
+        async with self.db.cursor() as cur:
+            await cur.execute(
+                """
+                UPDATE outbox_jobs
+                   SET lease_expires_at=NOW() + make_interval(secs => %s)
+                 WHERE status='processing' AND lease_owner=%s
+                """,
+                (lease_sec, owner),
+            )
+            return cur.rowcount
+
+    async def release_expired_leases(self, max_attempts: dict[str, int] | None = None, default_max_attempts: int = 3) -> int:
+        """Reaper: return jobs whose worker died or stalled back to pending.
+
+        An expired lease counts as a failed attempt, so a job that keeps
+        crashing or hanging its worker is failed once its kind's
+        `max_attempts` (default_max_attempts for other kinds) is reached.
+        """
+
+        limits = dict(max_attempts or {})
+        kinds = sorted(limits)
+        async with self.db.cursor() as cur:
+            await cur.execute(
+                """
+                WITH expired AS (
+                    SELECT o.id,
+                           o.attempts + 1 >= COALESCE(
+                               (SELECT m.n FROM unnest(%(kinds)s::text[], %(limits)s::int[]) AS m(kind, n)
+                                 WHERE m.kind = o.payload_json->>'kind'),
+                               %(default_max)s
+                           ) AS exhausted
+                      FROM outbox_jobs o
+                     WHERE o.status='processing' AND o.lease_expires_at < NOW()
+                       FOR UPDATE SKIP LOCKED
+                )
+                UPDATE outbox_jobs j
+                   SET status = CASE WHEN expired.exhausted THEN 'failed' ELSE 'pending' END,
+                       attempts = j.attempts + 1,
+                       last_error = 'lease expired',
+                       lease_owner = NULL,
+                       lease_expires_at = NULL
+                  FROM expired
+                 WHERE j.id = expired.id
+                """,
+                {
+                    "kinds": kinds,
+                    "limits": [int(limits[k]) for k in kinds],
+                    "default_max": int(default_max_attempts),
+                },
+            )
+            return cur.rowcount
+
+    async def mark_sent(self, job_id: int):
+        async with self.db.cursor() as cur:
+            await cur.execute(
+                "UPDATE outbox_jobs SET status='sent', lease_owner=NULL, lease_expires_at=NULL WHERE id=%s",
+                (job_id,),
+            )
+
+    async def cancel_claimed(self, job_ids: list[int], err: str) -> int:
+        """Cancel claimed jobs without sending them (e.g. their user is unreachable)."""
+
+        if not job_ids:
+            return 0
+        async with self.db.cursor() as cur:
+            await cur.execute(
+                """
+                UPDATE outbox_jobs
+                   SET status='cancelled', last_error=%s, lease_owner=NULL, lease_expires_at=NULL
+                 WHERE id = ANY(%s) AND status='processing'
+                """,
+                (err[:1000], list(job_ids)),
+            )
+            return cur.rowcount
+
+    async def mark_failed(self, job_id: int, err: str):
+        async with self.db.cursor() as cur:
+            await cur.execute(
+                "UPDATE outbox_jobs SET status='failed', attempts=attempts+1, last_error=%s, lease_owner=NULL, lease_expires_at=NULL WHERE id=%s",
+                (err[:1000], job_id),
+            )
@@ -53,7 +53,7 @@ class PersonalRemindersRepo:
             cur.execute(
                 """
                 UPDATE personal_reminders
-                   SET start_at=%s, remind_time=%s, updated_at=NOW()
+                   SET start_at=%s, remind_time=%s, is_active=TRUE, updated_at=NOW()
                  WHERE id=%s AND user_id=%s
                 """,
                 (start_at_iso, remind_time, reminder_id, user_id),
@@ -68,9 +68,58 @@ class PersonalRemindersRepo:
             )
             return cur.rowcount
 
-    def list_active(self):
+    def list_active(self, user_ids: list[int] | None = None):
+        with self.db.cursor() as cur:
+            if user_ids is None:
+                cur.execute(
+                    "SELECT * FROM personal_reminders WHERE is_active=TRUE ORDER BY user_id, id",
+                )
+            else:
+                cur.execute(
+                    "SELECT * FROM personal_reminders WHERE is_active=TRUE AND user_id = ANY(%s) ORDER BY user_id, id",
+                    (list(user_ids),),
+                )
+            return cur.fetchall()
+
+    def list_due_window(self, from_iso: str, until_iso: str, user_ids: list[int] | None = None):
+        """Active reminders starting in [from, until): served by the partial start_at index.
+
+        Reminders of unreachable users (bot blocked) are left out.
+        """
+
+        with self.db.cursor() as cur:
+            if user_ids is None:
+                cur.execute(
+                    """
+                    SELECT r.id, r.user_id, r.text, r.start_at FROM personal_reminders r
+                      JOIN users u ON u.id = r.user_id AND u.unreachable_at IS NULL
+                     WHERE r.is_active=TRUE AND r.start_at >= %s AND r.start_at < %s
+                     ORDER BY r.start_at, r.id
+                    """,
+                    (from_iso, until_iso),
+                )
+            else:
+                cur.execute(
+                    """
+                    SELECT r.id, r.user_id, r.text, r.start_at FROM personal_reminders r
+                      JOIN users u ON u.id = r.user_id AND u.unreachable_at IS NULL
+                     WHERE r.is_active=TRUE AND r.start_at >= %s AND r.start_at < %s AND r.user_id = ANY(%s)
+                     ORDER BY r.start_at, r.id
+                    """,
+                    (from_iso, until_iso, list(user_ids)),
+                )
+            return cur.fetchall()
+
+    def mark_fired(self, reminder_id: int) -> int:
+        """Deactivate a one-time reminder once delivered (unless moved to a later time meanwhile)."""
+
         with self.db.cursor() as cur:
             cur.execute(
-                "SELECT * FROM personal_reminders WHERE is_active=TRUE ORDER BY user_id, id",
+                """
+                UPDATE personal_reminders
+                   SET is_active=FALSE, updated_at=NOW()
+                 WHERE id=%s AND is_active=TRUE AND start_at <= NOW()
+                """,
+                (reminder_id,),
             )
-            return cur.fetchall()
+            return cur.rowcount
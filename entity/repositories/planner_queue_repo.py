@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+from entity.db import Database
+
+
+class PlannerQueueRepo:
+    """Users whose outbox plan must be rebuilt, and when.
+
+    One row per user: a change (settings, habits, reminders, content) enqueues
+    the user for NOW(); after a planning pass the row comes back with the
+    user's next local-date rollover as next_replan_at.
+    """
+
+    def __init__(self, db: Database):
+        self.db = db
+
+    def enqueue(self, user_ids: list[int], reason: str, at_iso: str | None = None, reschedule: bool = False) -> int:
+        """Mark users dirty. An earlier pending replan time (and its reason) wins.
+
+        reschedule=True asks the planner to drop already planned future day
+        jobs first (delivery time / timezone moved); the flag sticks until
+        the row is claimed.
+        """
+
+        if not user_ids:
+            return 0
+        with self.db.cursor() as cur:
+            cur.execute(
+                """
+                INSERT INTO planner_queue(user_id, reason, next_replan_at, reschedule)
+                SELECT u, %s, COALESCE(%s::timestamptz, NOW()), %s
+                  FROM unnest(%s::bigint[]) AS t(u)
+                ON CONFLICT (user_id) DO UPDATE
+                  SET reason = CASE WHEN EXCLUDED.next_replan_at < planner_queue.next_replan_at
+                                    THEN EXCLUDED.reason ELSE planner_queue.reason END,
+                      next_replan_at = LEAST(planner_queue.next_replan_at, EXCLUDED.next_replan_at),
+                      reschedule = planner_queue.reschedule OR EXCLUDED.reschedule,
+                      updated_at = NOW()
+                """,
+                (reason, at_iso, bool(reschedule), sorted({int(u) for u in user_ids})),
+            )
+            return cur.rowcount
+
+    def enqueue_enrolled(self, reason: str) -> int:
+        """Mark every actively enrolled, reachable user dirty (course content changed)."""
+
+        with self.db.cursor() as cur:
+            cur.execute(
+                """
+                INSERT INTO planner_queue(user_id, reason, next_replan_at)
+                SELECT e.user_id, %s, NOW()
+                  FROM enrollments e
+                  JOIN users u ON u.id = e.user_id AND u.unreachable_at IS NULL
+                 WHERE e.is_active=TRUE
+                ON CONFLICT (user_id) DO UPDATE
+                  SET reason = EXCLUDED.reason, next_replan_at = NOW(), updated_at = NOW()
+                """,
+                (reason,),
+            )
+            return cur.rowcount
+
+    def claim_due(self, limit: int = 500) -> list[dict]:
+        """Take due rows off the queue (inside the caller's transaction).
+
+        Rows are deleted, so a rollback puts them back; SKIP LOCKED lets
+        several planners split the queue.
+        """
+
+        with self.db.cursor() as cur:
+            cur.execute(
+                """
+                DELETE FROM planner_queue
+                 WHERE user_id IN (
+                       SELECT user_id FROM planner_queue
+                        WHERE next_replan_at <= NOW()
+                        ORDER BY next_replan_at
+                        LIMIT %s
+                        FOR UPDATE SKIP LOCKED
+                 )
+                RETURNING user_id, reason, reschedule
+                """,
+                (limit,),
+            )
+            return cur.fetchall()
+
+    def set_horizons(self, horizons: dict[int, str], reason: str = "horizon") -> int:
+        """Queue the next replan for users that still have anything to plan.
+
+        `horizons` maps user_id -> ISO timestamp (next local-date rollover).
+        Users without an active enrollment or habit are dropped: one-off
+        personal reminders need no rollover. So are unreachable users (bot
+        blocked): mark_reachable queues them again.
+        """
+
+        if not horizons:
+            return 0
+        user_ids = list(horizons)
+        with self.db.cursor() as cur:
+            cur.execute(
+                """
+                INSERT INTO planner_queue(user_id, reason, next_replan_at)
+                SELECT t.u, %s, t.at
+                  FROM unnest(%s::bigint[], %s::timestamptz[]) AS t(u, at)
+                  JOIN users usr ON usr.id = t.u AND usr.unreachable_at IS NULL
+                 WHERE EXISTS (SELECT 1 FROM enrollments e WHERE e.user_id = t.u AND e.is_active=TRUE)
+                    OR EXISTS (SELECT 1 FROM habits h WHERE h.user_id = t.u AND h.is_active=TRUE)
+                ON CONFLICT (user_id) DO UPDATE
+                  SET reason = CASE WHEN EXCLUDED.next_replan_at < planner_queue.next_replan_at
+                                    THEN EXCLUDED.reason ELSE planner_queue.reason END,
+                      next_replan_at = LEAST(planner_queue.next_replan_at, EXCLUDED.next_replan_at),
+                      updated_at = NOW()
+                """,
+                (reason, user_ids, [horizons[u] for u in user_ids]),
+            )
+            return cur.rowcount
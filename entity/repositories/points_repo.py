@@ -1,4 +1,4 @@
-from entity.db import Database
+from entity.db import AsyncDatabase, Database
 
 class PointsRepo:
     def __init__(self, db: Database):
@@ -23,3 +23,23 @@ class PointsRepo:
                 (user_id, source_type, source_key),
             )
             return cur.fetchone() is not None
+
+
+class AsyncPointsRepo:
+    def __init__(self, db: AsyncDatabase):
+        self.db = db
+
+    async def add_points(self, user_id: int, source_type: str, source_key: str | None, points: int):
+        async with self.db.cursor() as cur:
+            await cur.execute(
+                "INSERT INTO points_ledger(user_id, source_type, source_key, points) VALUES (%s,%s,%s,%s)",
+                (user_id, source_type, source_key, points),
+            )
+
+    async def has_entry(self, user_id: int, source_type: str, source_key: str | None) -> bool:
+        async with self.db.cursor() as cur:
+            await cur.execute(
+                "SELECT 1 FROM points_ledger WHERE user_id=%s AND source_type=%s AND source_key=%s LIMIT 1",
+                (user_id, source_type, source_key),
+            )
+            return (await cur.fetchone()) is not None
@@ -1,4 +1,4 @@
-from entity.db import Database
+from entity.db import AsyncDatabase, Database
 
 class ProgressRepo:
     def __init__(self, db: Database):
@@ -45,3 +45,24 @@ class ProgressRepo:
                 (user_id, day_index),
             )
             return cur.fetchone() is not None
+
+
+class AsyncProgressRepo:
+    def __init__(self, db: AsyncDatabase):
+        self.db = db
+
+    async def mark_viewed(self, user_id: int, day_index: int):
+        async with self.db.cursor() as cur:
+            await cur.execute(
+                "INSERT INTO progress(user_id, day_index, status) VALUES (%s,%s,'viewed') "
+                "ON CONFLICT(user_id, day_index) DO UPDATE SET status='viewed'",
+                (user_id, day_index),
+            )
+
+    async def mark_done(self, user_id: int, day_index: int):
+        async with self.db.cursor() as cur:
+            await cur.execute(
+                "INSERT INTO progress(user_id, day_index, status, done_at) VALUES (%s,%s,'done',NOW()) "
+                "ON CONFLICT(user_id, day_index) DO UPDATE SET status='done', done_at=NOW()",
+                (user_id, day_index),
+            )
@@ -4,6 +4,10 @@ class QuestRepo:
     def __init__(self, db: Database):
         self.db = db
 
+    @property
+    def cache(self):
+        return self.db.content_cache
+
     def upsert_quest(self, day_index: int, points: int, prompt: str, photo_file_id: str | None = None) -> int:
         with self.db.cursor() as cur:
             cur.execute(
@@ -18,12 +22,20 @@ class QuestRepo:
                 ''',
                 (day_index, points, prompt, photo_file_id),
             )
-            return int(cur.fetchone()["id"])
+            quest_id = int(cur.fetchone()["id"])
+            self.cache.invalidate(cur)
+            return quest_id
 
-    def get_by_day(self, day_index: int):
+    def _load_by_days(self, day_indexes: list[int]) -> dict:
         with self.db.cursor() as cur:
-            cur.execute("SELECT * FROM quests WHERE day_index=%s", (day_index,))
-            return cur.fetchone()
+            cur.execute("SELECT * FROM quests WHERE day_index = ANY(%s)", (list(day_indexes),))
+            return {int(r["day_index"]): r for r in cur.fetchall()}
+
+    def get_by_day(self, day_index: int):
+        return self.cache.by_days("quest", [day_index], self._load_by_days).get(int(day_index))
+
+    def list_by_days(self, day_indexes: list[int]):
+        return [r for r in self.cache.by_days("quest", day_indexes, self._load_by_days).values() if r]
 
     def list_latest(self, limit: int = 30):
         with self.db.cursor() as cur:
@@ -33,4 +45,7 @@ class QuestRepo:
     def delete_day(self, day_index: int) -> bool:
         with self.db.cursor() as cur:
             cur.execute("DELETE FROM quests WHERE day_index=%s", (day_index,))
-            return cur.rowcount > 0
+            deleted = cur.rowcount > 0
+            if deleted:
+                self.cache.invalidate(cur)
+            return deleted
@@ -1,9 +1,18 @@
 from entity.db import Database
 
+# Content cache key of legacy daily questionnaires (created without day_index),
+# which belong to every day.
+_LEGACY_DAILY = ("questionnaires:legacy_daily", 0)
+
+
 class QuestionnaireRepo:
     def __init__(self, db: Database):
         self.db = db
 
+    @property
+    def cache(self):
+        return self.db.content_cache
+
     def create(
         self,
         question: str,
@@ -22,7 +31,9 @@ class QuestionnaireRepo:
                 """,
                 (question, qtype, day_index, use_in_charts, points, created_by),
             )
-            return int(cur.fetchone()["id"])
+            qid = int(cur.fetchone()["id"])
+            self.cache.invalidate(cur)
+            return qid
 
     def update(
         self,
@@ -42,11 +53,15 @@ class QuestionnaireRepo:
                 """,
                 (question, qtype, day_index, use_in_charts, points, qid),
             )
+            self.cache.invalidate(cur)
 
     def delete(self, qid: int) -> bool:
         with self.db.cursor() as cur:
             cur.execute("DELETE FROM questionnaires WHERE id=%s", (qid,))
-            return cur.rowcount > 0
+            deleted = cur.rowcount > 0
+            if deleted:
+                self.cache.invalidate(cur)
+            return deleted
 
     def get(self, qid: int):
         with self.db.cursor() as cur:
@@ -66,34 +81,49 @@ class QuestionnaireRepo:
             )
             return cur.fetchone()
 
-    def list_by_day(self, day_index: int, qtypes: tuple[str, ...] = ("manual",)):
+    def _load_legacy_daily(self, _keys) -> dict:
         with self.db.cursor() as cur:
-            qtypes_list = list(qtypes)
-            if "daily" in qtypes_list:
-                # Backward compatibility: old daily questionnaires were created
-                # without day_index and should still broadcast each day.
-                cur.execute(
-                    """
-                    SELECT *
-                    FROM questionnaires
-                    WHERE (day_index=%s AND qtype = ANY(%s))
-                       OR (qtype='daily' AND day_index IS NULL)
-                    ORDER BY id ASC
-                    """,
-                    (day_index, qtypes_list),
-                )
-            else:
+            cur.execute("SELECT * FROM questionnaires WHERE qtype='daily' AND day_index IS NULL ORDER BY id ASC")
+            return {_LEGACY_DAILY: cur.fetchall()}
+
+    def _by_days(self, day_indexes: list[int], qtypes: tuple[str, ...]) -> dict[int, list]:
+        qtypes_list = sorted(set(qtypes))
+
+        def load(days: list[int]) -> dict:
+            out = {d: [] for d in days}
+            with self.db.cursor() as cur:
                 cur.execute(
                     """
                     SELECT *
                     FROM questionnaires
-                    WHERE day_index=%s
+                    WHERE day_index = ANY(%s)
                       AND qtype = ANY(%s)
                     ORDER BY id ASC
                     """,
-                    (day_index, qtypes_list),
+                    (list(days), qtypes_list),
                 )
-            return cur.fetchall()
+                for r in cur.fetchall():
+                    out[int(r["day_index"])].append(r)
+            return out
+
+        return self.cache.by_days("questionnaires:" + ",".join(qtypes_list), day_indexes, load)
+
+    def _legacy_daily(self, qtypes: tuple[str, ...]) -> list:
+        # Backward compatibility: old daily questionnaires were created
+        # without day_index and should still broadcast each day.
+        if "daily" not in qtypes:
+            return []
+        return self.cache.get_many([_LEGACY_DAILY], self._load_legacy_daily)[_LEGACY_DAILY] or []
+
+    def list_by_day(self, day_index: int, qtypes: tuple[str, ...] = ("manual",)):
+        rows = self._by_days([day_index], qtypes)[int(day_index)] or []
+        return sorted(rows + self._legacy_daily(qtypes), key=lambda r: int(r["id"]))
+
+    def list_by_days(self, day_indexes: list[int], qtypes: tuple[str, ...] = ("manual",)):
+        """list_by_day() for many days at once; legacy daily rows (day_index NULL) are returned once."""
+
+        rows = [r for day_rows in self._by_days(day_indexes, qtypes).values() for r in day_rows or []]
+        return sorted(rows + self._legacy_daily(qtypes), key=lambda r: int(r["id"]))
 
     def has_user_response(self, user_id: int, questionnaire_id: int) -> bool:
         with self.db.cursor() as cur:
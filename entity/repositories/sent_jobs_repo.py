@@ -21,6 +21,25 @@ class SentJobsRepo:
             )
             return cur.fetchone() is not None
 
+    def sent_keys(self, user_ids: list[int], for_dates: list[date]) -> set[tuple[int, str, int, date]]:
+        """Bulk was_sent(): every (user_id, content_type, day_index, for_date) recorded for these users/dates."""
+
+        if not user_ids or not for_dates:
+            return set()
+        with self.db.cursor() as cur:
+            cur.execute(
+                """
+                SELECT user_id, content_type, day_index, for_date
+                FROM sent_jobs
+                WHERE user_id = ANY(%s) AND for_date = ANY(%s)
+                """,
+                (list(user_ids), list(for_dates)),
+            )
+            return {
+                (int(r["user_id"]), r["content_type"], int(r["day_index"]), r["for_date"])
+                for r in cur.fetchall()
+            }
+
     def mark_sent(self, user_id: int, content_type: str, day_index: int, for_date: date) -> bool:
         """Returns True if inserted (i.e., first time), False if already existed."""
         with self.db.cursor() as cur:
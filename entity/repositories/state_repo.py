@@ -1,5 +1,5 @@
 import json
-from entity.db import Database
+from entity.db import AsyncDatabase, Database
 
 class StateRepo:
     def __init__(self, db: Database):
@@ -27,3 +27,31 @@ class StateRepo:
         with self.db.cursor() as cur:
             cur.execute("SELECT * FROM user_state WHERE user_id=%s", (user_id,))
             return cur.fetchone()
+
+
+class AsyncStateRepo:
+    def __init__(self, db: AsyncDatabase):
+        self.db = db
+
+    async def set_state(self, user_id: int, step: str, payload: dict | None = None):
+        async with self.db.cursor() as cur:
+            await cur.execute(
+                '''
+                INSERT INTO user_state(user_id, step, payload_json, updated_at)
+                VALUES (%s, %s, %s::jsonb, NOW())
+                ON CONFLICT(user_id) DO UPDATE
+                  SET step=EXCLUDED.step,
+                      payload_json=EXCLUDED.payload_json,
+                      updated_at=NOW()
+                ''',
+                (user_id, step, json.dumps(payload or {})),
+            )
+
+    async def clear_state(self, user_id: int):
+        async with self.db.cursor() as cur:
+            await cur.execute("DELETE FROM user_state WHERE user_id=%s", (user_id,))
+
+    async def get_state(self, user_id: int):
+        async with self.db.cursor() as cur:
+            await cur.execute("SELECT * FROM user_state WHERE user_id=%s", (user_id,))
+            return await cur.fetchone()
@@ -1,9 +1,98 @@
-from entity.db import Database
+from zoneinfo import ZoneInfo
+
+from entity.db import AsyncDatabase, Database
+
+# What UserProfileCache holds per user: the fields read on every update and job.
+PROFILE_SQL = """
+SELECT u.id, u.timezone, u.pd_consent, u.unreachable_at,
+       e.delivery_time, e.enrolled_at, e.is_active
+  FROM users u
+  LEFT JOIN enrollments e ON e.user_id = u.id AND e.is_active = TRUE
+ WHERE u.id = ANY(%s)
+"""
+
+# Telegram refused delivery for good (bot blocked, account deleted): flag the
+# user and drop everything planned for them in one statement. Cancelled
+# habit occurrences and a cleared planned_until let the habit planner
+# revive them once the user is back (mark_reachable).
+MARK_UNREACHABLE_SQL = """
+WITH flagged AS (
+    UPDATE users SET unreachable_at = NOW()
+     WHERE id = %(user_id)s AND unreachable_at IS NULL
+    RETURNING id
+),
+jobs AS (
+    UPDATE outbox_jobs SET status='cancelled', last_error=%(error)s
+     WHERE user_id = %(user_id)s AND status='pending'
+    RETURNING id
+),
+occurrences AS (
+    UPDATE habit_occurrences SET status='cancelled'
+     WHERE user_id = %(user_id)s AND status='planned' AND scheduled_at > NOW()
+    RETURNING id
+),
+horizons AS (
+    UPDATE habits SET planned_until = NULL
+     WHERE user_id = %(user_id)s AND planned_until IS NOT NULL
+    RETURNING id
+),
+dequeued AS (
+    DELETE FROM planner_queue WHERE user_id = %(user_id)s RETURNING user_id
+)
+SELECT (SELECT COUNT(*) FROM flagged) AS flagged, (SELECT COUNT(*) FROM jobs) AS cancelled
+"""
+
+# The user wrote to the bot again: clear the flag and replan them right away.
+MARK_REACHABLE_SQL = """
+WITH cleared AS (
+    UPDATE users SET unreachable_at = NULL
+     WHERE id = %s AND unreachable_at IS NOT NULL
+    RETURNING id
+)
+INSERT INTO planner_queue(user_id, reason, next_replan_at)
+SELECT id, 'reachable', NOW() FROM cleared
+ON CONFLICT (user_id) DO UPDATE
+  SET reason = EXCLUDED.reason, next_replan_at = NOW(), updated_at = NOW()
+"""
+
+
+def _zone(tz_name: str | None, default_tz: str) -> ZoneInfo:
+    try:
+        return ZoneInfo(tz_name or default_tz)
+    except Exception:
+        return ZoneInfo(default_tz)
+
+
+def _profiles(rows, user_ids: list[int], default_tz: str) -> dict:
+    out = {int(u): None for u in user_ids}
+    for r in rows:
+        uid = int(r["id"])
+        enrollment = None
+        if r.get("delivery_time") is not None:
+            enrollment = {
+                "user_id": uid,
+                "delivery_time": r["delivery_time"],
+                "enrolled_at": r.get("enrolled_at"),
+                "is_active": r.get("is_active"),
+            }
+        out[uid] = {
+            "timezone": r.get("timezone"),
+            "zone": _zone(r.get("timezone"), default_tz),
+            "pd_consent": bool(r.get("pd_consent")),
+            "unreachable": r.get("unreachable_at") is not None,
+            "enrollment": enrollment,
+        }
+    return out
+
 
 class UsersRepo:
     def __init__(self, db: Database):
         self.db = db
 
+    @property
+    def profiles(self):
+        return self.db.user_profiles
+
     def upsert_user(self, tg_id: int, username: str | None, display_name: str | None, timezone: str | None):
         with self.db.cursor() as cur:
             cur.execute(
@@ -16,15 +105,47 @@ class UsersRepo:
                       -- don't overwrite it on each ensure_user(...) call.
                       display_name = COALESCE(users.display_name, EXCLUDED.display_name),
                       timezone = COALESCE(EXCLUDED.timezone, users.timezone)
+                -- No new row version (and WAL) when nothing changes.
+                WHERE users.username IS DISTINCT FROM EXCLUDED.username
+                   OR (users.display_name IS NULL AND EXCLUDED.display_name IS NOT NULL)
+                   OR (EXCLUDED.timezone IS NOT NULL AND users.timezone IS DISTINCT FROM EXCLUDED.timezone)
                 ''',
                 (tg_id, username, display_name, timezone),
             )
+        self._after_upsert(tg_id, timezone)
+
+    def _after_upsert(self, tg_id: int, timezone: str | None):
+        # username/display_name are not part of the profile.
+        if timezone is None:
+            self.profiles.forget_unknown(tg_id)
+        else:
+            self.profiles.invalidate(tg_id)
 
     def get_user(self, tg_id: int):
         with self.db.cursor() as cur:
             cur.execute("SELECT * FROM users WHERE id=%s", (tg_id,))
             return cur.fetchone()
 
+    def get_profiles(self, tg_ids: list[int]) -> dict:
+        """user_id -> cached profile (timezone, zone, pd_consent, enrollment); None for unknown users."""
+
+        found, missing, generation = self.profiles.lookup(tg_ids)
+        if missing:
+            with self.db.cursor() as cur:
+                cur.execute(PROFILE_SQL, (missing,))
+                rows = cur.fetchall()
+            found.update(self.profiles.store(_profiles(rows, missing, self.db.settings.default_timezone), generation))
+        return found
+
+    def get_profile(self, tg_id: int) -> dict | None:
+        return self.get_profiles([tg_id]).get(int(tg_id))
+
+    def get_zone(self, tg_id: int) -> ZoneInfo:
+        """The user's ZoneInfo, DEFAULT_TIMEZONE when unset or invalid."""
+
+        profile = self.get_profile(tg_id)
+        return profile["zone"] if profile else _zone(None, self.db.settings.default_timezone)
+
     def get_by_username(self, username: str):
         uname = (username or "").strip().lstrip("@")
         if not uname:
@@ -43,17 +164,20 @@ class UsersRepo:
             return cur.fetchone()
 
     def get_timezone(self, tg_id: int) -> str | None:
-        with self.db.cursor() as cur:
-            cur.execute("SELECT timezone FROM users WHERE id=%s", (tg_id,))
-            row = cur.fetchone()
-            if not row:
-                return None
-            # psycopg2 returns dict rows in our DB wrapper
-            return row.get("timezone")
+        profile = self.get_profile(tg_id)
+        return profile["timezone"] if profile else None
+
+    def get_timezones(self, tg_ids: list[int]) -> dict[int, str | None]:
+        """Bulk get_timezone(): user_id -> timezone for the given (existing) users."""
+
+        if not tg_ids:
+            return {}
+        return {uid: p["timezone"] for uid, p in self.get_profiles(tg_ids).items() if p}
 
     def set_timezone(self, tg_id: int, tz: str):
         with self.db.cursor() as cur:
             cur.execute("UPDATE users SET timezone=%s WHERE id=%s", (tz, tg_id))
+        self.profiles.invalidate(tg_id)
 
     def update_display_name(self, tg_id: int, display_name: str):
         with self.db.cursor() as cur:
@@ -71,8 +195,93 @@ class UsersRepo:
                     "UPDATE users SET pd_consent=FALSE, pd_consent_at=NULL WHERE id=%s",
                     (tg_id,),
                 )
+        self.profiles.invalidate(tg_id)
+
+    def mark_reachable(self, tg_id: int) -> bool:
+        """Clear the unreachable flag (and queue a replan); False if it was not set.
+
+        Cheap when the flag is not set, so it is called on every update.
+        """
+
+        with self.db.cursor() as cur:
+            cur.execute(MARK_REACHABLE_SQL, (tg_id,))
+            cleared = cur.rowcount > 0
+        if cleared:
+            self.profiles.invalidate(tg_id)
+        return cleared
 
     def list_user_ids(self, limit: int = 20000):
         with self.db.cursor() as cur:
             cur.execute("SELECT id FROM users ORDER BY created_at DESC LIMIT %s", (limit,))
             return [int(r['id']) for r in cur.fetchall()]
+
+
+class AsyncUsersRepo:
+    """Awaitable subset of UsersRepo for hot handler paths."""
+
+    def __init__(self, db: AsyncDatabase):
+        self.db = db
+
+    @property
+    def profiles(self):
+        return self.db.user_profiles
+
+    async def upsert_user(self, tg_id: int, username: str | None, display_name: str | None, timezone: str | None):
+        async with self.db.cursor() as cur:
+            await cur.execute(
+                '''
+                INSERT INTO users(id, username, display_name, timezone)
+                VALUES (%s, %s, %s, %s)
+                ON CONFLICT (id) DO UPDATE
+                  SET username = EXCLUDED.username,
+                      display_name = COALESCE(users.display_name, EXCLUDED.display_name),
+                      timezone = COALESCE(EXCLUDED.timezone, users.timezone)
+                WHERE users.username IS DISTINCT FROM EXCLUDED.username
+                   OR (users.display_name IS NULL AND EXCLUDED.display_name IS NOT NULL)
+                   OR (EXCLUDED.timezone IS NOT NULL AND users.timezone IS DISTINCT FROM EXCLUDED.timezone)
+                ''',
+                (tg_id, username, display_name, timezone),
+            )
+        if timezone is None:
+            self.profiles.forget_unknown(tg_id)
+        else:
+            self.profiles.invalidate(tg_id)
+
+    async def get_user(self, tg_id: int):
+        async with self.db.cursor() as cur:
+            await cur.execute("SELECT * FROM users WHERE id=%s", (tg_id,))
+            return await cur.fetchone()
+
+    async def get_profile(self, tg_id: int) -> dict | None:
+        found, missing, generation = self.profiles.lookup([tg_id])
+        if missing:
+            async with self.db.cursor() as cur:
+                await cur.execute(PROFILE_SQL, (missing,))
+                rows = await cur.fetchall()
+            found.update(self.profiles.store(_profiles(rows, missing, self.db.settings.default_timezone), generation))
+        return found.get(int(tg_id))
+
+    async def get_timezone(self, tg_id: int) -> str | None:
+        profile = await self.get_profile(tg_id)
+        return profile["timezone"] if profile else None
+
+    async def mark_unreachable(self, tg_id: int, err: str) -> dict:
+        """Flag a user Telegram won't deliver to and cancel their pending jobs.
+
+        Returns {flagged, cancelled}; flagged is False when the user was
+        already unreachable.
+        """
+
+        async with self.db.cursor() as cur:
+            await cur.execute(MARK_UNREACHABLE_SQL, {"user_id": tg_id, "error": err[:1000]})
+            row = await cur.fetchone()
+        self.profiles.invalidate(tg_id)
+        return {"flagged": bool(row["flagged"]), "cancelled": int(row["cancelled"] or 0)}
+
+    async def mark_reachable(self, tg_id: int) -> bool:
+        async with self.db.cursor() as cur:
+            await cur.execute(MARK_REACHABLE_SQL, (tg_id,))
+            cleared = cur.rowcount > 0
+        if cleared:
+            self.profiles.invalidate(tg_id)
+        return cleared
@@ -35,6 +35,28 @@ class Settings:
     reminder_fallback_time: str
     habit_bonus_points: int
     habit_plan_days: int
+    db_pool_min_size: int = 1
+    db_pool_max_size: int = 10
+    db_pool_max_idle_sec: int = 300
+    db_pool_timeout_sec: int = 30
+    db_pool_stats_interval_sec: int = 300
+    outbox_batch_size: int = 50
+    outbox_concurrency: int = 8
+    outbox_lease_sec: int = 120
+    outbox_safety_poll_sec: int = 30
+    outbox_kind_limits: str = ""
+    outbox_lane_weights: str = "8,4,2,1"
+    outbox_coalesce_sec: int = 0
+    outbox_stats_interval_sec: int = 300
+    tg_global_rate_per_sec: float = 25.0
+    tg_per_chat_rate_per_sec: float = 1.0
+    content_cache_ttl_sec: int = 300
+    content_cache_check_sec: int = 5
+    user_cache_size: int = 10000
+    user_cache_ttl_sec: int = 60
+    personal_reminder_window_hours: int = 24
+    outbox_in_bot: bool = True
+    planner_in_outbox: bool = True
 
 def get_settings() -> Settings:
     token = os.getenv("BOT_TOKEN", "").strip()
@@ -58,4 +80,26 @@ def get_settings() -> Settings:
         reminder_fallback_time=os.getenv("FALLBACK_SEND_TIME", "09:30"),
         habit_bonus_points=int(os.getenv("HABIT_BONUS_POINTS", "3")),
         habit_plan_days=int(os.getenv("HABIT_PLAN_DAYS", "2")),
+        db_pool_min_size=int(os.getenv("DB_POOL_MIN_SIZE", "1")),
+        db_pool_max_size=int(os.getenv("DB_POOL_MAX_SIZE", "10")),
+        db_pool_max_idle_sec=int(os.getenv("DB_POOL_MAX_IDLE_SEC", "300")),
+        db_pool_timeout_sec=int(os.getenv("DB_POOL_TIMEOUT_SEC", "30")),
+        db_pool_stats_interval_sec=int(os.getenv("DB_POOL_STATS_INTERVAL_SEC", "300")),
+        outbox_batch_size=int(os.getenv("OUTBOX_BATCH_SIZE", "50")),
+        outbox_concurrency=int(os.getenv("OUTBOX_CONCURRENCY", "8")),
+        outbox_lease_sec=int(os.getenv("OUTBOX_LEASE_SEC", "120")),
+        outbox_safety_poll_sec=int(os.getenv("OUTBOX_SAFETY_POLL_SEC", "30")),
+        outbox_kind_limits=os.getenv("OUTBOX_KIND_LIMITS", ""),
+        outbox_lane_weights=os.getenv("OUTBOX_LANE_WEIGHTS", "8,4,2,1"),
+        outbox_coalesce_sec=int(os.getenv("OUTBOX_COALESCE_SEC", "0")),
+        outbox_stats_interval_sec=int(os.getenv("OUTBOX_STATS_INTERVAL_SEC", "300")),
+        tg_global_rate_per_sec=float(os.getenv("TG_GLOBAL_RATE_PER_SEC", "25")),
+        tg_per_chat_rate_per_sec=float(os.getenv("TG_PER_CHAT_RATE_PER_SEC", "1")),
+        content_cache_ttl_sec=int(os.getenv("CONTENT_CACHE_TTL_SEC", "300")),
+        content_cache_check_sec=int(os.getenv("CONTENT_CACHE_CHECK_SEC", "5")),
+        user_cache_size=int(os.getenv("USER_CACHE_SIZE", "10000")),
+        user_cache_ttl_sec=int(os.getenv("USER_CACHE_TTL_SEC", "60")),
+        personal_reminder_window_hours=int(os.getenv("PERSONAL_REMINDER_WINDOW_HOURS", "24")),
+        outbox_in_bot=os.getenv("OUTBOX_IN_BOT", "1") != "0",
+        planner_in_outbox=os.getenv("PLANNER_IN_OUTBOX", "1") != "0",
     )
@@ -0,0 +1,85 @@
+import threading
+import time
+from collections import OrderedDict
+
+# Marks "not cached" apart from a cached None (user does not exist yet).
+_MISS = object()
+
+
+def _copy(value):
+    # Profiles are small dicts (the enrollment is a nested dict): hand out
+    # copies so callers cannot edit cached ones. ZoneInfo objects are shared.
+    if isinstance(value, dict):
+        return {k: _copy(v) for k, v in value.items()}
+    return value
+
+
+class UserProfileCache:
+    """Per-process LRU+TTL cache of the user fields read on every update and job.
+
+    A profile is built by UsersRepo (timezone, its ZoneInfo, pd_consent and
+    the active enrollment); unknown users are cached as None. Writers of
+    those fields call `invalidate` after their UPDATE, and other processes
+    see the change within `ttl_sec`.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl_sec: float = 60.0, clock=time.monotonic):
+        self.max_size = int(max_size)
+        self.ttl_sec = float(ttl_sec)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: OrderedDict = OrderedDict()
+        self._generation = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0 and self.ttl_sec > 0
+
+    def lookup(self, user_ids) -> tuple[dict, list, int]:
+        """(cached user_id -> profile, missing user_ids, generation to pass to `store`)."""
+
+        now = self._clock()
+        found, missing = {}, []
+        with self._lock:
+            for uid in user_ids:
+                uid = int(uid)
+                hit = self._entries.get(uid, _MISS) if self.enabled else _MISS
+                if hit is not _MISS and hit[0] > now:
+                    self._entries.move_to_end(uid)
+                    found[uid] = _copy(hit[1])
+                else:
+                    missing.append(uid)
+            return found, missing, self._generation
+
+    def store(self, profiles: dict, generation: int) -> dict:
+        """Cache freshly loaded profiles (skipped if invalidated meanwhile); return copies."""
+
+        if self.enabled:
+            expires_at = self._clock() + self.ttl_sec
+            with self._lock:
+                if generation == self._generation:
+                    for uid, profile in profiles.items():
+                        self._entries[int(uid)] = (expires_at, profile)
+                        self._entries.move_to_end(int(uid))
+                    while len(self._entries) > self.max_size:
+                        self._entries.popitem(last=False)
+        return {int(uid): _copy(p) for uid, p in profiles.items()}
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self._entries.pop(int(user_id), None)
+            self._generation += 1
+
+    def forget_unknown(self, user_id: int):
+        """Drop a cached "no such user", e.g. once the user row was inserted."""
+
+        with self._lock:
+            hit = self._entries.get(int(user_id))
+            if hit is not None and hit[1] is None:
+                del self._entries[int(user_id)]
+                self._generation += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
@@ -34,8 +34,8 @@ def register_learning_handlers(app, settings, services):
         if not achievement_svc:
             return
         try:
-            tz_name = user_svc.get_timezone(uid) if user_svc else None
-            rows = achievement_svc.evaluate(uid, user_timezone=tz_name)
+            tz_name = (await user_svc.get_timezone_async(uid)) if user_svc else None
+            rows = await asyncio.to_thread(achievement_svc.evaluate, uid, user_timezone=tz_name)
         except Exception:
             return
         text = _achievement_lines(rows)
@@ -56,13 +56,12 @@ def register_learning_handlers(app, settings, services):
         day_index = int(payload["day_index"])
         points = int(payload["points"])
 
-        if learning.has_viewed_lesson(q.from_user.id, day_index):
+        if await learning.has_viewed_lesson_async(q.from_user.id, day_index):
             await q.edit_message_reply_markup(reply_markup=None)
             await context.bot.send_message(chat_id=q.from_user.id, text="✅ Уже засчитано.")
             return
 
-        learning.mark_viewed_today(q.from_user.id, day_index)
-        learning.points.add_points(q.from_user.id, "lesson_viewed", f"day:{day_index}", points)
+        await learning.mark_lesson_viewed_async(q.from_user.id, day_index, points)
         await q.edit_message_reply_markup(reply_markup=None)
         await context.bot.send_message(chat_id=q.from_user.id, text=f"✅ Просмотрено! +{points} баллов")
         await _notify_achievements(q.from_user.id, context)
@@ -79,12 +78,12 @@ def register_learning_handlers(app, settings, services):
         points = int(payload["points"])
         source_key = f"extra:{material_id}"
 
-        if learning.points.has_entry(q.from_user.id, "extra_viewed", source_key):
+        if await learning.points_async.has_entry(q.from_user.id, "extra_viewed", source_key):
             await q.edit_message_reply_markup(reply_markup=None)
             await context.bot.send_message(chat_id=q.from_user.id, text="✅ Уже засчитано.")
             return
 
-        learning.points.add_points(q.from_user.id, "extra_viewed", source_key, points)
+        await learning.points_async.add_points(q.from_user.id, "extra_viewed", source_key, points)
         await q.edit_message_reply_markup(reply_markup=None)
         if points > 0:
             await context.bot.send_message(chat_id=q.from_user.id, text=f"✅ Просмотрено! +{points} баллов")
@@ -107,7 +106,7 @@ def register_learning_handlers(app, settings, services):
         except Exception:
             return
 
-        if learning.has_quest_answer(q.from_user.id, day_index):
+        if await learning.has_quest_answer_async(q.from_user.id, day_index):
             try:
                 await q.edit_message_reply_markup(reply_markup=None)
             except Exception:
@@ -120,7 +119,7 @@ def register_learning_handlers(app, settings, services):
             await context.bot.send_message(chat_id=q.from_user.id, text="⚠️ Не нашёл задание для этого дня.")
             return
 
-        learning.state.set_state(
+        await learning.state_async.set_state(
             q.from_user.id,
             "last_quest",
             {
@@ -157,7 +156,7 @@ def register_learning_handlers(app, settings, services):
         if not update.effective_message.text or update.effective_message.text.startswith("/"):
             return
 
-        st = learning.state.get_state(update.effective_user.id)
+        st = await learning.state_async.get_state(update.effective_user.id)
         if st and st.get("step") in (AI_STEP, AI_CHAT_STEP):
             await _ai_chat(update, context, st)
             return
@@ -168,7 +167,7 @@ def register_learning_handlers(app, settings, services):
     # Submit quest answer
     # ----------------------------
     async def _submit(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str):
-        st = learning.state.get_state(update.effective_user.id)
+        st = await learning.state_async.get_state(update.effective_user.id)
         if not st or not st.get("payload_json"):
             return
 
@@ -184,7 +183,7 @@ def register_learning_handlers(app, settings, services):
         if day_index <= 0:
             return
 
-        learning.submit_answer(update.effective_user.id, day_index, points, text)
+        await learning.submit_answer_async(update.effective_user.id, day_index, points, text)
         await update.effective_message.reply_text(f"✅ Ответ принят! +{points} баллов")
         await _notify_achievements(update.effective_user.id, context)
 
@@ -227,7 +226,7 @@ def register_learning_handlers(app, settings, services):
 
             await update.effective_message.reply_text(fb)
 
-            learning.state.set_state(
+            await learning.state_async.set_state(
                 update.effective_user.id,
                 AI_CHAT_STEP,
                 {
@@ -261,12 +260,12 @@ def register_learning_handlers(app, settings, services):
                 return
 
             if not ai:
-                learning.state.clear_state(update.effective_user.id)
+                await learning.state_async.clear_state(update.effective_user.id)
                 return
 
             enabled_fn = getattr(ai, "enabled", None)
             if callable(enabled_fn) and not enabled_fn():
-                learning.state.clear_state(update.effective_user.id)
+                await learning.state_async.clear_state(update.effective_user.id)
                 return
 
             quest_text = payload.get("quest_text") or ""
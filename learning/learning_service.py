@@ -1,23 +1,64 @@
-from entity.repositories.state_repo import StateRepo
-from entity.repositories.progress_repo import ProgressRepo
-from entity.repositories.points_repo import PointsRepo
-from entity.repositories.answers_repo import AnswersRepo
+from contextlib import asynccontextmanager, nullcontext
+
+from entity.repositories.state_repo import AsyncStateRepo, StateRepo
+from entity.repositories.progress_repo import AsyncProgressRepo, ProgressRepo
+from entity.repositories.points_repo import AsyncPointsRepo, PointsRepo
+from entity.repositories.answers_repo import AnswersRepo, AsyncAnswersRepo
+from entity.repositories.open_items_repo import AsyncOpenItemsRepo, OpenItemsRepo
 
 class LearningService:
     def __init__(self, db, settings):
+        self.db = db
         self.state = StateRepo(db)
         self.progress = ProgressRepo(db)
         self.points = PointsRepo(db)
         self.answers = AnswersRepo(db)
+        self.open_items = OpenItemsRepo(db)
+        # Awaitable repos for handler hot paths (don't block the event loop).
+        self.state_async = AsyncStateRepo(db.aio)
+        self.progress_async = AsyncProgressRepo(db.aio)
+        self.points_async = AsyncPointsRepo(db.aio)
+        self.answers_async = AsyncAnswersRepo(db.aio)
+        self.open_items_async = AsyncOpenItemsRepo(db.aio)
+
+    def _transaction(self):
+        db = getattr(self, "db", None)
+        return db.transaction() if db is not None else nullcontext()
+
+    @asynccontextmanager
+    async def _transaction_async(self):
+        db = getattr(self, "db", None)
+        if db is None:
+            yield None
+            return
+        async with db.aio.transaction() as conn:
+            yield conn
 
     def mark_viewed_today(self, user_id: int, day_index: int):
         self.progress.mark_viewed(user_id, day_index)
 
     def submit_answer(self, user_id: int, day_index: int, points: int, answer_text: str):
-        self.answers.save(user_id, day_index, answer_text)
-        self.points.add_points(user_id, "quest", f"day:{day_index}", points)
-        self.progress.mark_done(user_id, day_index)
-        self.state.clear_state(user_id)
+        # One unit of work: answer, points, progress and state commit together.
+        with self._transaction():
+            self.answers.save(user_id, day_index, answer_text)
+            self.points.add_points(user_id, "quest", f"day:{day_index}", points)
+            self.progress.mark_done(user_id, day_index)
+            self.open_items.close(user_id, "quest", day_index)
+            self.state.clear_state(user_id)
+
+    async def mark_lesson_viewed_async(self, user_id: int, day_index: int, points: int):
+        async with self._transaction_async():
+            await self.progress_async.mark_viewed(user_id, day_index)
+            await self.points_async.add_points(user_id, "lesson_viewed", f"day:{day_index}", points)
+            await self.open_items_async.close(user_id, "lesson", day_index)
+
+    async def submit_answer_async(self, user_id: int, day_index: int, points: int, answer_text: str):
+        async with self._transaction_async():
+            await self.answers_async.save(user_id, day_index, answer_text)
+            await self.points_async.add_points(user_id, "quest", f"day:{day_index}", points)
+            await self.progress_async.mark_done(user_id, day_index)
+            await self.open_items_async.close(user_id, "quest", day_index)
+            await self.state_async.clear_state(user_id)
 
     def has_quest_answer(self, user_id: int, day_index: int) -> bool:
         return bool(getattr(self.answers, "exists_for_day", None) and self.answers.exists_for_day(user_id, day_index))
@@ -25,3 +66,9 @@ class LearningService:
     def has_viewed_lesson(self, user_id: int, day_index: int) -> bool:
         # lesson viewed points are written with source_type='lesson_viewed' and source_key='day:<n>'
         return bool(getattr(self.points, "has_entry", None) and self.points.has_entry(user_id, "lesson_viewed", f"day:{day_index}"))
+
+    async def has_quest_answer_async(self, user_id: int, day_index: int) -> bool:
+        return await self.answers_async.exists_for_day(user_id, day_index)
+
+    async def has_viewed_lesson_async(self, user_id: int, day_index: int) -> bool:
+        return await self.points_async.has_entry(user_id, "lesson_viewed", f"day:{day_index}")
@@ -5,61 +5,19 @@ from datetime import time as dtime, timezone
 from telegram.error import NetworkError, TimedOut
 from telegram.ext import Application
 
-from entity.db import Database
-from entity.settings import get_settings
-
 from admin.admin_handlers import register_admin_handlers
-from admin.admin_service import AdminService
-from analytics.admin_analytics_service import AdminAnalyticsService
-from analytics.analytics_service import AnalyticsService
-from core.achievement_service import AchievementService
-from core.ai_feedback_service import AiFeedbackService
-from core.daily_pack_service import DailyPackService
-from core.habit_service import HabitService
-from core.mood_service import MoodService
-from core.personal_reminder_service import PersonalReminderService
-from core.support_service import SupportService
+from core.wiring import bootstrap
 from debug.trace import register_trace
 from learning.learning_handlers import register_learning_handlers
-from learning.learning_service import LearningService
 from questionnaires.questionnaire_handlers import register_questionnaire_handlers
-from questionnaires.questionnaire_service import QuestionnaireService
-from scheduling.habit_schedule_service import HabitScheduleService
-from scheduling.personal_reminder_schedule_service import PersonalReminderScheduleService
-from scheduling.schedule_service import ScheduleService
-from scheduling.worker import tick
+from scheduling.worker import run_outbox_loop
 from user.user_handlers import register_user_handlers
-from user.user_service import UserService
 
-logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
 log = logging.getLogger("happines_course")
 
 
 def main():
-    settings = get_settings()
-    db = Database(settings)
-    db.init_schema()
-
-    services = {
-        "user": UserService(db, settings),
-        "learning": LearningService(db, settings),
-        "schedule": ScheduleService(db, settings),
-        "analytics": AnalyticsService(db, settings),
-        "admin_analytics": AdminAnalyticsService(db, settings),
-        "questionnaire": QuestionnaireService(db, settings),
-        "admin": AdminService(db, settings),
-        "ai": AiFeedbackService(),
-        "achievement": AchievementService(db, settings),
-        "habit": HabitService(db, settings),
-        "habit_schedule": HabitScheduleService(db, settings),
-        "personal_reminder": PersonalReminderService(db, settings),
-        "personal_reminder_schedule": PersonalReminderScheduleService(db, settings),
-        "support": SupportService(db, settings),
-        "mood": MoodService(db, settings),
-    }
-
-    # Daily packs (quote/tip/image/film/book) generated by UTC day.
-    services["daily_pack"] = DailyPackService(db, settings, services["ai"], services["schedule"])
+    settings, db, services = bootstrap()
 
     # Increase request timeouts to survive short Telegram/API network spikes.
     app = (
@@ -87,9 +45,29 @@ def main():
     register_questionnaire_handlers(app, settings, services)
     register_learning_handlers(app, settings, services)
 
-    # Scheduler tick: fast polling for due outbox jobs.
-    # Heavy planning work is throttled inside scheduling.worker.tick.
-    app.job_queue.run_repeating(lambda ctx: tick(ctx, services), interval=3, first=3)
+    # Outbox delivery loop: wakes on NOTIFY from new jobs or at the next run_at.
+    # Heavy planning work is throttled inside scheduling.worker. With
+    # OUTBOX_IN_BOT=0 delivery runs in `python -m scheduling.worker` instead.
+    outbox_loop: asyncio.Task | None = None
+
+    async def _start_outbox_loop(application):
+        nonlocal outbox_loop
+        if not getattr(settings, "outbox_in_bot", True):
+            log.info("outbox delivery runs in a separate worker process")
+            return
+        plan = bool(getattr(settings, "planner_in_outbox", True))
+        outbox_loop = asyncio.create_task(run_outbox_loop(application, services, plan=plan))
+
+    async def _stop_outbox_loop(application):
+        if outbox_loop is not None:
+            outbox_loop.cancel()
+            try:
+                await outbox_loop
+            except asyncio.CancelledError:
+                pass
+
+    app.post_init = _start_outbox_loop
+    app.post_stop = _stop_outbox_loop
 
     # Generate a new daily pack every day at 00:00 UTC (for everyone).
     async def _gen_daily_pack(context):
@@ -114,6 +92,14 @@ def main():
 
     app.job_queue.run_once(_startup_gen, when=1)
 
+    # Periodic DB pool usage line (size / in-use / waiting / checkout latency).
+    async def _log_pool_stats(context):
+        db.log_pool_stats()
+
+    stats_interval = int(getattr(settings, "db_pool_stats_interval_sec", 300) or 0)
+    if stats_interval > 0:
+        app.job_queue.run_repeating(_log_pool_stats, interval=stats_interval, first=stats_interval)
+
     async def on_error(update, context):
         err = context.error
         log.exception("Unhandled error", exc_info=err)
@@ -130,8 +116,16 @@ def main():
 
     app.add_error_handler(on_error)
 
+    async def _close_async_db(application):
+        await db.aio.close()
+
+    app.post_shutdown = _close_async_db
+
     log.info("Bot started")
-    app.run_polling(allowed_updates=None)
+    try:
+        app.run_polling(allowed_updates=None)
+    finally:
+        db.close()
 
 
 if __name__ == "__main__":
@@ -1,6 +1,9 @@
 import json
+from contextlib import nullcontext
+
 from entity.repositories.questionnaire_repo import QuestionnaireRepo
 from entity.repositories.questionnaire_responses_repo import QuestionnaireResponsesRepo
+from entity.repositories.open_items_repo import OpenItemsRepo
 from entity.repositories.points_repo import PointsRepo
 from entity.repositories.state_repo import StateRepo
 
@@ -8,10 +11,12 @@ STEP_WAIT_Q_COMMENT = "wait_q_comment"
 
 class QuestionnaireService:
     def __init__(self, db, settings):
+        self.db = db
         self.q = QuestionnaireRepo(db)
         self.r = QuestionnaireResponsesRepo(db)
         self.points = PointsRepo(db)
         self.state = StateRepo(db)
+        self.open_items = OpenItemsRepo(db)
 
     def create(
         self,
@@ -50,6 +55,10 @@ class QuestionnaireService:
     def delete(self, qid: int) -> bool:
         return self.q.delete(qid)
 
+    def _transaction(self):
+        db = getattr(self, "db", None)
+        return db.transaction() if db is not None else nullcontext()
+
     @staticmethod
     def _score_key(qid: int) -> str:
         return f"q:{qid}"
@@ -67,19 +76,23 @@ class QuestionnaireService:
         self.state.set_state(user_id, STEP_WAIT_Q_COMMENT, {"questionnaire_id": qid, "score": score})
 
     def submit_score_only(self, user_id: int, qid: int, score: int, points: int) -> bool:
-        if self.q.has_user_response(user_id, qid):
-            return False
-        self._add_score_points_once(user_id, qid, points)
-        self.r.add(qid, user_id, score, "")
-        return True
+        with self._transaction():
+            if self.q.has_user_response(user_id, qid):
+                return False
+            self._add_score_points_once(user_id, qid, points)
+            self.r.add(qid, user_id, score, "")
+            self.open_items.close(user_id, "questionnaire", item_id=qid)
+            return True
 
     def save_comment(self, user_id: int, qid: int, score: int, comment: str) -> bool:
-        if self.q.has_user_response(user_id, qid):
+        with self._transaction():
+            if self.q.has_user_response(user_id, qid):
+                self.state.clear_state(user_id)
+                return False
+            qrow = self.q.get(qid)
+            points = int((qrow or {}).get("points") or 0)
+            self._add_score_points_once(user_id, qid, points)
+            self.r.add(qid, user_id, score, comment)
+            self.open_items.close(user_id, "questionnaire", item_id=qid)
             self.state.clear_state(user_id)
-            return False
-        qrow = self.q.get(qid)
-        points = int((qrow or {}).get("points") or 0)
-        self._add_score_points_once(user_id, qid, points)
-        self.r.add(qid, user_id, score, comment)
-        self.state.clear_state(user_id)
-        return True
+            return True
@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from dataclasses import dataclass
+
+SENT = "sent"
+SKIPPED = "skipped"  # prepared, nothing to send (already done / content gone)
+RETRIED = "retried"
+FAILED = "failed"
+
+
+@dataclass
+class KindStats:
+    sent: int = 0
+    skipped: int = 0
+    retried: int = 0
+    failed: int = 0
+    total_sec: float = 0.0
+    max_sec: float = 0.0
+
+    @property
+    def count(self) -> int:
+        return self.sent + self.skipped + self.retried + self.failed
+
+    def as_dict(self) -> dict:
+        avg_ms = 1000.0 * self.total_sec / self.count if self.count else 0.0
+        return {
+            "sent": self.sent,
+            "skipped": self.skipped,
+            "retried": self.retried,
+            "failed": self.failed,
+            "avg_ms": round(avg_ms, 1),
+            "max_ms": round(1000.0 * self.max_sec, 1),
+        }
+
+
+class DeliveryStats:
+    """Per-kind outbox delivery outcomes and latency (claim to sent/failed) since the last report."""
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._kinds: dict[str, KindStats] = {}
+        self.since = clock()
+
+    def observe(self, kind: str | None, outcome: str, seconds: float):
+        with self._lock:
+            stats = self._kinds.setdefault(kind or "unknown", KindStats())
+            setattr(stats, outcome, getattr(stats, outcome) + 1)
+            stats.total_sec += seconds
+            stats.max_sec = max(stats.max_sec, seconds)
+
+    def snapshot(self) -> dict[str, dict]:
+        with self._lock:
+            return {kind: stats.as_dict() for kind, stats in sorted(self._kinds.items())}
+
+    def report(self, logger: logging.Logger):
+        """Log one line per kind and start a new interval."""
+
+        with self._lock:
+            kinds, self._kinds = self._kinds, {}
+            elapsed = self._clock() - self.since
+            self.since = self._clock()
+        for kind, stats in sorted(kinds.items()):
+            logger.info(
+                "outbox stats kind=%s interval_sec=%.0f %s",
+                kind,
+                elapsed,
+                " ".join(f"{k}={v}" for k, v in stats.as_dict().items()),
+            )
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import logging
+from contextlib import nullcontext
 from datetime import datetime, date, time, timedelta, timezone
 from zoneinfo import ZoneInfo
 
@@ -16,12 +17,15 @@ class HabitScheduleService:
     """Plans habit occurrences and puts reminder jobs into outbox_jobs.
 
     Strategy:
-    - Periodically (e.g., hourly) create occurrences + outbox jobs for the next N days.
+    - Periodically create occurrences + outbox jobs for the next N days; each
+      habit remembers how far it is planned (planned_until), so a pass only
+      adds the newly opened edge of the horizon.
     - Idempotency: habit_occurrences has UNIQUE(habit_id, scheduled_at) + outbox has job_key.
     - All calculations are performed in user's timezone, stored in UTC.
     """
 
     def __init__(self, db, settings):
+        self.db = db
         self.settings = settings
         self.habits = HabitsRepo(db)
         self.occ = HabitOccurrencesRepo(db)
@@ -41,11 +45,7 @@ class HabitScheduleService:
             return time(hh, mm)
 
     def _user_tz(self, user_id: int) -> ZoneInfo:
-        tz_name = self.users.get_timezone(user_id) or self.settings.default_timezone
-        try:
-            return ZoneInfo(tz_name)
-        except Exception:
-            return ZoneInfo(self.settings.default_timezone)
+        return self.users.get_zone(user_id)
 
     @staticmethod
     def _matches_frequency(d: date, frequency: str) -> bool:
@@ -62,60 +62,97 @@ class HabitScheduleService:
         except Exception:
             return 2
 
-    def schedule_due_jobs(self) -> int:
-        """Plan occurrences & outbox jobs for all active habits."""
+    def schedule_due_jobs(self, user_ids: list[int] | None = None) -> int:
+        """Plan occurrences & outbox jobs for active habits (of `user_ids`, or everyone).
+
+        Slots are computed in memory; only those past each habit's
+        planned_until (the horizon edge of earlier passes) are written, as one
+        occurrence upsert, one outbox insert and one planned_until update.
+        """
 
-        created = 0
         now_utc = datetime.now(timezone.utc)
-        habits = self.habits.list_active()
+        horizon = self.plan_horizon_days()
+        habits = self.habits.list_active(user_ids)
 
         # Group by user to avoid computing tz repeatedly.
         by_user: dict[int, list[dict]] = {}
         for h in habits:
             by_user.setdefault(int(h["user_id"]), []).append(h)
 
+        slots = []  # (user_id, habit, local date, local time, run_at_utc)
+        edges: dict[int, datetime] = {}
         for user_id, hs in by_user.items():
             tz = self._user_tz(user_id)
             today_local = now_utc.astimezone(tz).date()
-            horizon = self.plan_horizon_days()
-
-            for i in range(horizon + 1):
-                d_local = today_local + timedelta(days=i)
-                for h in hs:
+            for h in hs:
+                habit_id = int(h["id"])
+                planned_until = h.get("planned_until")
+                t_local = self._parse_hhmm(h.get("remind_time") or "09:00", "09:00")
+                edge = None
+                for i in range(horizon + 1):
+                    d_local = today_local + timedelta(days=i)
+                    run_at_utc = datetime.combine(d_local, t_local, tzinfo=tz).astimezone(timezone.utc)
+                    edge = run_at_utc
+                    if planned_until is not None and run_at_utc <= planned_until:
+                        continue
                     if not self._matches_frequency(d_local, (h.get("frequency") or "daily")):
                         continue
-
-                    t_local = self._parse_hhmm(h.get("remind_time") or "09:00", "09:00")
-                    local_dt = datetime.combine(d_local, t_local, tzinfo=tz)
-                    run_at_utc = local_dt.astimezone(timezone.utc)
-
                     # Don't plan jobs too far in the past.
                     if run_at_utc < now_utc - timedelta(minutes=5):
                         continue
-
-                    occurrence_id = self.occ.ensure_planned(
-                        int(h["id"]), user_id, run_at_utc.isoformat()
+                    slots.append((user_id, h, d_local, t_local, run_at_utc))
+                if edge is not None and (planned_until is None or edge > planned_until):
+                    edges[habit_id] = edge
+
+        if not slots and not edges:
+            return 0
+
+        with self._transaction():
+            occurrence_ids = self.occ.insert_planned_bulk(
+                [(int(h["id"]), user_id, run_at_utc.isoformat()) for user_id, h, _d, _t, run_at_utc in slots]
+            )
+            jobs = []
+            for user_id, h, d_local, t_local, run_at_utc in slots:
+                occurrence_id = occurrence_ids.get((int(h["id"]), run_at_utc))
+                if not occurrence_id:
+                    continue  # planned (with its job) by an earlier pass
+                jobs.append(
+                    (
+                        user_id,
+                        run_at_utc.isoformat(),
+                        {
+                            "kind": "habit_reminder",
+                            "habit_id": int(h["id"]),
+                            "occurrence_id": int(occurrence_id),
+                            "title": h.get("title") or "Привычка",
+                            "job_key": f"habit:{h['id']}:{occurrence_id}",
+                            "for_local_date": d_local.isoformat(),
+                            "for_local_time": t_local.strftime("%H:%M"),
+                        },
                     )
-                    if not occurrence_id:
-                        continue
-
-                    job_key = f"habit:{h['id']}:{occurrence_id}"
-                    if self.outbox.exists_job_for(user_id, job_key):
-                        continue
-
-                    payload = {
-                        "kind": "habit_reminder",
-                        "habit_id": int(h["id"]),
-                        "occurrence_id": int(occurrence_id),
-                        "title": h.get("title") or "Привычка",
-                        "job_key": job_key,
-                        "for_local_date": d_local.isoformat(),
-                        "for_local_time": t_local.strftime("%H:%M"),
-                    }
-
-                    self.outbox.create_job(user_id, run_at_utc.isoformat(), payload)
-                    created += 1
+                )
+            created = len(self.outbox.create_jobs_bulk(jobs))
+            self.habits.set_planned_until({hid: edge.isoformat() for hid, edge in edges.items()})
 
         if created:
             log.info("habit schedule created=%s", created)
         return created
+
+    def cancel_future_for_user(self, user_id: int, now_utc: datetime | None = None) -> int:
+        """Drop the user's future habit slots so the next pass plans them again.
+
+        Slots are stored in UTC: after a timezone change every planned
+        occurrence and its pending reminder job points at the wrong instant.
+        """
+
+        from_utc_iso = (now_utc or datetime.now(timezone.utc)).isoformat()
+        with self._transaction():
+            self.habits.reset_planned_for_user(user_id)
+            self.occ.cancel_future_for_user(user_id, from_utc_iso)
+            cancelled = self.outbox.cancel_future_jobs(user_id, kinds=["habit_reminder"], from_utc_iso=from_utc_iso)
+        log.info("habit schedule reset user_id=%s cancelled=%s", user_id, cancelled)
+        return cancelled
+
+    def _transaction(self):
+        db = getattr(self, "db", None)
+        return db.transaction() if db is not None else nullcontext()
@@ -0,0 +1,698 @@
+"""Outbox job handlers, one per payload `kind`.
+
+The worker claims a job, finds its handler with `handler_for(kind)` and
+drives it through the same steps for every kind:
+
+- `prepare`: load what the job needs (content, backlog, ...) and decide
+  whether there is anything to send; False records the job without sending.
+- `send`: the Telegram calls, under the kind's concurrency/rate limits.
+- `bookkeeping`: a blocking callable committed together with mark_sent
+  (one unit of work), or None to only mark the job sent.
+
+`prepare` and `send` run on the event loop: reads go through the async
+repos, and blocking repos only through asyncio.to_thread.
+
+With OUTBOX_COALESCE_SEC the worker may instead merge several prepared
+jobs of one user into one message built from each handler's `render`.
+
+Each handler also carries its kind's limits; OUTBOX_KIND_LIMITS overrides
+them without a code change.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from contextlib import AsyncExitStack, asynccontextmanager, nullcontext
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from event_bus import callbacks as cb
+from questionnaires.questionnaire_handlers import q_buttons
+from scheduling.rate_limiter import TokenBucket
+
+log = logging.getLogger("worker")
+
+
+def _transaction(schedule):
+    db = getattr(schedule, "db", None)
+    return db.transaction() if db is not None else nullcontext()
+
+
+def finish_job(schedule, job_id: int, bookkeeping=None):
+    """Run post-send bookkeeping and mark the outbox job sent as one unit of work."""
+
+    with _transaction(schedule):
+        if bookkeeping is not None:
+            bookkeeping()
+        schedule.outbox.mark_sent(job_id)
+
+
+def _save_material_message(
+    schedule,
+    user_id: int,
+    day_index: int,
+    kind: str,
+    message_id: int,
+    content_id: int = 0,
+):
+    """Best-effort save of sent message id for reminder navigation."""
+
+    if day_index <= 0 or message_id <= 0:
+        return
+    try:
+        repo = getattr(schedule, "material_messages", None)
+        if not repo:
+            return
+        # Savepoint when called inside a unit of work: a failure here must not abort it.
+        with _transaction(schedule):
+            repo.upsert(
+                user_id=user_id,
+                day_index=day_index,
+                kind=kind,
+                message_id=message_id,
+                content_id=content_id,
+            )
+    except Exception:
+        pass
+
+
+def _format_backlog(items: list[dict]):
+    """Reminder lines and first unfinished lesson/quest/questionnaire from backlog rows."""
+
+    pending = []
+    first_lesson_day = None
+    first_quest_day = None
+    first_questionnaire = None
+
+    for item in items:
+        d = int(item["day_index"])
+        kind = item["kind"]
+        if kind == "lesson":
+            pending.append(f"• 📚 День {d}: лекция — не отмечена «Просмотрено»")
+            if first_lesson_day is None:
+                first_lesson_day = d
+        elif kind == "quest":
+            pending.append(f"• 📝 День {d}: задание — нет ответа")
+            if first_quest_day is None:
+                first_quest_day = d
+        elif kind == "questionnaire":
+            if first_questionnaire is None:
+                first_questionnaire = (d, int(item["questionnaire_id"]))
+            pending.append(f"• 📋 День {d}: анкета — нет ответа")
+
+    return pending, first_lesson_day, first_quest_day, first_questionnaire
+
+
+async def _collect_pending_backlog(schedule, user_id: int, day_index: int):
+    """Collect unfinished items from day 1..day_index for cumulative reminders (one query)."""
+
+    items = await schedule.backlog_async.unfinished(user_id, day_index)
+    return _format_backlog(items)
+
+
+async def _job_content(schedule, payload: dict, field: str):
+    """Lesson/quest/extra body of a job: a content snapshot, or embedded (older jobs)."""
+
+    body = payload.get(field)
+    if body is None and payload.get("snapshot_id"):
+        body = await schedule.snapshots_async.get(int(payload["snapshot_id"]))
+    return body
+
+
+def _lesson_text(day_index: int, lesson: dict) -> str:
+    title = lesson.get("title") or f"День {day_index}"
+    desc = lesson.get("description") or ""
+    video = lesson.get("video_url") or ""
+    text = f"📚 Лекция дня {day_index}\n{title}\n\n{desc}"
+    if video:
+        text += f"\n\n🎥 {video}"
+    return text
+
+
+def _lesson_kb(schedule, day_index: int, lesson: dict):
+    pts = int(lesson.get("points_viewed") or 0)
+    viewed_cb = schedule.make_viewed_cb(day_index, pts)
+    return InlineKeyboardMarkup([[InlineKeyboardButton("Просмотрено", callback_data=viewed_cb)]])
+
+
+def _quest_kb(day_index: int):
+    reply_cb = f"{cb.QUEST_REPLY_PREFIX}{day_index}"
+    return InlineKeyboardMarkup([[InlineKeyboardButton("✍️ Ответить на задание", callback_data=reply_cb)]])
+
+
+def _last_quest_state(day_index: int, quest: dict) -> dict:
+    return {"day_index": day_index, "points": int(quest["points"]), "prompt": quest.get("prompt")}
+
+
+def _quest_text(day_index: int, quest: dict) -> str:
+    return (
+        f"📝 Задание дня {day_index}:\n{quest['prompt']}\n\n"
+        "Нажми кнопку ниже, чтобы продолжить, или просто ответь сообщением в чат."
+    )
+
+
+async def _send_quest_message(bot, user_id: int, day_index: int, quest: dict, kb):
+    qtext = _quest_text(day_index, quest)
+    photo_file_id = quest.get("photo_file_id")
+    if photo_file_id:
+        try:
+            return await bot.send_photo(
+                chat_id=user_id,
+                photo=photo_file_id,
+                caption=qtext,
+                reply_markup=kb,
+            )
+        except Exception:
+            # Fallback to text message (e.g. invalid file_id or caption limits)
+            pass
+    return await bot.send_message(chat_id=user_id, text=qtext, reply_markup=kb)
+
+
+def _extra_text(day_index: int, extra: dict) -> str:
+    text = f"🧩 Дополнительный материал дня {day_index}\n\n{extra.get('content_text') or ''}".strip()
+    link_url = (extra.get("link_url") or "").strip()
+    if link_url:
+        text += f"\n\n🔗 {link_url}"
+    return text
+
+
+async def _send_extra_message(bot, user_id: int, day_index: int, extra: dict, kb):
+    text = _extra_text(day_index, extra)
+    photo_file_id = extra.get("photo_file_id")
+    if photo_file_id:
+        try:
+            return await bot.send_photo(
+                chat_id=user_id,
+                photo=photo_file_id,
+                caption=text,
+                reply_markup=kb,
+            )
+        except Exception:
+            pass
+    return await bot.send_message(chat_id=user_id, text=text, reply_markup=kb)
+
+
+async def _resolve_for_date(schedule, user_id: int, for_date_s: str | None):
+    if for_date_s:
+        return datetime.fromisoformat(for_date_s).date()
+    # Older jobs without for_date: the profile lookup may hit the database.
+    user_tz = await asyncio.to_thread(schedule._user_tz, user_id)
+    return datetime.now(timezone.utc).astimezone(user_tz).date()
+
+
+def _optional_date(for_date_s: str | None):
+    return datetime.fromisoformat(for_date_s).date() if for_date_s else None
+
+
+@dataclass
+class Delivery:
+    """One claimed outbox job on its way through a handler."""
+
+    bot: object
+    services: dict
+    job_id: int
+    user_id: int
+    kind: str | None
+    payload: dict
+    # Handler scratch space: loaded content, sent message ids, flags.
+    state: dict = field(default_factory=dict)
+    # Set by the worker once `send` returned.
+    sent: bool = False
+    # Set by handlers sending several messages once the first one went out:
+    # a failure after that must not retry (and resend) the job.
+    delivered: bool = False
+
+    @property
+    def schedule(self):
+        return self.services["schedule"]
+
+
+class JobHandler:
+    """Base handler: subclasses set `kind` and implement `send`."""
+
+    kind = ""
+    # Max jobs of this kind in flight per worker batch (None: only OUTBOX_CONCURRENCY).
+    concurrency: int | None = None
+    # Sends per second for this kind on top of the global Telegram limits (None: no extra limit).
+    rate_per_sec: float | None = None
+
+    async def prepare(self, d: Delivery) -> bool:
+        return True
+
+    async def send(self, d: Delivery):
+        raise NotImplementedError
+
+    def render(self, d: Delivery) -> tuple[str, list] | None:
+        """(text, keyboard rows) for a message merged with other jobs, None if it must go alone."""
+
+        return None
+
+    def bookkeeping(self, d: Delivery):
+        return None
+
+
+class DayContentHandler(JobHandler):
+    """Combined lesson + quest job written by older versions."""
+
+    kind = "day_content"
+
+    async def prepare(self, d: Delivery) -> bool:
+        d.state["day_index"] = int(d.payload["day_index"])
+        return bool(d.payload.get("lesson") or d.payload.get("quest"))
+
+    async def send(self, d: Delivery):
+        day_index = d.state["day_index"]
+        lesson = d.payload.get("lesson")
+        quest = d.payload.get("quest")
+        if lesson:
+            msg = await d.bot.send_message(
+                chat_id=d.user_id,
+                text=_lesson_text(day_index, lesson),
+                reply_markup=_lesson_kb(d.schedule, day_index, lesson),
+            )
+            d.state["lesson_msg_id"] = int(msg.message_id)
+            d.delivered = True
+        if quest:
+            msg = await _send_quest_message(d.bot, d.user_id, day_index, quest, _quest_kb(day_index))
+            d.state["quest_msg_id"] = int(msg.message_id)
+
+    def bookkeeping(self, d: Delivery):
+        schedule = d.schedule
+        learning = d.services["learning"]
+        user_id, day_index = d.user_id, d.state["day_index"]
+        lesson_msg_id = d.state.get("lesson_msg_id")
+        quest_msg_id = d.state.get("quest_msg_id")
+        quest = d.payload.get("quest")
+
+        def _day_content_done():
+            user_tz = schedule._user_tz(user_id)
+            for_date = datetime.now(timezone.utc).astimezone(user_tz).date()
+            if lesson_msg_id is not None:
+                _save_material_message(schedule, user_id, day_index, "lesson", lesson_msg_id)
+                schedule.sent_jobs.mark_sent(user_id, "lesson", day_index, for_date)
+                schedule.deliveries.mark_sent(user_id, day_index, "lesson")
+            if quest_msg_id is not None:
+                _save_material_message(schedule, user_id, day_index, "quest", quest_msg_id)
+                learning.state.set_state(user_id, "last_quest", _last_quest_state(day_index, quest))
+                schedule.sent_jobs.mark_sent(user_id, "quest", day_index, for_date)
+                schedule.deliveries.mark_sent(user_id, day_index, "quest")
+
+        return _day_content_done
+
+
+class _DayMaterialHandler(JobHandler):
+    """Shared prepare/bookkeeping of the split lesson, quest and extra jobs.
+
+    Missing content only marks the job sent; content the user has already
+    completed is recorded in sent_jobs without sending it again.
+    """
+
+    payload_field = ""
+    content_type = ""
+
+    async def prepare(self, d: Delivery) -> bool:
+        content = await _job_content(d.schedule, d.payload, self.payload_field)
+        if not content:
+            return False
+        d.state["day_index"] = int(d.payload["day_index"])
+        d.state["content"] = content
+        d.state["for_date"] = await _resolve_for_date(d.schedule, d.user_id, d.payload.get("for_date"))
+        return not await self.already_done(d)
+
+    async def already_done(self, d: Delivery) -> bool:
+        return False
+
+    def bookkeeping(self, d: Delivery):
+        if "content" not in d.state:
+            return None
+        schedule = d.schedule
+        user_id, day_index, for_date = d.user_id, d.state["day_index"], d.state["for_date"]
+        if not d.sent:
+            return lambda: schedule.sent_jobs.mark_sent(user_id, self.content_type, day_index, for_date)
+
+        def _done():
+            self.record_sent(d)
+            schedule.sent_jobs.mark_sent(user_id, self.content_type, day_index, for_date)
+            schedule.deliveries.mark_sent(user_id, day_index, self.content_type)
+
+        return _done
+
+    def record_sent(self, d: Delivery):
+        pass
+
+
+class DayLessonHandler(_DayMaterialHandler):
+    kind = "day_lesson"
+    payload_field = "lesson"
+    content_type = "lesson"
+
+    async def already_done(self, d: Delivery) -> bool:
+        return await d.services["learning"].has_viewed_lesson_async(d.user_id, d.state["day_index"])
+
+    async def send(self, d: Delivery):
+        day_index, lesson = d.state["day_index"], d.state["content"]
+        msg = await d.bot.send_message(
+            chat_id=d.user_id,
+            text=_lesson_text(day_index, lesson),
+            reply_markup=_lesson_kb(d.schedule, day_index, lesson),
+        )
+        d.state["message_id"] = int(msg.message_id)
+
+    def render(self, d: Delivery):
+        day_index, lesson = d.state["day_index"], d.state["content"]
+        pts = int(lesson.get("points_viewed") or 0)
+        button = InlineKeyboardButton("📚 Лекция просмотрена", callback_data=d.schedule.make_viewed_cb(day_index, pts))
+        return _lesson_text(day_index, lesson), [[button]]
+
+    def record_sent(self, d: Delivery):
+        _save_material_message(d.schedule, d.user_id, d.state["day_index"], "lesson", d.state["message_id"])
+
+
+class DayQuestHandler(_DayMaterialHandler):
+    kind = "day_quest"
+    payload_field = "quest"
+    content_type = "quest"
+
+    async def already_done(self, d: Delivery) -> bool:
+        return await d.services["learning"].has_quest_answer_async(d.user_id, d.state["day_index"])
+
+    async def send(self, d: Delivery):
+        day_index = d.state["day_index"]
+        msg = await _send_quest_message(d.bot, d.user_id, day_index, d.state["content"], _quest_kb(day_index))
+        d.state["message_id"] = int(msg.message_id)
+
+    def render(self, d: Delivery):
+        day_index, quest = d.state["day_index"], d.state["content"]
+        if quest.get("photo_file_id"):
+            return None
+        return _quest_text(day_index, quest), [list(row) for row in _quest_kb(day_index).inline_keyboard]
+
+    def record_sent(self, d: Delivery):
+        learning = d.services["learning"]
+        day_index = d.state["day_index"]
+        _save_material_message(d.schedule, d.user_id, day_index, "quest", d.state["message_id"])
+        learning.state.set_state(d.user_id, "last_quest", _last_quest_state(day_index, d.state["content"]))
+        learning.progress.mark_sent(d.user_id, day_index)
+
+
+class DayExtraHandler(_DayMaterialHandler):
+    kind = "day_extra"
+    payload_field = "extra"
+    content_type = "extra"
+
+    async def already_done(self, d: Delivery) -> bool:
+        extra_id = int(d.state["content"].get("id") or 0)
+        if extra_id <= 0:
+            return False
+        return await d.services["learning"].points_async.has_entry(d.user_id, "extra_viewed", f"extra:{extra_id}")
+
+    async def send(self, d: Delivery):
+        extra = d.state["content"]
+        extra_id = int(extra.get("id") or 0)
+        kb = None
+        if extra_id > 0:
+            viewed_cb = d.schedule.make_extra_viewed_cb(extra_id, int(extra.get("points") or 0))
+            kb = InlineKeyboardMarkup([[InlineKeyboardButton("Просмотрено", callback_data=viewed_cb)]])
+        await _send_extra_message(d.bot, d.user_id, d.state["day_index"], extra, kb)
+
+    def render(self, d: Delivery):
+        extra = d.state["content"]
+        if extra.get("photo_file_id"):
+            return None
+        extra_id = int(extra.get("id") or 0)
+        rows = []
+        if extra_id > 0:
+            viewed_cb = d.schedule.make_extra_viewed_cb(extra_id, int(extra.get("points") or 0))
+            rows.append([InlineKeyboardButton("🧩 Доп. материал просмотрен", callback_data=viewed_cb)])
+        return _extra_text(d.state["day_index"], extra), rows
+
+
+class DailyReminderHandler(JobHandler):
+    kind = "daily_reminder"
+
+    async def prepare(self, d: Delivery) -> bool:
+        day_index = int(d.payload.get("day_index") or 0)
+        if day_index <= 0:
+            return False
+        d.state["day_index"] = day_index
+        d.state["backlog"] = await _collect_pending_backlog(d.schedule, d.user_id, day_index)
+        return bool(d.state["backlog"][0])
+
+    async def send(self, d: Delivery):
+        pending, first_lesson_day, first_quest_day, first_questionnaire = d.state["backlog"]
+        text = (
+            "🔔 Напоминание про твой день\n\n"
+            "У тебя есть незавершенные материалы:\n"
+            + "\n".join(pending)
+            + "\n\nНажми кнопку ниже, чтобы вернуться к нужному материалу ✅"
+        )
+
+        buttons = []
+        if first_lesson_day is not None:
+            buttons.append(
+                [
+                    InlineKeyboardButton(
+                        f"📚 Открыть незавершенную лекцию (день {first_lesson_day})",
+                        callback_data=f"{cb.REMINDER_NAV_PREFIX}lesson:{first_lesson_day}",
+                    )
+                ]
+            )
+        if first_quest_day is not None:
+            buttons.append(
+                [
+                    InlineKeyboardButton(
+                        f"📝 Открыть незавершенное задание (день {first_quest_day})",
+                        callback_data=f"{cb.REMINDER_NAV_PREFIX}quest:{first_quest_day}",
+                    )
+                ]
+            )
+        if first_questionnaire is not None:
+            q_day, qid = first_questionnaire
+            buttons.append(
+                [
+                    InlineKeyboardButton(
+                        f"📋 Открыть незавершенную анкету (день {q_day})",
+                        callback_data=f"{cb.REMINDER_NAV_PREFIX}questionnaire:{q_day}:{qid}",
+                    )
+                ]
+            )
+        buttons.append(
+            [
+                InlineKeyboardButton(
+                    "➡️ Продолжить по порядку",
+                    callback_data=cb.REMINDER_NAV_NEXT,
+                )
+            ]
+        )
+
+        await d.bot.send_message(chat_id=d.user_id, text=text, reply_markup=InlineKeyboardMarkup(buttons))
+
+    def bookkeeping(self, d: Delivery):
+        for_date = _optional_date(d.payload.get("for_date"))
+        if "day_index" not in d.state or not for_date:
+            return None
+        schedule, user_id, day_index = d.schedule, d.user_id, d.state["day_index"]
+        return lambda: schedule.sent_jobs.mark_sent(user_id, "daily_reminder", day_index, for_date)
+
+
+class QuestionnaireBroadcastHandler(JobHandler):
+    kind = "questionnaire_broadcast"
+
+    async def prepare(self, d: Delivery) -> bool:
+        qsvc = d.services["questionnaire"]
+        qid = int(d.payload["questionnaire_id"])
+        d.state["qid"] = qid
+        # No async questionnaire repos: keep the blocking reads off the event loop.
+        if await asyncio.to_thread(qsvc.has_response, d.user_id, qid):
+            d.state["answered"] = True
+            return False
+        d.state["item"] = await asyncio.to_thread(qsvc.get, qid)
+        return bool(d.state["item"])
+
+    async def send(self, d: Delivery):
+        qid = d.state["qid"]
+        msg = await d.bot.send_message(
+            chat_id=d.user_id,
+            text=f"📋 Анкета\n\n{d.state['item']['question']}",
+            reply_markup=q_buttons(qid),
+        )
+        d.state["message_id"] = int(msg.message_id)
+
+    def render(self, d: Delivery):
+        rows = [list(row) for row in q_buttons(d.state["qid"]).inline_keyboard]
+        return f"📋 Анкета\n\n{d.state['item']['question']}", rows
+
+    def bookkeeping(self, d: Delivery):
+        if not (d.state.get("answered") or d.sent):
+            return None  # questionnaire no longer exists
+        schedule, user_id, qid = d.schedule, d.user_id, d.state["qid"]
+        day_index = int(d.payload.get("day_index") or 0)
+        for_date = _optional_date(d.payload.get("for_date"))
+        is_optional = bool(d.payload.get("optional"))
+        message_id = d.state.get("message_id")
+
+        def _questionnaire_done():
+            if message_id is not None:
+                _save_material_message(
+                    schedule,
+                    user_id=user_id,
+                    day_index=day_index,
+                    kind="questionnaire",
+                    content_id=qid,
+                    message_id=message_id,
+                )
+            if (not is_optional) and day_index and for_date:
+                q_content_type = schedule.questionnaire_content_type(qid)
+                schedule.sent_jobs.mark_sent(user_id, q_content_type, day_index, for_date)
+
+        return _questionnaire_done
+
+
+class HabitReminderHandler(JobHandler):
+    kind = "habit_reminder"
+
+    async def prepare(self, d: Delivery) -> bool:
+        d.state["occurrence_id"] = int(d.payload.get("occurrence_id") or 0)
+        return d.state["occurrence_id"] > 0
+
+    async def send(self, d: Delivery):
+        occurrence_id = d.state["occurrence_id"]
+        title = d.payload.get("title") or "Привычка"
+
+        # Mark as sent (best-effort) so we can audit delivery status.
+        try:
+            habit_svc = d.services.get("habit")
+            habit_occ = getattr(habit_svc, "occ", None) if habit_svc else None
+            if habit_occ:
+                await asyncio.to_thread(habit_occ.mark_sent, occurrence_id)
+        except Exception:
+            pass
+
+        kb = InlineKeyboardMarkup(
+            [[
+                InlineKeyboardButton("✅ Выполнено", callback_data=f"habit:done:{occurrence_id}"),
+                InlineKeyboardButton("➖ Пропустить", callback_data=f"habit:skip:{occurrence_id}"),
+            ]]
+        )
+        text = f"🔔 Привычка\n\n*{title}*\n\nОтметь результат:"
+        await d.bot.send_message(chat_id=d.user_id, text=text, parse_mode="Markdown", reply_markup=kb)
+
+
+class PersonalReminderHandler(JobHandler):
+    kind = "personal_reminder"
+
+    async def send(self, d: Delivery):
+        text = (d.payload.get("text") or "").strip() or "Напоминание"
+        await d.bot.send_message(chat_id=d.user_id, text=f"🔔 Персональное напоминание\n\n{text}")
+
+    def bookkeeping(self, d: Delivery):
+        reminders = getattr(d.services.get("personal_reminder_schedule"), "repo", None)
+        reminder_id = int(d.payload.get("reminder_id") or 0)
+        if reminders is None or reminder_id <= 0:
+            return None
+        # One-time reminder: it fired, so drop it out of the planner's working set.
+        return lambda: reminders.mark_fired(reminder_id)
+
+
+HANDLERS: dict[str, JobHandler] = {
+    h.kind: h
+    for h in (
+        DayContentHandler(),
+        DayLessonHandler(),
+        DayQuestHandler(),
+        DayExtraHandler(),
+        DailyReminderHandler(),
+        QuestionnaireBroadcastHandler(),
+        HabitReminderHandler(),
+        PersonalReminderHandler(),
+    )
+}
+
+
+def handler_for(kind: str | None) -> JobHandler | None:
+    return HANDLERS.get(kind or "")
+
+
+def parse_kind_limits(raw: str | None) -> dict[str, tuple[int | None, float | None]]:
+    """OUTBOX_KIND_LIMITS, e.g. "questionnaire_broadcast=4/10,day_extra=/5": kind=concurrency/rate."""
+
+    limits = {}
+    for part in (raw or "").split(","):
+        if "=" not in part:
+            continue
+        kind, _, spec = part.partition("=")
+        conc_s, _, rate_s = spec.partition("/")
+        try:
+            concurrency = int(conc_s) if conc_s.strip() else None
+            rate = float(rate_s) if rate_s.strip() else None
+        except ValueError:
+            log.warning("bad OUTBOX_KIND_LIMITS entry ignored: %s", part.strip())
+            continue
+        limits[kind.strip()] = (concurrency, rate)
+    return limits
+
+
+class KindLimits:
+    """Per-kind concurrency and send-rate gates of one worker process.
+
+    Limits come from the handler's `concurrency`/`rate_per_sec`, overridden
+    per kind by OUTBOX_KIND_LIMITS. Kinds without limits pass straight through.
+    """
+
+    def __init__(self, overrides: dict | None = None, clock=time.monotonic):
+        self._overrides = dict(overrides or {})
+        self._clock = clock
+        self._semaphores: dict[str, asyncio.Semaphore] = {}
+        self._buckets: dict[str, TokenBucket] = {}
+
+    def limits_for(self, kind: str | None) -> tuple[int | None, float | None]:
+        if kind in self._overrides:
+            return self._overrides[kind]
+        handler = handler_for(kind)
+        if handler is None:
+            return None, None
+        return handler.concurrency, handler.rate_per_sec
+
+    @asynccontextmanager
+    async def slot(self, kind: str | None):
+        """Hold one of the kind's in-flight slots (if limited) around a delivery."""
+
+        concurrency, _ = self.limits_for(kind)
+        if not concurrency or concurrency <= 0:
+            yield
+            return
+        sem = self._semaphores.get(kind)
+        if sem is None:
+            sem = self._semaphores[kind] = asyncio.Semaphore(concurrency)
+        async with sem:
+            yield
+
+    @asynccontextmanager
+    async def slots(self, kinds):
+        """Hold one slot of every kind of a merged delivery.
+
+        Taken in sorted order, so two merged deliveries sharing kinds cannot
+        deadlock waiting for each other's slots.
+        """
+
+        async with AsyncExitStack() as stack:
+            for kind in sorted(set(kinds), key=lambda k: k or ""):
+                await stack.enter_async_context(self.slot(kind))
+            yield
+
+    async def wait_rate(self, kind: str | None):
+        """Wait for the kind's send-rate token (if limited); call right before sending."""
+
+        _, rate = self.limits_for(kind)
+        if not rate or rate <= 0:
+            return
+        bucket = self._buckets.get(kind)
+        if bucket is None:
+            bucket = self._buckets[kind] = TokenBucket(rate, clock=self._clock)
+        delay = bucket.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
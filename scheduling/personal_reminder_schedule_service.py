@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 import logging
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 from zoneinfo import ZoneInfo
 
 from entity.repositories.outbox_repo import OutboxRepo
@@ -24,38 +24,40 @@ class PersonalReminderScheduleService:
         return datetime.now(timezone.utc)
 
     def _user_tz(self, user_id: int) -> ZoneInfo:
-        tz_name = self.users.get_timezone(user_id) or self.settings.default_timezone
+        return self.users.get_zone(user_id)
+
+    def window(self) -> timedelta:
+        """Look-ahead of a planning pass; must exceed the interval between full passes."""
+
         try:
-            return ZoneInfo(tz_name)
+            hours = int(getattr(self.settings, "personal_reminder_window_hours", 24) or 24)
         except Exception:
-            return ZoneInfo(self.settings.default_timezone)
+            hours = 24
+        return timedelta(hours=max(2, hours))
+
+    def schedule_due_jobs(self, user_ids: list[int] | None = None) -> int:
+        """Put jobs for active reminders starting within the look-ahead window into outbox.
+
+        Only upcoming reminders are read (fired ones are deactivated by the
+        worker), and all their jobs go in one insert; existing ones are kept.
+        """
 
-    def schedule_due_jobs(self) -> int:
-        created = 0
         now_utc = self._now_utc()
-        reminders = self.repo.list_active()
+        reminders = self.repo.list_due_window(
+            now_utc.isoformat(), (now_utc + self.window()).isoformat(), user_ids
+        )
 
+        jobs = []
         for r in reminders:
             user_id = int(r["user_id"])
-            start_at = r.get("start_at")
-            if not start_at:
-                continue
+            start_at = r["start_at"]
             if isinstance(start_at, str):
-                try:
-                    start_at = datetime.fromisoformat(start_at.replace("Z", "+00:00"))
-                except Exception:
-                    continue
+                start_at = datetime.fromisoformat(start_at.replace("Z", "+00:00"))
             if start_at.tzinfo is None:
                 start_at = start_at.replace(tzinfo=timezone.utc)
 
-            # Don't plan very old reminders.
-            if start_at < now_utc:
-                continue
-
             rid = int(r["id"])
             job_key = f"personal_once:{rid}:{start_at.isoformat()}"
-            if self.outbox.exists_job_for(user_id, job_key):
-                continue
 
             tz = self._user_tz(user_id)
             local_dt = start_at.astimezone(tz)
@@ -67,9 +69,9 @@ class PersonalReminderScheduleService:
                 "for_local_date": local_dt.date().isoformat(),
                 "for_local_time": local_dt.strftime("%H:%M"),
             }
-            self.outbox.create_job(user_id, start_at.astimezone(timezone.utc).isoformat(), payload)
-            created += 1
+            jobs.append((user_id, start_at.astimezone(timezone.utc).isoformat(), payload))
 
+        created = len(self.outbox.create_jobs_bulk(jobs))
         if created:
             log.info("personal reminders schedule created=%s", created)
         return created
@@ -0,0 +1,46 @@
+"""Standalone planning loop: `python -m scheduling.planner`.
+
+Runs the same passes the outbox loop runs in-process (planner queue every
+few seconds, a full rescan hourly), so a heavy pass never delays update
+handling or delivery. Start the worker/bot with PLANNER_IN_OUTBOX=0 so
+planning runs in one place only.
+"""
+
+import logging
+import signal
+import threading
+import time
+
+from core.wiring import bootstrap
+from scheduling.worker import _PLAN_EVERY_SECONDS, _run_planners
+
+log = logging.getLogger("planner")
+
+
+def run_forever(services: dict, stop: threading.Event, interval: float = _PLAN_EVERY_SECONDS):
+    """Run planning passes every `interval` seconds until `stop` is set."""
+
+    while not stop.is_set():
+        started = time.monotonic()
+        try:
+            _run_planners(services)
+        except Exception:
+            log.exception("planning pass failed")
+        stop.wait(max(0.0, interval - (time.monotonic() - started)))
+
+
+def main():
+    settings, db, services = bootstrap()
+    stop = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stop.set())
+    log.info("planner started")
+    try:
+        run_forever(services, stop)
+    finally:
+        log.info("planner stopping")
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+import logging
+from collections import Counter
+from datetime import datetime, time, timedelta, timezone
+
+from entity.repositories.planner_queue_repo import PlannerQueueRepo
+from entity.repositories.users_repo import UsersRepo
+
+log = logging.getLogger("planner")
+
+
+class PlannerService:
+    """Incremental planning driven by planner_queue.
+
+    Only users that changed (delivery time, timezone, habits, reminders,
+    course content) or whose local date rolled over are replanned; after a
+    pass each user is queued again for their next local midnight.
+    """
+
+    # Replan a little after local midnight so "today" has surely moved on.
+    ROLLOVER_SLACK = timedelta(minutes=1)
+
+    def __init__(self, db, settings, schedule, habit_schedule=None, personal_reminder_schedule=None):
+        self.db = db
+        self.settings = settings
+        self.schedule = schedule
+        self.habit_schedule = habit_schedule
+        self.personal_reminder_schedule = personal_reminder_schedule
+        self.queue = PlannerQueueRepo(db)
+        self.users = UsersRepo(db)
+
+    def enqueue(self, user_ids: list[int], reason: str) -> int:
+        return self.queue.enqueue(list(user_ids), reason)
+
+    def enqueue_enrolled(self, reason: str) -> int:
+        return self.queue.enqueue_enrolled(reason)
+
+    def next_horizon(self, tz_name: str | None, now_utc: datetime) -> datetime:
+        """UTC instant of the user's next local midnight (plus slack)."""
+
+        tz = self.schedule._zone(tz_name)
+        tomorrow = now_utc.astimezone(tz).date() + timedelta(days=1)
+        return datetime.combine(tomorrow, time(0, 0), tzinfo=tz).astimezone(timezone.utc) + self.ROLLOVER_SLACK
+
+    def run_due(self, limit: int = 500) -> int:
+        """Replan due users from the queue; return how many were planned.
+
+        Claim, planning and the next horizon commit together: if planning
+        fails the claimed rows come back and are retried on the next pass.
+        """
+
+        with self.db.transaction():
+            rows = self.queue.claim_due(limit)
+            if not rows:
+                return 0
+            user_ids = sorted({int(r["user_id"]) for r in rows})
+            now_utc = datetime.now(timezone.utc)
+            # Jobs planned for the old delivery time/timezone keep their job_key
+            # and would block the new ones.
+            for r in rows:
+                if r.get("reschedule"):
+                    self.schedule.cancel_future_day_jobs(int(r["user_id"]), now_utc)
+
+            created = self.schedule.schedule_due_jobs(user_ids)
+            if self.habit_schedule:
+                created += self.habit_schedule.schedule_due_jobs(user_ids)
+            if self.personal_reminder_schedule:
+                created += self.personal_reminder_schedule.schedule_due_jobs(user_ids)
+
+            tz_names = self.users.get_timezones(user_ids)
+            self.queue.set_horizons(
+                {uid: self.next_horizon(tz_names.get(uid), now_utc).isoformat() for uid in user_ids}
+            )
+
+        reasons = Counter(r["reason"] for r in rows)
+        log.info("planner users=%s created=%s reasons=%s", len(user_ids), created, dict(reasons))
+        return len(user_ids)
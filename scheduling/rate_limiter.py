@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import asyncio
+import time
+
+from telegram.error import RetryAfter
+
+from scheduling.retry_policy import retry_after_seconds
+
+
+class TokenBucket:
+    """Token bucket with reservation semantics.
+
+    reserve() always takes a token and returns how long the caller must wait
+    before using it; the balance may go negative, so concurrent callers queue
+    up fairly without a lock (all callers run on one event loop).
+    """
+
+    def __init__(self, rate: float, capacity: float | None = None, clock=time.monotonic):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = float(rate)
+        self.capacity = float(capacity) if capacity else max(1.0, self.rate)
+        self.tokens = self.capacity
+        self._clock = clock
+        self.updated = clock()
+
+    def _refill(self):
+        now = self._clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        self._refill()
+        self.tokens -= 1.0
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+    def drain_for(self, seconds: float):
+        """Hand out no tokens for the next `seconds` (server-side throttling)."""
+
+        self._refill()
+        self.tokens = min(self.tokens, -seconds * self.rate)
+
+    def is_idle(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity
+
+
+class TelegramRateLimiter:
+    """Global + per-chat send limits for the Bot API.
+
+    Telegram allows roughly 30 messages/sec overall and about one message/sec
+    into a single chat; both rates come from Settings.
+    """
+
+    # Idle per-chat buckets are dropped once the map grows past this size.
+    _PRUNE_AT = 10000
+
+    def __init__(self, global_rate: float, per_chat_rate: float, clock=time.monotonic):
+        self._clock = clock
+        self.per_chat_rate = float(per_chat_rate)
+        self.global_bucket = TokenBucket(global_rate, clock=clock)
+        self._chats: dict[int, TokenBucket] = {}
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= self._PRUNE_AT:
+                self._chats = {k: b for k, b in self._chats.items() if not b.is_idle()}
+            bucket = TokenBucket(self.per_chat_rate, capacity=1.0, clock=self._clock)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    def pause(self, seconds: float):
+        """Stop all sends for `seconds`, e.g. after Telegram answered 429 RetryAfter."""
+
+        self.global_bucket.drain_for(seconds)
+
+    async def acquire(self, chat_id: int):
+        delay = self._chat_bucket(int(chat_id)).reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        # Take the global slot only once the chat slot is ours, so a slow chat
+        # does not hold global capacity while it waits.
+        delay = self.global_bucket.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class RateLimitedBot:
+    """Bot proxy that waits for a limiter slot before every send_* call."""
+
+    def __init__(self, bot, limiter: TelegramRateLimiter):
+        self._bot = bot
+        self._limiter = limiter
+
+    def __getattr__(self, name):
+        attr = getattr(self._bot, name)
+        if not name.startswith("send_"):
+            return attr
+
+        async def _send(*args, **kwargs):
+            chat_id = kwargs.get("chat_id", args[0] if args else 0)
+            await self._limiter.acquire(chat_id)
+            try:
+                return await attr(*args, **kwargs)
+            except RetryAfter as e:
+                # Flood control is global: back everyone off, not just this job.
+                self._limiter.pause(retry_after_seconds(e))
+                raise
+
+        return _send
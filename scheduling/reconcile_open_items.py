@@ -0,0 +1,25 @@
+"""Rebuild user_open_items from points_ledger, quest_answers and questionnaire_responses.
+
+Run after manual data fixes or if reminders look out of sync:
+
+    python -m scheduling.reconcile_open_items
+"""
+
+import logging
+
+from core.wiring import bootstrap
+
+log = logging.getLogger(__name__)
+
+
+def main():
+    settings, db, services = bootstrap()
+    try:
+        rows = services["schedule"].reconcile_open_items()
+        log.info("open items rebuilt: %s rows", rows)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import random
+from dataclasses import dataclass
+from datetime import timedelta
+
+import psycopg
+from psycopg_pool import PoolTimeout
+from telegram.error import BadRequest, ChatMigrated, Forbidden, NetworkError, RetryAfter
+
+PERMANENT = "permanent"
+TRANSIENT = "transient"
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    max_attempts: int
+    base_delay_sec: float
+    max_delay_sec: float
+
+
+DEFAULT_POLICY = RetryPolicy(max_attempts=3, base_delay_sec=60, max_delay_sec=1800)
+
+# Per job kind. Time-bound reminders give up sooner than day content.
+RETRY_POLICIES: dict[str, RetryPolicy] = {
+    "day_content": RetryPolicy(max_attempts=6, base_delay_sec=30, max_delay_sec=1800),
+    "day_lesson": RetryPolicy(max_attempts=6, base_delay_sec=30, max_delay_sec=1800),
+    "day_quest": RetryPolicy(max_attempts=6, base_delay_sec=30, max_delay_sec=1800),
+    "day_extra": RetryPolicy(max_attempts=4, base_delay_sec=60, max_delay_sec=1800),
+    "questionnaire_broadcast": RetryPolicy(max_attempts=4, base_delay_sec=60, max_delay_sec=1800),
+    "daily_reminder": RetryPolicy(max_attempts=3, base_delay_sec=60, max_delay_sec=900),
+    "habit_reminder": RetryPolicy(max_attempts=3, base_delay_sec=30, max_delay_sec=600),
+    "personal_reminder": RetryPolicy(max_attempts=5, base_delay_sec=15, max_delay_sec=900),
+}
+
+
+def policy_for(kind: str | None) -> RetryPolicy:
+    return RETRY_POLICIES.get(kind or "", DEFAULT_POLICY)
+
+
+def classify_error(exc: BaseException) -> str:
+    """Telegram network errors, 429s and lost/busy database connections are worth a retry.
+
+    Blocked bot and bad chat/request fail the same way again, and so would
+    anything else (a coding bug). The worker never retries a job that
+    already reached the user, and retries whatever failed before the send.
+    """
+
+    if isinstance(exc, (Forbidden, BadRequest, ChatMigrated)):
+        # BadRequest is a NetworkError subclass: check it first.
+        return PERMANENT
+    if isinstance(exc, (RetryAfter, NetworkError)):
+        return TRANSIENT
+    if isinstance(exc, (psycopg.OperationalError, psycopg.InterfaceError, PoolTimeout)):
+        return TRANSIENT
+    return PERMANENT
+
+
+def is_unreachable(exc: BaseException) -> bool:
+    """Telegram refuses the chat itself (bot blocked, account deleted): no job for this user will get through."""
+
+    return isinstance(exc, Forbidden)
+
+
+def retry_after_seconds(exc: BaseException) -> float | None:
+    if not isinstance(exc, RetryAfter):
+        return None
+    value = exc.retry_after
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    return float(value)
+
+
+def next_delay(policy: RetryPolicy, attempt: int, retry_after: float | None = None) -> float:
+    """Seconds until the next try after `attempt` failures (1-based).
+
+    Exponential backoff with equal jitter; Telegram's retry_after wins when
+    given, plus a little jitter so throttled jobs don't return all at once.
+    """
+
+    if retry_after is not None:
+        return retry_after + random.uniform(0, 1 + retry_after * 0.1)
+    delay = min(policy.max_delay_sec, policy.base_delay_sec * (2 ** max(0, attempt - 1)))
+    return random.uniform(delay / 2, delay)
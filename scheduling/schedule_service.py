@@ -8,7 +8,7 @@ from entity.repositories.enrollment_repo import EnrollmentRepo
 from entity.repositories.lesson_repo import LessonRepo
 from entity.repositories.quest_repo import QuestRepo
 from entity.repositories.extra_material_repo import ExtraMaterialRepo
-from entity.repositories.outbox_repo import OutboxRepo
+from entity.repositories.outbox_repo import LANE_INTERACTIVE, AsyncOutboxRepo, OutboxRepo, parse_lane_weights
 from entity.repositories.users_repo import UsersRepo
 from entity.repositories.progress_repo import ProgressRepo
 from entity.repositories.deliveries_repo import DeliveriesRepo
@@ -17,6 +17,10 @@ from entity.repositories.questionnaire_repo import QuestionnaireRepo
 from entity.repositories.material_messages_repo import MaterialMessagesRepo
 from entity.repositories.points_repo import PointsRepo
 from entity.repositories.answers_repo import AnswersRepo
+from entity.repositories.broadcast_repo import BroadcastRepo
+from entity.repositories.content_snapshots_repo import AsyncContentSnapshotsRepo, ContentSnapshotsRepo
+from entity.repositories.backlog_repo import AsyncBacklogRepo
+from entity.repositories.open_items_repo import OpenItemsRepo
 
 log = logging.getLogger("schedule")
 
@@ -30,12 +34,14 @@ class ScheduleService:
     """
 
     def __init__(self, db, settings):
+        self.db = db
         self.settings = settings
         self.enroll = EnrollmentRepo(db)
         self.lesson = LessonRepo(db)
         self.quest = QuestRepo(db)
         self.extra = ExtraMaterialRepo(db)
         self.outbox = OutboxRepo(db)
+        self.outbox_async = AsyncOutboxRepo(db.aio, parse_lane_weights(getattr(settings, "outbox_lane_weights", "")))
         self.users = UsersRepo(db)
         self.progress = ProgressRepo(db)
         self.deliveries = DeliveriesRepo(db)
@@ -44,6 +50,11 @@ class ScheduleService:
         self.material_messages = MaterialMessagesRepo(db)
         self.points = PointsRepo(db)
         self.answers = AnswersRepo(db)
+        self.broadcasts = BroadcastRepo(db)
+        self.snapshots = ContentSnapshotsRepo(db)
+        self.snapshots_async = AsyncContentSnapshotsRepo(db.aio)
+        self.backlog_async = AsyncBacklogRepo(db.aio)
+        self.open_items = OpenItemsRepo(db)
 
     # ----------------------------
     # Helpers
@@ -56,13 +67,15 @@ class ScheduleService:
         q_part = f"q{quest_id}" if quest_id else "q0"
         return f"day:{day_index}:{l_part}:q:{q_part}:v:{content_version}"
 
-    def _user_tz(self, user_id: int) -> ZoneInfo:
-        tz_name = self.users.get_timezone(user_id) or self.settings.default_timezone
+    def _zone(self, tz_name: str | None) -> ZoneInfo:
         try:
-            return ZoneInfo(tz_name)
+            return ZoneInfo(tz_name or self.settings.default_timezone)
         except Exception:
             return ZoneInfo(self.settings.default_timezone)
 
+    def _user_tz(self, user_id: int) -> ZoneInfo:
+        return self.users.get_zone(user_id)
+
     @staticmethod
     def _parse_hhmm(v: str, default: str = "09:30") -> time:
         s = (v or "").strip() or default
@@ -132,21 +145,28 @@ class ScheduleService:
         """Cancel future pending jobs for the user and schedule again (today+tomorrow)."""
 
         now_utc = datetime.now(timezone.utc)
+        cancelled = self.cancel_future_day_jobs(user_id, now_utc)
+        created = self._schedule_for_user(user_id, now_utc)
+        log.info("reschedule user_id=%s cancelled=%s created=%s", user_id, cancelled, created)
+        return created
+
+    def cancel_future_day_jobs(self, user_id: int, now_utc: datetime | None = None) -> int:
+        """Cancel the user's not-yet-due day pipeline jobs so they can be planned again."""
+
+        from_utc_iso = (now_utc or datetime.now(timezone.utc)).isoformat()
         # Cancel only daily pipeline kinds.
         cancelled = self.outbox.cancel_future_jobs(
             user_id,
             kinds=["day_lesson", "day_quest", "day_extra", "daily_reminder"],
-            from_utc_iso=now_utc.isoformat(),
+            from_utc_iso=from_utc_iso,
         )
         # Regular questionnaires use kind=questionnaire_broadcast as well,
         # so cancel only job_key that belongs to day planning.
         cancelled += self.outbox.cancel_future_day_questionnaire_jobs(
             user_id=user_id,
-            from_utc_iso=now_utc.isoformat(),
+            from_utc_iso=from_utc_iso,
         )
-        created = self._schedule_for_user(user_id, now_utc)
-        log.info("reschedule user_id=%s cancelled=%s created=%s", user_id, cancelled, created)
-        return created
+        return cancelled
 
     def _is_quiet_time(self, t_local: time) -> bool:
         start_t = self._parse_hhmm(getattr(self.settings, "quiet_hours_start", "22:00"), "22:00")
@@ -189,37 +209,30 @@ class ScheduleService:
     def _has_any_pending_backlog(self, user_id: int, day_index: int) -> bool:
         """Return True if user has any unfinished materials in days 1..day_index."""
 
-        points = getattr(self, "points", None)
-        answers = getattr(self, "answers", None)
-        questionnaires = getattr(self, "questionnaires", None)
-
-        for d in range(1, max(1, int(day_index)) + 1):
-            lesson = self.lesson.get_by_day(d)
-            if lesson:
-                viewed = False
-                if points and getattr(points, "has_entry", None):
-                    viewed = bool(points.has_entry(user_id, "lesson_viewed", f"day:{d}"))
-                if not viewed:
-                    return True
-
-            quest = self.quest.get_by_day(d)
-            if quest:
-                answered = False
-                if answers and getattr(answers, "exists_for_day", None):
-                    answered = bool(answers.exists_for_day(user_id, d))
-                if not answered:
-                    return True
-
-            if questionnaires and getattr(questionnaires, "list_by_day", None):
-                for qrow in questionnaires.list_by_day(d, qtypes=("manual", "daily")):
-                    qid = int(qrow["id"])
-                    has_response = False
-                    if getattr(questionnaires, "has_user_response", None):
-                        has_response = bool(questionnaires.has_user_response(user_id, qid))
-                    if not has_response:
-                        return True
-
-        return False
+        return bool(self._with_open_items([(user_id, max(1, int(day_index)))]))
+
+    def _with_open_items(self, items: list[tuple[int, int]]) -> set[tuple[int, int]]:
+        """(user_id, day_index) pairs with unfinished materials, from the user_open_items table.
+
+        Days not opened yet are materialized first (once per user and day).
+        """
+
+        self.open_items.open_through(items)
+        return self.open_items.with_open_items(items)
+
+    def reconcile_open_items(self) -> int:
+        """Rebuild user_open_items for active enrollments through their current day."""
+
+        now_utc = datetime.now(timezone.utc)
+        opened_through = {}
+        for e in self.enroll.list_active_with_timezone():
+            user_tz = self._zone(e.get("timezone"))
+            enrolled_local_date = e["enrolled_at"].astimezone(user_tz).date()
+            today = now_utc.astimezone(user_tz).date()
+            opened_through[int(e["user_id"])] = max(1, (today - enrolled_local_date).days + 1)
+        rows = self.open_items.rebuild(opened_through)
+        log.info("open items rebuilt users=%s rows=%s", len(opened_through), rows)
+        return rows
 
     @staticmethod
     def questionnaire_content_type(questionnaire_id: int) -> str:
@@ -268,23 +281,220 @@ class ScheduleService:
         except Exception:
             return None
 
-    def schedule_due_jobs(self) -> int:
+    def schedule_due_jobs(self, user_ids: list[int] | None = None) -> int:
         """Plan deliveries into outbox_jobs.
 
         v1.1 behavior:
         - Schedule jobs at exact run_at (UTC) derived from user's timezone + delivery_time.
         - Plan for today and tomorrow (lookahead) to avoid late deliveries.
         - Keep the existing grace window: if user is far past delivery time, we don't auto-send lesson/quest.
+
+        `user_ids` limits the pass to those users (planner queue); None plans everyone.
         """
 
-        created = 0
         now_utc = datetime.now(timezone.utc)
+        return self._schedule_bulk(self.enroll.list_active_with_timezone(user_ids), now_utc)
 
-        for e in self.enroll.list_active():
-            user_id = int(e["user_id"])
-            created += self._schedule_for_user(user_id, now_utc, enrollment_row=e)
+    @staticmethod
+    def _lesson_body(lesson: dict) -> dict:
+        return {
+            "title": lesson["title"],
+            "description": lesson["description"],
+            "video_url": lesson["video_url"],
+            "points_viewed": int(lesson["points_viewed"]),
+        }
 
-        return created
+    @staticmethod
+    def _quest_body(q: dict) -> dict:
+        return {
+            "prompt": q["prompt"],
+            "points": q["points"],
+            "photo_file_id": q.get("photo_file_id"),
+        }
+
+    @staticmethod
+    def _extra_body(x: dict) -> dict:
+        return {
+            "id": int(x["id"]),
+            "content_text": x.get("content_text") or "",
+            "points": int(x.get("points") or 0),
+            "link_url": x.get("link_url"),
+            "photo_file_id": x.get("photo_file_id"),
+        }
+
+    def _content_ref(self, field: str, body: dict) -> dict:
+        """Payload part carrying lesson/quest/extra content: a content snapshot id.
+
+        Many users share one snapshot, so the body is stored once instead of
+        in every outbox row. Without a snapshot store the body is embedded.
+        """
+
+        snapshots = getattr(self, "snapshots", None)
+        if snapshots is None:
+            return {field: body}
+        return {"snapshot_id": snapshots.ensure(field, body)}
+
+    def _day_content(self, day_index: int) -> dict:
+        extra = getattr(self, "extra", None)
+        return {
+            "lesson": self.lesson.get_by_day(day_index),
+            "quest": self.quest.get_by_day(day_index),
+            "extra": extra.get_by_day(day_index) if extra else None,
+            "questionnaires": self.questionnaires.list_by_day(day_index, qtypes=("manual", "daily")),
+        }
+
+    def _content_by_days(self, day_indexes: list[int]) -> dict[int, dict]:
+        """_day_content() for many days in four queries."""
+
+        extra = getattr(self, "extra", None)
+        lessons = {int(r["day_index"]): r for r in self.lesson.list_by_days(day_indexes)}
+        quests = {int(r["day_index"]): r for r in self.quest.list_by_days(day_indexes)}
+        extras = {int(r["day_index"]): r for r in extra.list_by_days(day_indexes)} if extra else {}
+        questionnaires: dict[int, list] = {}
+        legacy_daily = []
+        for r in self.questionnaires.list_by_days(day_indexes, qtypes=("manual", "daily")):
+            if r.get("day_index") is None:
+                legacy_daily.append(r)
+            else:
+                questionnaires.setdefault(int(r["day_index"]), []).append(r)
+        return {
+            d: {
+                "lesson": lessons.get(d),
+                "quest": quests.get(d),
+                "extra": extras.get(d),
+                "questionnaires": sorted(questionnaires.get(d, []) + legacy_daily, key=lambda r: int(r["id"])),
+            }
+            for d in day_indexes
+        }
+
+    def _plan_day(
+        self,
+        now_user: datetime,
+        user_tz: ZoneInfo,
+        offset_days: int,
+        for_date: date,
+        day_index: int,
+        delivery_hhmm: str,
+        content: dict,
+        was_sent,
+    ) -> list[tuple[datetime, dict]]:
+        """Jobs one user needs for one local date, as (run_at_utc, payload).
+
+        No per-user DB access: `content` comes from _day_content()/_content_by_days(),
+        snapshot ids are cached per content version and `was_sent(content_type)`
+        answers the sent_jobs guard. Outbox dedup and the daily_reminder
+        backlog check are left to the caller.
+        """
+
+        jobs = []
+        run_at_utc = self.compute_run_at_utc(user_tz, for_date, delivery_hhmm)
+        delivery_local = run_at_utc.astimezone(user_tz)
+        grace_min = int(getattr(self.settings, "delivery_grace_minutes", 15) or 15)
+
+        lesson = content.get("lesson")
+        q = content.get("quest")
+        x = content.get("extra")
+        day_questionnaires = content.get("questionnaires") or []
+
+        has_day_content = bool(lesson or q or x or day_questionnaires)
+
+        # Auto-delivery guardrail for lessons/quests: if we're too late for today's window, skip.
+        too_late = (now_user > (delivery_local + timedelta(minutes=grace_min)))
+        can_autosend = (not too_late) or (offset_days == 1)
+
+        if has_day_content and can_autosend:
+            # Lesson
+            if lesson and not was_sent("lesson"):
+                lesson_id = int(lesson["id"])
+                l_ver = self._row_version_ts(lesson)
+                payload = {
+                    "kind": "day_lesson",
+                    "job_key": self._job_key(day_index, lesson_id, None, l_ver),
+                    "day_index": day_index,
+                    "for_date": for_date.isoformat(),
+                    **self._content_ref("lesson", self._lesson_body(lesson)),
+                }
+                jobs.append((run_at_utc, payload))
+
+            # Quest
+            if q and not was_sent("quest"):
+                quest_id = int(q["id"])
+                q_ver = self._row_version_ts(q)
+                payload = {
+                    "kind": "day_quest",
+                    "job_key": self._job_key(day_index, None, quest_id, q_ver),
+                    "day_index": day_index,
+                    "for_date": for_date.isoformat(),
+                    **self._content_ref("quest", self._quest_body(q)),
+                }
+                jobs.append((run_at_utc, payload))
+
+            # Day questionnaires: multiple questionnaires per day are supported.
+            for qrow in day_questionnaires:
+                qid = int(qrow["id"])
+                if was_sent(self.questionnaire_content_type(qid)):
+                    continue
+                payload = {
+                    "kind": "questionnaire_broadcast",
+                    "job_key": f"questionnaire:{qid}:day={day_index}:date={for_date.isoformat()}",
+                    "day_index": day_index,
+                    "for_date": for_date.isoformat(),
+                    "questionnaire_id": qid,
+                    "optional": False,
+                }
+                jobs.append((run_at_utc, payload))
+
+            # Extra material (non-mandatory, out of reminder flow).
+            if x and bool(x.get("is_active")) and not was_sent("extra"):
+                extra_id = int(x["id"])
+                x_ver = self._row_version_ts(x)
+                payload = {
+                    "kind": "day_extra",
+                    "job_key": f"extra:{extra_id}:day={day_index}:v:{x_ver}",
+                    "day_index": day_index,
+                    "for_date": for_date.isoformat(),
+                    **self._content_ref("extra", self._extra_body(x)),
+                }
+                jobs.append((run_at_utc, payload))
+
+        # Daily reminder: schedule by unfinished backlog, even if today's content is empty.
+        if not was_sent("daily_reminder"):
+            reminder_local = self._compute_daily_reminder_run_local(delivery_local, user_tz)
+            payload = {
+                "kind": "daily_reminder",
+                "job_key": f"daily_reminder:day={day_index}:date={for_date.isoformat()}",
+                "day_index": day_index,
+                "for_date": for_date.isoformat(),
+            }
+            jobs.append((reminder_local.astimezone(timezone.utc), payload))
+
+        return jobs
+
+    def _log_planned(
+        self,
+        user_id: int,
+        user_tz: ZoneInfo,
+        for_date: date,
+        delivery_hhmm: str,
+        run_at_utc: datetime,
+        payload: dict,
+    ):
+        kind = payload["kind"]
+        if kind != "daily_reminder":
+            self._log_job(user_id, kind, payload["job_key"], user_tz, for_date, delivery_hhmm, run_at_utc)
+            return
+        # reminder_local is based on delivery_local, so log with that reference
+        delivery_local = self.compute_run_at_utc(user_tz, for_date, delivery_hhmm).astimezone(user_tz)
+        log.info(
+            "plan reminder user_id=%s day=%s for_date=%s tz=%s delivery_local=%s reminder_local=%s utc_run_at=%s",
+            user_id,
+            payload["day_index"],
+            for_date.isoformat(),
+            str(user_tz),
+            delivery_local.isoformat(),
+            run_at_utc.astimezone(user_tz).isoformat(),
+            run_at_utc.isoformat(),
+        )
 
     def _schedule_for_user(self, user_id: int, now_utc: datetime, enrollment_row=None) -> int:
         created = 0
@@ -295,145 +505,86 @@ class ScheduleService:
         user_tz = self._user_tz(user_id)
         now_user = now_utc.astimezone(user_tz)
         delivery_hhmm = e.get("delivery_time") or "21:00"
-        grace_min = int(getattr(self.settings, "delivery_grace_minutes", 15) or 15)
 
         # Plan for today and tomorrow.
         for offset_days in (0, 1):
             for_date = (now_user.date() + timedelta(days=offset_days))
             day_index = self.day_index_for_local_date(user_id, for_date)
-            run_at_utc = self.compute_run_at_utc(user_tz, for_date, delivery_hhmm)
-            delivery_local = run_at_utc.astimezone(user_tz)
-
-            lesson = self.lesson.get_by_day(day_index)
-            q = self.quest.get_by_day(day_index)
-            extra = getattr(self, "extra", None)
-            x = extra.get_by_day(day_index) if extra else None
-            day_questionnaires = self.questionnaires.list_by_day(day_index, qtypes=("manual", "daily"))
-
-            has_day_content = bool(lesson or q or x or day_questionnaires)
-
-            # Auto-delivery guardrail for lessons/quests: if we're too late for today's window, skip.
-            too_late = (now_user > (delivery_local + timedelta(minutes=grace_min)))
-            can_autosend = (not too_late) or (offset_days == 1)
-
-            if has_day_content and can_autosend:
-                # Lesson
-                if lesson and not self.sent_jobs.was_sent(user_id, "lesson", day_index, for_date):
-                    lesson_id = int(lesson["id"])
-                    l_ver = self._row_version_ts(lesson)
-                    lesson_key = self._job_key(day_index, lesson_id, None, l_ver)
-                    if not self.outbox.exists_job_for(user_id, lesson_key):
-                        payload = {
-                            "kind": "day_lesson",
-                            "job_key": lesson_key,
-                            "day_index": day_index,
-                            "for_date": for_date.isoformat(),
-                            "lesson": {
-                                "title": lesson["title"],
-                                "description": lesson["description"],
-                                "video_url": lesson["video_url"],
-                                "points_viewed": int(lesson["points_viewed"]),
-                            },
-                        }
-                        self._log_job(user_id, "day_lesson", lesson_key, user_tz, for_date, delivery_hhmm, run_at_utc)
-                        self.outbox.create_job(user_id, run_at_utc.isoformat(), payload)
-                        created += 1
-
-                # Quest
-                if q and not self.sent_jobs.was_sent(user_id, "quest", day_index, for_date):
-                    quest_id = int(q["id"])
-                    q_ver = self._row_version_ts(q)
-                    quest_key = self._job_key(day_index, None, quest_id, q_ver)
-                    if not self.outbox.exists_job_for(user_id, quest_key):
-                        payload = {
-                            "kind": "day_quest",
-                            "job_key": quest_key,
-                            "day_index": day_index,
-                            "for_date": for_date.isoformat(),
-                            "quest": {
-                                "prompt": q["prompt"],
-                                "points": q["points"],
-                                "photo_file_id": q.get("photo_file_id"),
-                            },
-                        }
-                        self._log_job(user_id, "day_quest", quest_key, user_tz, for_date, delivery_hhmm, run_at_utc)
-                        self.outbox.create_job(user_id, run_at_utc.isoformat(), payload)
-                        created += 1
-
-                # Day questionnaires: multiple questionnaires per day are supported.
-                for qrow in day_questionnaires:
-                    qid = int(qrow["id"])
-                    q_content_type = self.questionnaire_content_type(qid)
-                    if self.sent_jobs.was_sent(user_id, q_content_type, day_index, for_date):
-                        continue
-                    q_key = f"questionnaire:{qid}:day={day_index}:date={for_date.isoformat()}"
-                    if self.outbox.exists_job_for(user_id, q_key):
-                        continue
-                    payload = {
-                        "kind": "questionnaire_broadcast",
-                        "job_key": q_key,
-                        "day_index": day_index,
-                        "for_date": for_date.isoformat(),
-                        "questionnaire_id": qid,
-                        "optional": False,
-                    }
-                    self._log_job(user_id, "questionnaire_broadcast", q_key, user_tz, for_date, delivery_hhmm, run_at_utc)
-                    self.outbox.create_job(user_id, run_at_utc.isoformat(), payload)
-                    created += 1
 
-                # Extra material (non-mandatory, out of reminder flow).
-                if x and bool(x.get("is_active")) and not self.sent_jobs.was_sent(user_id, "extra", day_index, for_date):
-                    extra_id = int(x["id"])
-                    x_ver = self._row_version_ts(x)
-                    x_key = f"extra:{extra_id}:day={day_index}:v:{x_ver}"
-                    if not self.outbox.exists_job_for(user_id, x_key):
-                        payload = {
-                            "kind": "day_extra",
-                            "job_key": x_key,
-                            "day_index": day_index,
-                            "for_date": for_date.isoformat(),
-                            "extra": {
-                                "id": extra_id,
-                                "content_text": x.get("content_text") or "",
-                                "points": int(x.get("points") or 0),
-                                "link_url": x.get("link_url"),
-                                "photo_file_id": x.get("photo_file_id"),
-                            },
-                        }
-                        self._log_job(user_id, "day_extra", x_key, user_tz, for_date, delivery_hhmm, run_at_utc)
-                        self.outbox.create_job(user_id, run_at_utc.isoformat(), payload)
-                        created += 1
-
-            # Daily reminder: schedule by unfinished backlog, even if today's content is empty.
-            if (not self.sent_jobs.was_sent(user_id, "daily_reminder", day_index, for_date)) and self._has_any_pending_backlog(user_id, day_index):
-                reminder_local = self._compute_daily_reminder_run_local(delivery_local, user_tz)
-                run_utc = reminder_local.astimezone(timezone.utc)
-                job_key = f"daily_reminder:day={day_index}:date={for_date.isoformat()}"
-                if not self.outbox.exists_job_for(user_id, job_key):
-                    payload = {
-                        "kind": "daily_reminder",
-                        "job_key": job_key,
-                        "day_index": day_index,
-                        "for_date": for_date.isoformat(),
-                    }
-                    # reminder_local is based on delivery_local, so log with that reference
-                    log.info(
-                        "plan reminder user_id=%s day=%s for_date=%s tz=%s delivery_local=%s reminder_local=%s utc_run_at=%s",
-                        user_id,
-                        day_index,
-                        for_date.isoformat(),
-                        str(user_tz),
-                        delivery_local.isoformat(),
-                        reminder_local.isoformat(),
-                        run_utc.isoformat(),
-                    )
-                    self.outbox.create_job(user_id, run_utc.isoformat(), payload)
+            def _was_sent(content_type: str, day_index=day_index, for_date=for_date) -> bool:
+                return self.sent_jobs.was_sent(user_id, content_type, day_index, for_date)
+
+            content = self._day_content(day_index)
+            for run_at_utc, payload in self._plan_day(
+                now_user, user_tz, offset_days, for_date, day_index, delivery_hhmm, content, _was_sent
+            ):
+                if payload["kind"] == "daily_reminder" and not self._has_any_pending_backlog(user_id, day_index):
+                    continue
+                if self.outbox.create_job_if_absent(user_id, run_at_utc.isoformat(), payload):
+                    self._log_planned(user_id, user_tz, for_date, delivery_hhmm, run_at_utc, payload)
                     created += 1
 
         return created
 
+    def _schedule_bulk(self, enrollments: list[dict], now_utc: datetime) -> int:
+        """Set-based planning pass for many users.
+
+        Enrollments (with timezone), day content, sent_jobs guards and live
+        outbox keys are each loaded with one query; jobs are computed in Python
+        and inserted with one multi-row INSERT. Users that still miss a
+        daily_reminder job get one lookup in the materialized open items.
+        """
+
+        days = []  # (user_id, user_tz, now_user, offset_days, for_date, day_index, delivery_hhmm)
+        for e in enrollments:
+            user_id = int(e["user_id"])
+            user_tz = self._zone(e.get("timezone"))
+            now_user = now_utc.astimezone(user_tz)
+            enrolled_local_date = e["enrolled_at"].astimezone(user_tz).date()
+            delivery_hhmm = e.get("delivery_time") or "21:00"
+            for offset_days in (0, 1):
+                for_date = now_user.date() + timedelta(days=offset_days)
+                day_index = max(1, (for_date - enrolled_local_date).days + 1)
+                days.append((user_id, user_tz, now_user, offset_days, for_date, day_index, delivery_hhmm))
+        if not days:
+            return 0
+
+        content = self._content_by_days(sorted({d[5] for d in days}))
+        sent = self.sent_jobs.sent_keys(sorted({d[0] for d in days}), sorted({d[4] for d in days}))
+
+        candidates = []
+        for user_id, user_tz, now_user, offset_days, for_date, day_index, delivery_hhmm in days:
+
+            def _was_sent(content_type: str, user_id=user_id, day_index=day_index, for_date=for_date) -> bool:
+                return (user_id, content_type, day_index, for_date) in sent
+
+            for run_at_utc, payload in self._plan_day(
+                now_user, user_tz, offset_days, for_date, day_index, delivery_hhmm, content[day_index], _was_sent
+            ):
+                candidates.append((user_id, user_tz, for_date, delivery_hhmm, run_at_utc, payload))
+        if not candidates:
+            return 0
+
+        live = self.outbox.live_job_keys([(c[0], c[5]["job_key"]) for c in candidates])
+        candidates = [c for c in candidates if (c[0], c[5]["job_key"]) not in live]
+        reminders = [(c[0], int(c[5]["day_index"])) for c in candidates if c[5]["kind"] == "daily_reminder"]
+        with_backlog = self._with_open_items(reminders) if reminders else set()
+        new_jobs = [
+            c
+            for c in candidates
+            if c[5]["kind"] != "daily_reminder" or (c[0], int(c[5]["day_index"])) in with_backlog
+        ]
+        if not new_jobs:
+            return 0
+
+        inserted = self.outbox.create_jobs_bulk([(c[0], c[4].isoformat(), c[5]) for c in new_jobs])
+        for user_id, user_tz, for_date, delivery_hhmm, run_at_utc, payload in new_jobs:
+            if (user_id, payload["job_key"]) in inserted:
+                self._log_planned(user_id, user_tz, for_date, delivery_hhmm, run_at_utc, payload)
+        return len(inserted)
+
     def enqueue_day_now(self, user_id: int, day_index: int) -> int:
-        """Manually enqueue today's content immediately."""
+        """Manually enqueue today's content immediately (interactive lane: ahead of planned jobs)."""
 
         lesson = self.lesson.get_by_day(day_index)
         q = self.quest.get_by_day(day_index)
@@ -453,64 +604,47 @@ class ScheduleService:
             lesson_id = int(lesson["id"])
             l_ver = self._row_version_ts(lesson)
             lesson_key = self._job_key(day_index, lesson_id, None, l_ver)
-            if not self.outbox.exists_job_for(user_id, lesson_key):
-                payload = {
-                    "kind": "day_lesson",
-                    "job_key": lesson_key,
-                    "day_index": day_index,
-                    "lesson": {
-                        "title": lesson["title"],
-                        "description": lesson["description"],
-                        "video_url": lesson["video_url"],
-                        "points_viewed": int(lesson["points_viewed"]),
-                    },
-                }
-                self.outbox.create_job(user_id, run_utc, payload)
+            payload = {
+                "kind": "day_lesson",
+                "job_key": lesson_key,
+                "day_index": day_index,
+                "lane": LANE_INTERACTIVE,
+                **self._content_ref("lesson", self._lesson_body(lesson)),
+            }
+            if self.outbox.create_job_if_absent(user_id, run_utc, payload):
                 created += 1
 
         if q:
             quest_id = int(q["id"])
             q_ver = self._row_version_ts(q)
             quest_key = self._job_key(day_index, None, quest_id, q_ver)
-            if not self.outbox.exists_job_for(user_id, quest_key):
-                payload = {
-                    "kind": "day_quest",
-                    "job_key": quest_key,
-                    "day_index": day_index,
-                    "quest": {
-                        "prompt": q["prompt"],
-                        "points": q["points"],
-                        "photo_file_id": q.get("photo_file_id"),
-                    },
-                }
-                self.outbox.create_job(user_id, run_utc, payload)
+            payload = {
+                "kind": "day_quest",
+                "job_key": quest_key,
+                "day_index": day_index,
+                "lane": LANE_INTERACTIVE,
+                **self._content_ref("quest", self._quest_body(q)),
+            }
+            if self.outbox.create_job_if_absent(user_id, run_utc, payload):
                 created += 1
 
         if x and bool(x.get("is_active")):
             extra_id = int(x["id"])
             x_ver = self._row_version_ts(x)
             x_key = f"extra:{extra_id}:day={day_index}:v:{x_ver}"
-            if not self.outbox.exists_job_for(user_id, x_key):
-                payload = {
-                    "kind": "day_extra",
-                    "job_key": x_key,
-                    "day_index": day_index,
-                    "extra": {
-                        "id": extra_id,
-                        "content_text": x.get("content_text") or "",
-                        "points": int(x.get("points") or 0),
-                        "link_url": x.get("link_url"),
-                        "photo_file_id": x.get("photo_file_id"),
-                    },
-                }
-                self.outbox.create_job(user_id, run_utc, payload)
+            payload = {
+                "kind": "day_extra",
+                "job_key": x_key,
+                "day_index": day_index,
+                "lane": LANE_INTERACTIVE,
+                **self._content_ref("extra", self._extra_body(x)),
+            }
+            if self.outbox.create_job_if_absent(user_id, run_utc, payload):
                 created += 1
 
         for qrow in day_questionnaires:
             qid = int(qrow["id"])
             q_key = f"questionnaire:{qid}:day={day_index}:date={for_date.isoformat()}"
-            if self.outbox.exists_job_for(user_id, q_key):
-                continue
             payload = {
                 "kind": "questionnaire_broadcast",
                 "job_key": q_key,
@@ -518,39 +652,53 @@ class ScheduleService:
                 "for_date": for_date.isoformat(),
                 "questionnaire_id": qid,
                 "optional": False,
+                "lane": LANE_INTERACTIVE,
             }
-            self.outbox.create_job(user_id, run_utc, payload)
-            created += 1
+            if self.outbox.create_job_if_absent(user_id, run_utc, payload):
+                created += 1
 
         return created
 
-    def schedule_questionnaire_broadcast(self, questionnaire_id: int, hhmm: str, optional: bool = False) -> int:
-        """Schedule a questionnaire for each user at their local HH:MM."""
+    def schedule_questionnaire_broadcast(
+        self,
+        questionnaire_id: int,
+        hhmm: str,
+        optional: bool = False,
+        progress=None,
+        batch_size: int = 5000,
+    ) -> int:
+        """Schedule a questionnaire for each user at their local HH:MM.
+
+        Planned in the database batch by batch (BroadcastRepo); `progress`,
+        if given, is called as progress(done, total, created) after each batch.
+        """
 
         hh, mm = [int(x) for x in hhmm.split(":")]
-        user_ids = self.users.list_user_ids()
-        created = 0
-
-        now_utc = datetime.now(timezone.utc)
-        for uid in user_ids:
-            user_tz = self._user_tz(int(uid))
-            now_local = now_utc.astimezone(user_tz)
-            target_local = datetime.combine(now_local.date(), time(hh, mm), tzinfo=user_tz)
-            # if already passed in user's local time — send almost immediately
-            if target_local < now_local:
-                target_local = now_local + timedelta(seconds=5)
-            run_utc = target_local.astimezone(timezone.utc).isoformat()
-
-            # Make key unique per-user + local date to avoid cross-TZ collisions
-            job_key = f"qcast:{questionnaire_id}:{target_local.date().isoformat()}:{hhmm}"
-            if self.outbox.exists_job_for(int(uid), job_key):
-                continue
-            payload = {
-                "kind": "questionnaire_broadcast",
-                "job_key": job_key,
-                "questionnaire_id": questionnaire_id,
-                "optional": bool(optional),
-            }
-            self.outbox.create_job(int(uid), run_utc, payload)
-            created += 1
+        hhmm = f"{hh:02d}:{mm:02d}"
+        total = self.broadcasts.count_recipients()
+        done = created = 0
+        after_id = None
+        while True:
+            batch = self.broadcasts.questionnaire_batch(
+                questionnaire_id,
+                hhmm,
+                optional,
+                self.settings.default_timezone,
+                after_id=after_id,
+                limit=batch_size,
+            )
+            done += batch["scanned"]
+            created += batch["created"]
+            if progress:
+                progress(done, max(total, done), created)
+            if batch["scanned"] < batch_size or batch["last_id"] is None:
+                break
+            after_id = batch["last_id"]
+        log.info(
+            "questionnaire broadcast planned questionnaire_id=%s hhmm=%s users=%s created=%s",
+            questionnaire_id,
+            hhmm,
+            done,
+            created,
+        )
         return created
@@ -1,472 +1,579 @@
-from datetime import datetime, timezone
+import asyncio
 import json
+import logging
+import os
+import signal
+import socket
 import time
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+import uuid
+from types import SimpleNamespace
+from telegram import Bot, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from event_bus import callbacks as cb
-from questionnaires.questionnaire_handlers import q_buttons
-
-
-def _save_material_message(
-    schedule,
-    user_id: int,
-    day_index: int,
-    kind: str,
-    message_id: int,
-    content_id: int = 0,
-):
-    """Best-effort save of sent message id for reminder navigation."""
-
-    if day_index <= 0 or message_id <= 0:
-        return
-    try:
-        repo = getattr(schedule, "material_messages", None)
-        if not repo:
+from telegram.request import HTTPXRequest
+from core.wiring import bootstrap
+from entity.db import OUTBOX_NOTIFY_CHANNEL
+from entity.repositories.outbox_repo import LANE_CONTENT
+from scheduling.delivery_stats import FAILED, RETRIED, SENT, SKIPPED, DeliveryStats
+from scheduling.job_handlers import Delivery, KindLimits, finish_job, handler_for, parse_kind_limits
+from scheduling.rate_limiter import RateLimitedBot, TelegramRateLimiter
+from scheduling.retry_policy import (
+    DEFAULT_POLICY,
+    PERMANENT,
+    RETRY_POLICIES,
+    classify_error,
+    is_unreachable,
+    next_delay,
+    policy_for,
+    retry_after_seconds,
+)
+
+log = logging.getLogger("worker")
+
+
+# The planner queue is cheap to poll; the full rescan is only a safety net
+# for changes that bypassed it (manual SQL, missed hooks).
+_PLAN_EVERY_SECONDS = 5
+_FULL_PLAN_EVERY_SECONDS = 3600
+_MIN_IDLE_SEC = 0.5
+# Telegram's limit for one text message; longer merged messages are sent apart.
+_MAX_MESSAGE_LEN = 4096
+_last_plan_ts = 0.0
+_last_full_plan_ts = 0.0
+_plan_task: asyncio.Task | None = None
+_limiter: TelegramRateLimiter | None = None
+_kind_limits: KindLimits | None = None
+_stats = DeliveryStats()
+_last_stats_ts = time.monotonic()
+
+# Lease owner for claimed outbox jobs: unique per process, readable in the table.
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def _run_planners(services: dict):
+    global _last_full_plan_ts
+
+    planner = services.get("planner")
+    if planner is not None:
+        # Incremental: only users in the planner queue that are due.
+        planner.run_due()
+        if (time.time() - _last_full_plan_ts) < _FULL_PLAN_EVERY_SECONDS:
             return
-        repo.upsert(
-            user_id=user_id,
-            day_index=day_index,
-            kind=kind,
-            message_id=message_id,
-            content_id=content_id,
-        )
-    except Exception:
-        pass
-
-
-def _collect_pending_backlog(schedule, learning, qsvc, user_id: int, day_index: int):
-    """Collect unfinished items from day 1..day_index for cumulative reminders."""
-
-    pending = []
-    first_lesson_day = None
-    first_quest_day = None
-    first_questionnaire = None
-
-    for d in range(1, day_index + 1):
-        lesson = schedule.lesson.get_by_day(d)
-        if lesson and (not learning.has_viewed_lesson(user_id, d)):
-            pending.append(f"• 📚 День {d}: лекция — не отмечена «Просмотрено»")
-            if first_lesson_day is None:
-                first_lesson_day = d
-
-        quest = schedule.quest.get_by_day(d)
-        if quest and (not learning.has_quest_answer(user_id, d)):
-            pending.append(f"• 📝 День {d}: задание — нет ответа")
-            if first_quest_day is None:
-                first_quest_day = d
-
-        day_questionnaires = qsvc.list_for_day(d, qtypes=("manual", "daily"))
-        first_unanswered_qid = None
-        for row in day_questionnaires:
-            qid = int(row["id"])
-            if not qsvc.has_response(user_id, qid):
-                first_unanswered_qid = qid
-                break
-        if first_unanswered_qid is not None:
-            if first_questionnaire is None:
-                first_questionnaire = (d, first_unanswered_qid)
-            pending.append(f"• 📋 День {d}: анкета — нет ответа")
-
-    return pending, first_lesson_day, first_quest_day, first_questionnaire
-
-
-async def _send_quest_message(bot, user_id: int, day_index: int, quest: dict, kb):
-    qtext = (
-        f"📝 Задание дня {day_index}:\n{quest['prompt']}\n\n"
-        "Нажми кнопку ниже, чтобы продолжить, или просто ответь сообщением в чат."
-    )
-    photo_file_id = quest.get("photo_file_id")
-    if photo_file_id:
-        try:
-            return await bot.send_photo(
-                chat_id=user_id,
-                photo=photo_file_id,
-                caption=qtext,
-                reply_markup=kb,
-            )
-        except Exception:
-            # Fallback to text message (e.g. invalid file_id or caption limits)
-            pass
-    return await bot.send_message(chat_id=user_id, text=qtext, reply_markup=kb)
+        _last_full_plan_ts = time.time()
 
+    # Create new outbox jobs (lessons/quests + daily reminder).
+    services["schedule"].schedule_due_jobs()
+    # Create habit reminder jobs (occurrences + outbox).
+    if services.get("habit_schedule"):
+        services["habit_schedule"].schedule_due_jobs()
+    # Create personal reminder jobs (outbox).
+    if services.get("personal_reminder_schedule"):
+        services["personal_reminder_schedule"].schedule_due_jobs()
 
-async def _send_extra_message(bot, user_id: int, day_index: int, extra: dict, kb):
-    text = f"🧩 Дополнительный материал дня {day_index}\n\n{extra.get('content_text') or ''}".strip()
-    link_url = (extra.get("link_url") or "").strip()
-    if link_url:
-        text += f"\n\n🔗 {link_url}"
-    photo_file_id = extra.get("photo_file_id")
-    if photo_file_id:
-        try:
-            return await bot.send_photo(
-                chat_id=user_id,
-                photo=photo_file_id,
-                caption=text,
-                reply_markup=kb,
-            )
-        except Exception:
-            pass
-    return await bot.send_message(chat_id=user_id, text=text, reply_markup=kb)
 
+async def _plan_in_background(services: dict):
+    try:
+        # Planners use blocking repos: run them in a thread so update handling
+        # and outbox delivery keep going while a planning pass is in progress.
+        await asyncio.to_thread(_run_planners, services)
+    except Exception:
+        log.exception("planning pass failed")
 
-def _resolve_for_date(schedule, user_id: int, for_date_s: str | None):
-    if for_date_s:
-        return datetime.fromisoformat(for_date_s).date()
-    user_tz = schedule._user_tz(user_id)
-    return datetime.now(timezone.utc).astimezone(user_tz).date()
 
+def _maybe_start_planning(services: dict):
+    global _last_plan_ts, _plan_task
 
-_PLAN_EVERY_SECONDS = 30
-_last_plan_ts = 0.0
+    # Plan jobs less frequently (heavy DB work) than outbox delivery.
+    now_ts = time.time()
+    planning = _plan_task is not None and not _plan_task.done()
+    if (now_ts - _last_plan_ts) >= _PLAN_EVERY_SECONDS and not planning:
+        _last_plan_ts = now_ts
+        _plan_task = asyncio.create_task(_plan_in_background(services))
 
 
 async def tick(context: ContextTypes.DEFAULT_TYPE, services: dict):
-    global _last_plan_ts
+    _maybe_start_planning(services)
+    await _process_outbox(context, services)
 
-    # Plan jobs less frequently (heavy DB work), but process outbox on every tick.
-    now_ts = time.time()
-    if (now_ts - _last_plan_ts) >= _PLAN_EVERY_SECONDS:
+
+async def _listen_outbox(adb, wake: asyncio.Event):
+    """Set `wake` on every outbox NOTIFY; reconnect with backoff if the connection drops."""
+
+    delay = 1.0
+    while True:
         try:
-            # Create new outbox jobs (lessons/quests + daily reminder).
-            services["schedule"].schedule_due_jobs()
-            # Create habit reminder jobs (occurrences + outbox).
-            if services.get("habit_schedule"):
-                services["habit_schedule"].schedule_due_jobs()
-            # Create personal reminder jobs (outbox).
-            if services.get("personal_reminder_schedule"):
-                services["personal_reminder_schedule"].schedule_due_jobs()
-        finally:
-            _last_plan_ts = now_ts
+            conn = await adb.connect()
+            try:
+                await conn.execute(f"LISTEN {OUTBOX_NOTIFY_CHANNEL}")
+                log.info("outbox listener connected")
+                delay = 1.0
+                # Catch up on anything inserted while we were not listening.
+                wake.set()
+                async for _ in conn.notifies():
+                    wake.set()
+            finally:
+                await conn.close()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            log.exception("outbox listener failed, reconnecting in %.0fs", delay)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 60.0)
 
-    await _process_outbox(context, services)
 
+async def _backfill_lanes(outbox):
+    try:
+        updated = await outbox.backfill_lanes()
+        if updated:
+            log.info("outbox lanes backfilled jobs=%s", updated)
+    except Exception:
+        log.exception("outbox lane backfill failed")
+
+
+async def run_outbox_loop(app, services: dict, plan: bool = True):
+    """Deliver outbox jobs as soon as they are due.
+
+    Sleeps until the earliest pending run_at or a NOTIFY from the insert
+    trigger, whichever comes first; OUTBOX_SAFETY_POLL_SEC is only a
+    fallback for missed notifications. `app` is anything with a `.bot`.
+    With `plan=False` planning passes are left to `python -m scheduling.planner`.
+    """
 
-async def _process_outbox(context: ContextTypes.DEFAULT_TYPE, services: dict):
-    outbox = services["schedule"].outbox
-    learning = services["learning"]
-    qsvc = services["questionnaire"]
     schedule = services["schedule"]
-    habit_svc = services.get("habit")
-    habit_occ = getattr(habit_svc, "occ", None) if habit_svc else None
+    settings = getattr(schedule, "settings", None)
+    safety_sec = float(getattr(settings, "outbox_safety_poll_sec", 30) or 30)
+    batch_size = int(getattr(settings, "outbox_batch_size", 50) or 50)
 
-    jobs = outbox.fetch_due_pending(limit=50)
-    for j in jobs:
-        job_id = int(j["id"])
-        user_id = int(j["user_id"])
-        try:
-            payload = j["payload_json"]
-            if isinstance(payload, str):
-                payload = json.loads(payload)
-            kind = payload.get("kind")
+    stats_sec = float(getattr(settings, "outbox_stats_interval_sec", 300) or 0)
 
-            # Backward compatible handler: combined day content (older versions)
-            if kind == "day_content":
-                day_index = int(payload["day_index"])
-                lesson = payload.get("lesson")
-                quest = payload.get("quest")
-
-                if lesson:
-                    pts = int(lesson.get("points_viewed") or 0)
-                    viewed_cb = schedule.make_viewed_cb(day_index, pts)
-                    kb = InlineKeyboardMarkup([[InlineKeyboardButton("Просмотрено", callback_data=viewed_cb)]])
-
-                    title = lesson.get("title") or f"День {day_index}"
-                    desc = lesson.get("description") or ""
-                    video = lesson.get("video_url") or ""
-                    text = f"📚 Лекция дня {day_index}\n{title}\n\n{desc}"
-                    if video:
-                        text += f"\n\n🎥 {video}"
-                    msg = await context.bot.send_message(chat_id=user_id, text=text, reply_markup=kb)
-                    _save_material_message(
-                        schedule,
-                        user_id=user_id,
-                        day_index=day_index,
-                        kind="lesson",
-                        message_id=int(msg.message_id),
-                    )
-
-                    user_tz = schedule._user_tz(user_id)
-                    for_date = datetime.now(timezone.utc).astimezone(user_tz).date()
-                    schedule.sent_jobs.mark_sent(user_id, "lesson", day_index, for_date)
-                    schedule.deliveries.mark_sent(user_id, day_index, "lesson")
-
-                if quest:
-                    reply_cb = f"{cb.QUEST_REPLY_PREFIX}{day_index}"
-                    kb = InlineKeyboardMarkup([[InlineKeyboardButton("✍️ Ответить на задание", callback_data=reply_cb)]])
-                    msg = await _send_quest_message(context.bot, user_id, day_index, quest, kb)
-                    _save_material_message(
-                        schedule,
-                        user_id=user_id,
-                        day_index=day_index,
-                        kind="quest",
-                        message_id=int(msg.message_id),
-                    )
-                    learning.state.set_state(
-                        user_id,
-                        "last_quest",
-                        {"day_index": day_index, "points": int(quest["points"]), "prompt": quest.get("prompt")},
-                    )
-
-                    user_tz = schedule._user_tz(user_id)
-                    for_date = datetime.now(timezone.utc).astimezone(user_tz).date()
-                    schedule.sent_jobs.mark_sent(user_id, "quest", day_index, for_date)
-                    schedule.deliveries.mark_sent(user_id, day_index, "quest")
-
-                outbox.mark_sent(job_id)
+    wake = asyncio.Event()
+    listener = asyncio.create_task(_listen_outbox(schedule.db.aio, wake))
+    # Pending jobs from before the lane column count as content until then.
+    backfill = asyncio.create_task(_backfill_lanes(schedule.outbox_async))
+    try:
+        while True:
+            wake.clear()
+            _maybe_report_stats(stats_sec)
+            if plan:
+                _maybe_start_planning(services)
+            try:
+                claimed = await _process_outbox(app, services)
+            except Exception:
+                log.exception("outbox pass failed")
+                claimed = 0
+            if claimed >= batch_size:
+                # A full batch: more jobs are probably due right now.
                 continue
 
-            # Split handlers: lecture and quest are scheduled independently
-            if kind == "day_lesson":
-                day_index = int(payload["day_index"])
-                for_date_s = payload.get("for_date")
-                lesson = payload.get("lesson")
-                if lesson:
-                    for_date = _resolve_for_date(schedule, user_id, for_date_s)
-                    if learning.has_viewed_lesson(user_id, day_index):
-                        schedule.sent_jobs.mark_sent(user_id, "lesson", day_index, for_date)
-                        outbox.mark_sent(job_id)
-                        continue
-
-                    pts = int(lesson.get("points_viewed") or 0)
-                    viewed_cb = schedule.make_viewed_cb(day_index, pts)
-                    kb = InlineKeyboardMarkup([[InlineKeyboardButton("Просмотрено", callback_data=viewed_cb)]])
-
-                    title = lesson.get("title") or f"День {day_index}"
-                    desc = lesson.get("description") or ""
-                    video = lesson.get("video_url") or ""
-                    text = f"📚 Лекция дня {day_index}\n{title}\n\n{desc}"
-                    if video:
-                        text += f"\n\n🎥 {video}"
-                    msg = await context.bot.send_message(chat_id=user_id, text=text, reply_markup=kb)
-                    _save_material_message(
-                        schedule,
-                        user_id=user_id,
-                        day_index=day_index,
-                        kind="lesson",
-                        message_id=int(msg.message_id),
-                    )
-
-                    if for_date_s:
-                        for_date = datetime.fromisoformat(for_date_s).date()
-                    else:
-                        user_tz = schedule._user_tz(user_id)
-                        for_date = datetime.now(timezone.utc).astimezone(user_tz).date()
-                    schedule.sent_jobs.mark_sent(user_id, "lesson", day_index, for_date)
-                    schedule.deliveries.mark_sent(user_id, day_index, "lesson")
-                outbox.mark_sent(job_id)
-                continue
+            timeout = safety_sec
+            if plan:
+                timeout = min(timeout, max(0.0, _PLAN_EVERY_SECONDS - (time.time() - _last_plan_ts)))
+            try:
+                next_due = await schedule.outbox_async.seconds_until_next_due()
+            except Exception:
+                log.exception("outbox next due lookup failed")
+                next_due = None
+            if next_due is not None:
+                timeout = min(timeout, next_due)
+            # Due jobs we could not claim (another worker holds the user) must
+            # not turn this into a busy loop.
+            timeout = max(timeout, 0.0 if claimed else _MIN_IDLE_SEC)
+            try:
+                await asyncio.wait_for(wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        listener.cancel()
+        backfill.cancel()
+
+
+def _get_limiter(settings) -> TelegramRateLimiter:
+    global _limiter
+    if _limiter is None:
+        _limiter = TelegramRateLimiter(
+            global_rate=float(getattr(settings, "tg_global_rate_per_sec", 25) or 25),
+            per_chat_rate=float(getattr(settings, "tg_per_chat_rate_per_sec", 1) or 1),
+        )
+    return _limiter
 
-            if kind == "day_quest":
-                day_index = int(payload["day_index"])
-                for_date_s = payload.get("for_date")
-                quest = payload.get("quest")
-                if quest:
-                    for_date = _resolve_for_date(schedule, user_id, for_date_s)
-                    if learning.has_quest_answer(user_id, day_index):
-                        schedule.sent_jobs.mark_sent(user_id, "quest", day_index, for_date)
-                        outbox.mark_sent(job_id)
-                        continue
-
-                    reply_cb = f"{cb.QUEST_REPLY_PREFIX}{day_index}"
-                    kb = InlineKeyboardMarkup([[InlineKeyboardButton("✍️ Ответить на задание", callback_data=reply_cb)]])
-                    msg = await _send_quest_message(context.bot, user_id, day_index, quest, kb)
-                    _save_material_message(
-                        schedule,
-                        user_id=user_id,
-                        day_index=day_index,
-                        kind="quest",
-                        message_id=int(msg.message_id),
-                    )
-                    learning.state.set_state(
-                        user_id,
-                        "last_quest",
-                        {"day_index": day_index, "points": int(quest["points"]), "prompt": quest.get("prompt")},
-                    )
-                    learning.progress.mark_sent(user_id, day_index)
-
-                    if for_date_s:
-                        for_date = datetime.fromisoformat(for_date_s).date()
-                    else:
-                        user_tz = schedule._user_tz(user_id)
-                        for_date = datetime.now(timezone.utc).astimezone(user_tz).date()
-                    schedule.sent_jobs.mark_sent(user_id, "quest", day_index, for_date)
-                    schedule.deliveries.mark_sent(user_id, day_index, "quest")
-                outbox.mark_sent(job_id)
-                continue
 
-            if kind == "day_extra":
-                day_index = int(payload["day_index"])
-                for_date_s = payload.get("for_date")
-                extra = payload.get("extra")
-                if extra:
-                    for_date = _resolve_for_date(schedule, user_id, for_date_s)
-                    extra_id = int(extra.get("id") or 0)
-                    points = int(extra.get("points") or 0)
-                    if extra_id > 0 and learning.points.has_entry(user_id, "extra_viewed", f"extra:{extra_id}"):
-                        schedule.sent_jobs.mark_sent(user_id, "extra", day_index, for_date)
-                        outbox.mark_sent(job_id)
-                        continue
-                    kb = None
-                    if extra_id > 0:
-                        viewed_cb = schedule.make_extra_viewed_cb(extra_id, points)
-                        kb = InlineKeyboardMarkup([[InlineKeyboardButton("Просмотрено", callback_data=viewed_cb)]])
-
-                    msg = await _send_extra_message(context.bot, user_id, day_index, extra, kb)
-
-                    if for_date_s:
-                        for_date = datetime.fromisoformat(for_date_s).date()
-                    else:
-                        user_tz = schedule._user_tz(user_id)
-                        for_date = datetime.now(timezone.utc).astimezone(user_tz).date()
-                    schedule.sent_jobs.mark_sent(user_id, "extra", day_index, for_date)
-                    schedule.deliveries.mark_sent(user_id, day_index, "extra")
-                outbox.mark_sent(job_id)
-                continue
+def _lane(j) -> int:
+    lane = j.get("lane")
+    return int(lane) if lane is not None else LANE_CONTENT
 
-            if kind == "daily_reminder":
-                day_index = int(payload.get("day_index") or 0)
-                for_date_s = payload.get("for_date")
-                for_date = datetime.fromisoformat(for_date_s).date() if for_date_s else None
-                if day_index <= 0:
-                    outbox.mark_sent(job_id)
-                    continue
-
-                pending, first_lesson_day, first_quest_day, first_questionnaire = _collect_pending_backlog(
-                    schedule,
-                    learning,
-                    qsvc,
-                    user_id,
-                    day_index,
-                )
 
-                if not pending:
-                    if for_date:
-                        schedule.sent_jobs.mark_sent(user_id, "daily_reminder", day_index, for_date)
-                    outbox.mark_sent(job_id)
-                    continue
-
-                text = (
-                    "🔔 Напоминание про твой день\n\n"
-                    "У тебя есть незавершенные материалы:\n"
-                    + "\n".join(pending)
-                    + "\n\nНажми кнопку ниже, чтобы вернуться к нужному материалу ✅"
-                )
+def _maybe_report_stats(interval_sec: float):
+    global _last_stats_ts
+    if interval_sec > 0 and time.monotonic() - _last_stats_ts >= interval_sec:
+        _last_stats_ts = time.monotonic()
+        _stats.report(log)
 
-                buttons = []
-                if first_lesson_day is not None:
-                    buttons.append(
-                        [
-                            InlineKeyboardButton(
-                                f"📚 Открыть незавершенную лекцию (день {first_lesson_day})",
-                                callback_data=f"{cb.REMINDER_NAV_PREFIX}lesson:{first_lesson_day}",
-                            )
-                        ]
-                    )
-                if first_quest_day is not None:
-                    buttons.append(
-                        [
-                            InlineKeyboardButton(
-                                f"📝 Открыть незавершенное задание (день {first_quest_day})",
-                                callback_data=f"{cb.REMINDER_NAV_PREFIX}quest:{first_quest_day}",
-                            )
-                        ]
-                    )
-                if first_questionnaire is not None:
-                    q_day, qid = first_questionnaire
-                    buttons.append(
-                        [
-                            InlineKeyboardButton(
-                                f"📋 Открыть незавершенную анкету (день {q_day})",
-                                callback_data=f"{cb.REMINDER_NAV_PREFIX}questionnaire:{q_day}:{qid}",
-                            )
-                        ]
-                    )
-                buttons.append(
-                    [
-                        InlineKeyboardButton(
-                            "➡️ Продолжить по порядку",
-                            callback_data=cb.REMINDER_NAV_NEXT,
-                        )
-                    ]
-                )
 
-                reply_markup = InlineKeyboardMarkup(buttons) if buttons else None
-                await context.bot.send_message(chat_id=user_id, text=text, reply_markup=reply_markup)
-                if for_date:
-                    schedule.sent_jobs.mark_sent(user_id, "daily_reminder", day_index, for_date)
-                outbox.mark_sent(job_id)
-                continue
+def _get_kind_limits(settings) -> KindLimits:
+    global _kind_limits
+    if _kind_limits is None:
+        _kind_limits = KindLimits(parse_kind_limits(getattr(settings, "outbox_kind_limits", "")))
+    return _kind_limits
 
-            if kind == "questionnaire_broadcast":
-                qid = int(payload["questionnaire_id"])
-                day_index = int(payload.get("day_index") or 0)
-                for_date_s = payload.get("for_date")
-                for_date = datetime.fromisoformat(for_date_s).date() if for_date_s else None
-                is_optional = bool(payload.get("optional"))
-                if qsvc.has_response(user_id, qid):
-                    if (not is_optional) and day_index and for_date:
-                        q_content_type = schedule.questionnaire_content_type(qid)
-                        schedule.sent_jobs.mark_sent(user_id, q_content_type, day_index, for_date)
-                    outbox.mark_sent(job_id)
-                    continue
-                item = qsvc.get(qid)
-                if not item:
-                    outbox.mark_sent(job_id)
-                    continue
-                msg = await context.bot.send_message(
-                    chat_id=user_id,
-                    text=f"📋 Анкета\n\n{item['question']}",
-                    reply_markup=q_buttons(qid),
-                )
-                _save_material_message(
-                    schedule,
-                    user_id=user_id,
-                    day_index=day_index,
-                    kind="questionnaire",
-                    content_id=qid,
-                    message_id=int(msg.message_id),
-                )
-                if (not is_optional) and day_index and for_date:
-                    q_content_type = schedule.questionnaire_content_type(qid)
-                    schedule.sent_jobs.mark_sent(user_id, q_content_type, day_index, for_date)
-                outbox.mark_sent(job_id)
-                continue
 
-            if kind == "habit_reminder":
-                occurrence_id = int(payload.get("occurrence_id") or 0)
-                title = payload.get("title") or "Привычка"
-                if occurrence_id <= 0:
-                    outbox.mark_sent(job_id)
-                    continue
-
-                # Mark as sent (best-effort) so we can audit delivery status.
-                try:
-                    if habit_occ:
-                        habit_occ.mark_sent(occurrence_id)
-                except Exception:
-                    pass
-
-                done_cb = f"habit:done:{occurrence_id}"
-                skip_cb = f"habit:skip:{occurrence_id}"
-                kb = InlineKeyboardMarkup(
-                    [[
-                        InlineKeyboardButton("✅ Выполнено", callback_data=done_cb),
-                        InlineKeyboardButton("➖ Пропустить", callback_data=skip_cb),
-                    ]]
-                )
-                text = f"🔔 Привычка\n\n*{title}*\n\nОтметь результат:"
-                await context.bot.send_message(chat_id=user_id, text=text, parse_mode="Markdown", reply_markup=kb)
-                outbox.mark_sent(job_id)
-                continue
+def delivery_stats() -> DeliveryStats:
+    """Per-kind delivery counters and latency of this process since the last report."""
 
-            if kind == "personal_reminder":
-                text = (payload.get("text") or "").strip() or "Напоминание"
-                msg = f"🔔 Персональное напоминание\n\n{text}"
-                await context.bot.send_message(chat_id=user_id, text=msg)
-                outbox.mark_sent(job_id)
-                continue
+    return _stats
+
+
+async def _process_outbox(context: ContextTypes.DEFAULT_TYPE, services: dict) -> int:
+    """Claim and deliver one batch of due jobs; return how many were claimed."""
 
-            outbox.mark_sent(job_id)
+    schedule = services["schedule"]
+    settings = getattr(schedule, "settings", None)
+    batch_size = int(getattr(settings, "outbox_batch_size", 50) or 50)
+    concurrency = int(getattr(settings, "outbox_concurrency", 8) or 8)
+    lease_sec = int(getattr(settings, "outbox_lease_sec", 120) or 120)
+    outbox = schedule.outbox_async
+
+    released = await outbox.release_expired_leases(
+        {kind: p.max_attempts for kind, p in RETRY_POLICIES.items()},
+        DEFAULT_POLICY.max_attempts,
+    )
+    if released:
+        log.warning("outbox leases expired, returned to pending or failed: %s", released)
+
+    jobs = await outbox.claim_due(WORKER_ID, limit=batch_size, lease_sec=lease_sec)
+    if not jobs:
+        return 0
+    claimed = len(jobs)
+
+    # Users who blocked the bot after these jobs were planned. The flag comes
+    # from the claim itself, never from a (possibly stale) cached profile.
+    unreachable = [j for j in jobs if j.get("unreachable_at") is not None]
+    if unreachable:
+        await outbox.cancel_claimed([int(j["id"]) for j in unreachable], "user unreachable")
+        for j in unreachable:
+            _stats.observe(_payload(j).get("kind"), SKIPPED, 0.0)
+        jobs = [j for j in jobs if j.get("unreachable_at") is None]
+
+    bot = RateLimitedBot(context.bot, _get_limiter(settings))
+
+    # Jobs of one user are sent sequentially in claim order (run_at, id), so a
+    # lesson still arrives before the quest; different users go in parallel.
+    by_user: dict[int, list] = {}
+    for j in jobs:
+        by_user.setdefault(int(j["user_id"]), []).append(j)
+
+    sem = asyncio.Semaphore(concurrency)
+
+    coalesce_sec = float(getattr(settings, "outbox_coalesce_sec", 0) or 0)
+
+    async def _drain(user_jobs: list):
+        async with sem:
+            groups = _coalesce_groups(user_jobs, coalesce_sec) if coalesce_sec > 0 else [[j] for j in user_jobs]
+            for group in groups:
+                if len(group) == 1:
+                    await _deliver_job(bot, services, group[0])
+                else:
+                    await _deliver_coalesced(bot, services, group)
+
+    async def _renew():
+        # Keep our leases alive while a slow (rate-limited) batch is in flight.
+        while True:
+            await asyncio.sleep(lease_sec / 3)
+            try:
+                await outbox.renew_leases(WORKER_ID, lease_sec)
+            except Exception:
+                log.exception("outbox lease renewal failed")
+
+    renewer = asyncio.create_task(_renew())
+    try:
+        # Users with a higher-priority (lower) lane job take the concurrency slots first.
+        groups = sorted(by_user.values(), key=lambda js: min(_lane(j) for j in js))
+        results = await asyncio.gather(*(_drain(js) for js in groups), return_exceptions=True)
+    finally:
+        renewer.cancel()
+    for r in results:
+        if isinstance(r, Exception):
+            log.error("outbox delivery failed: %s", r)
+    return claimed
+
+
+def _payload(j) -> dict:
+    payload = j["payload_json"]
+    if isinstance(payload, str):
+        payload = json.loads(payload)
+    return payload
+
+
+async def _record(schedule, handler, d: Delivery):
+    """Mark the job sent, together with its handler's bookkeeping if any."""
+
+    bookkeeping = handler.bookkeeping(d)
+    if bookkeeping is None:
+        await schedule.outbox_async.mark_sent(d.job_id)
+    else:
+        # Bookkeeping uses blocking repos: one connection + one commit, off the event loop.
+        await asyncio.to_thread(finish_job, schedule, d.job_id, bookkeeping)
+
+
+async def _deliver_job(bot, services: dict, j):
+    """Send one outbox job through its kind's handler and record the outcome (sent/failed)."""
+
+    schedule = services["schedule"]
+    outbox = schedule.outbox_async
+    kinds = _get_kind_limits(getattr(schedule, "settings", None))
+    started = time.monotonic()
+
+    job_id = int(j["id"])
+    user_id = int(j["user_id"])
+    kind = None
+    handler = d = None
+    sending = False
+    try:
+        payload = _payload(j)
+        kind = payload.get("kind")
+
+        handler = handler_for(kind)
+        if handler is None:
+            await outbox.mark_sent(job_id)
+            return
+
+        d = Delivery(bot=bot, services=services, job_id=job_id, user_id=user_id, kind=kind, payload=payload)
+        async with kinds.slot(kind):
+            if await handler.prepare(d):
+                await kinds.wait_rate(kind)
+                sending = True
+                await handler.send(d)
+                d.sent = True
+            await _record(schedule, handler, d)
+        _stats.observe(kind, SENT if d.sent else SKIPPED, time.monotonic() - started)
+
+    except Exception as e:
+        if d is not None and (d.sent or d.delivered):
+            outcome = await _settle_delivered(schedule, handler, d, e)
+        else:
+            outcome = await _handle_failure(outbox, j, kind, e, _users_repo(services), before_send=not sending)
+        _stats.observe(kind, outcome, time.monotonic() - started)
+
+
+def _coalesce_groups(user_jobs: list, window_sec: float) -> list[list]:
+    """Split one user's jobs (in run_at order) into runs due within `window_sec` of the run's first job."""
+
+    groups: list[list] = []
+    first_at = None
+    for j in user_jobs:
+        run_at = j.get("run_at")
+        if groups and run_at is not None and first_at is not None and (run_at - first_at).total_seconds() <= window_sec:
+            groups[-1].append(j)
+            continue
+        groups.append([j])
+        first_at = run_at
+    return groups
+
+
+async def _deliver_coalesced(bot, services: dict, jobs: list):
+    """Deliver one user's simultaneously due jobs, merging what can be merged into one message.
+
+    Every job is still prepared, recorded and, on failure, retried on its
+    own; only the Telegram call is shared. At most one job per kind is
+    merged (two questionnaires' score rows would be indistinguishable) and
+    jobs a handler cannot render (photos) are sent as usual.
+    """
+
+    schedule = services["schedule"]
+    outbox = schedule.outbox_async
+    users = _users_repo(services)
+    kinds = _get_kind_limits(getattr(schedule, "settings", None))
+    started = time.monotonic()
+
+    prepared = []  # (job row, handler, delivery, should send)
+    for j in jobs:
+        kind = None
+        try:
+            payload = _payload(j)
+            kind = payload.get("kind")
+            handler = handler_for(kind)
+            if handler is None:
+                await outbox.mark_sent(int(j["id"]))
+                continue
+            d = Delivery(bot=bot, services=services, job_id=int(j["id"]), user_id=int(j["user_id"]), kind=kind, payload=payload)
+            prepared.append((j, handler, d, await handler.prepare(d)))
+        except Exception as e:
+            outcome = await _handle_failure(outbox, j, kind, e, users, before_send=True)
+            _stats.observe(kind, outcome, time.monotonic() - started)
+
+    merged, alone, seen_kinds = [], [], set()
+    for j, handler, d, send in prepared:
+        if not send:
+            continue
+        part = handler.render(d) if d.kind not in seen_kinds else None
+        if part is None:
+            alone.append((j, handler, d))
+        else:
+            seen_kinds.add(d.kind)
+            merged.append((j, handler, d, part))
+    text = "\n\n".join(part[0] for *_, part in merged)
+    if len(merged) < 2 or len(text) > _MAX_MESSAGE_LEN:
+        order = {int(j["id"]): i for i, j in enumerate(jobs)}
+        alone = sorted([(j, handler, d) for j, handler, d, _ in merged] + alone, key=lambda item: order[item[2].job_id])
+        merged = []
+
+    failed = set()
+    if merged:
+        try:
+            merged_kinds = list(dict.fromkeys(d.kind for _, _, d, _ in merged))
+            # The merged message counts against every kind it carries.
+            async with kinds.slots(merged_kinds):
+                for kind in merged_kinds:
+                    await kinds.wait_rate(kind)
+                rows = [row for *_, part in merged for row in part[1]]
+                msg = await bot.send_message(
+                    chat_id=merged[0][2].user_id,
+                    text=text,
+                    reply_markup=InlineKeyboardMarkup(rows) if rows else None,
+                )
+            for _, _, d, _ in merged:
+                d.sent = True
+                d.state["message_id"] = int(msg.message_id)
+        except Exception as e:
+            for j, _, d, _ in merged:
+                failed.add(d.job_id)
+                _stats.observe(d.kind, await _handle_failure(outbox, j, d.kind, e, users), time.monotonic() - started)
 
+    for j, handler, d in alone:
+        try:
+            async with kinds.slot(d.kind):
+                await kinds.wait_rate(d.kind)
+                await handler.send(d)
+            d.sent = True
         except Exception as e:
-            outbox.mark_failed(job_id, str(e))
+            failed.add(d.job_id)
+            if d.delivered:
+                outcome = await _settle_delivered(schedule, handler, d, e)
+            else:
+                outcome = await _handle_failure(outbox, j, d.kind, e, users)
+            _stats.observe(d.kind, outcome, time.monotonic() - started)
+
+    for j, handler, d, _ in prepared:
+        if d.job_id in failed:
+            continue
+        try:
+            await _record(schedule, handler, d)
+            _stats.observe(d.kind, SENT if d.sent else SKIPPED, time.monotonic() - started)
+        except Exception as e:
+            if d.sent:
+                outcome = await _settle_delivered(schedule, handler, d, e)
+            else:
+                outcome = await _handle_failure(outbox, j, d.kind, e, users)
+            _stats.observe(d.kind, outcome, time.monotonic() - started)
+
+
+async def _settle_delivered(schedule, handler, d: Delivery, exc: Exception) -> str:
+    """Finish a job that already reached the user; it is never retried, so never resent.
+
+    After a partial send (the first of several messages) the handler's
+    bookkeeping records what went out. If recording is what failed, the
+    job is only marked sent, so its job_key keeps blocking a replanned
+    copy; failed as a last resort.
+    """
+
+    outbox = schedule.outbox_async
+    err = f"{type(exc).__name__}: {exc}"
+    log.error("outbox job delivered but not completed job_id=%s kind=%s err=%s", d.job_id, d.kind, err)
+    if not d.sent:
+        try:
+            await _record(schedule, handler, d)
+            return SENT
+        except Exception:
+            log.exception("outbox job bookkeeping failed job_id=%s", d.job_id)
+    try:
+        await outbox.mark_sent(d.job_id)
+        return SENT
+    except Exception:
+        await outbox.mark_failed(d.job_id, err)
+        return FAILED
+
+
+def _users_repo(services: dict):
+    user = services.get("user")
+    return getattr(user, "users_async", None)
+
+
+async def _handle_failure(outbox, j, kind: str | None, exc: Exception, users=None, before_send: bool = False) -> str:
+    """Reschedule a failed job per its kind's retry policy, or fail it for good; return the outcome.
+
+    A failure `before_send` (loading content, checks) is always retried
+    within the policy: nothing reached the user yet. When Telegram refuses
+    the chat itself (bot blocked) the user is flagged unreachable through
+    `users` and the rest of their pending jobs cancelled.
+    """
+
+    job_id = int(j["id"])
+    attempt = int(j.get("attempts") or 0) + 1
+    err = f"{type(exc).__name__}: {exc}"
+    policy = policy_for(kind)
+    permanent = classify_error(exc) == PERMANENT and not before_send
+
+    if permanent or attempt >= policy.max_attempts:
+        log.error("outbox job failed job_id=%s kind=%s attempt=%s err=%s", job_id, kind, attempt, err)
+        await outbox.mark_failed(job_id, err)
+        if users is not None and is_unreachable(exc):
+            user_id = int(j["user_id"])
+            res = await users.mark_unreachable(user_id, err)
+            if res["flagged"] or res["cancelled"]:
+                log.warning("user unreachable user_id=%s cancelled_jobs=%s", user_id, res["cancelled"])
+        return FAILED
+
+    delay = next_delay(policy, attempt, retry_after_seconds(exc))
+    log.warning(
+        "outbox job retry job_id=%s kind=%s attempt=%s delay_sec=%.1f err=%s",
+        job_id,
+        kind,
+        attempt,
+        delay,
+        err,
+    )
+    await outbox.schedule_retry(job_id, err, delay)
+    return RETRIED
+
+
+async def _serve(settings, services: dict):
+    schedule = services["schedule"]
+    request = HTTPXRequest(
+        connection_pool_size=max(8, 2 * int(getattr(settings, "outbox_concurrency", 8) or 8)),
+        connect_timeout=20,
+        read_timeout=30,
+        write_timeout=30,
+        pool_timeout=20,
+    )
+    loop = asyncio.get_running_loop()
+    task = asyncio.current_task()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, task.cancel)
+        except NotImplementedError:  # Windows
+            pass
+    try:
+        async with Bot(settings.bot_token, request=request) as bot:
+            await run_outbox_loop(SimpleNamespace(bot=bot), services, plan=bool(getattr(settings, "planner_in_outbox", True)))
+    except asyncio.CancelledError:
+        log.info("outbox worker stopping")
+    finally:
+        await schedule.db.aio.close()
+
+
+def main():
+    """Standalone outbox delivery: `python -m scheduling.worker`.
+
+    Run the bot with OUTBOX_IN_BOT=0 so the two do not both deliver (several
+    workers are fine: jobs are leased). With PLANNER_IN_OUTBOX=0 planning is
+    left to `python -m scheduling.planner`.
+    """
+
+    settings, db, services = bootstrap()
+    log.info("outbox worker started id=%s", WORKER_ID)
+    try:
+        asyncio.run(_serve(settings, services))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
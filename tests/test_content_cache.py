@@ -0,0 +1,133 @@
+import unittest
+from contextlib import contextmanager
+
+from entity.content_cache import ContentCache
+from entity.repositories.lesson_repo import LessonRepo
+from entity.repositories.questionnaire_repo import QuestionnaireRepo
+
+
+class DummyCursor:
+    def __init__(self, db):
+        self.db = db
+        self._rows = []
+
+    def execute(self, sql, params=None):
+        self.db.executed.append(sql)
+        if "UPDATE content_version" in sql:
+            self.db.version += 1
+        elif "FROM content_version" in sql:
+            self._rows = [{"version": self.db.version}]
+        elif "FROM lessons" in sql:
+            self._rows = [r for r in self.db.lessons if r["day_index"] in params[0]]
+        elif "day_index IS NULL" in sql:
+            self._rows = [r for r in self.db.questionnaires if r["day_index"] is None]
+        elif "FROM questionnaires" in sql:
+            days, qtypes = params
+            self._rows = [r for r in self.db.questionnaires if r["day_index"] in days and r["qtype"] in qtypes]
+
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+    def fetchall(self):
+        return list(self._rows)
+
+
+class DummyDb:
+    def __init__(self):
+        self.version = 0
+        self.executed = []
+        self.lessons = [{"id": 1, "day_index": 1, "title": "Day 1"}]
+        self.questionnaires = [
+            {"id": 5, "day_index": 2, "qtype": "manual"},
+            {"id": 3, "day_index": None, "qtype": "daily"},
+        ]
+        self.now = 0.0
+        self.content_cache = ContentCache(self, ttl_sec=60, check_sec=5, clock=lambda: self.now)
+
+    @contextmanager
+    def cursor(self):
+        yield DummyCursor(self)
+
+    def content_reads(self):
+        return [sql for sql in self.executed if "content_version" not in sql]
+
+
+class ContentCacheTests(unittest.TestCase):
+    def test_repeated_reads_hit_the_cache_including_missing_days(self):
+        db = DummyDb()
+        lessons = LessonRepo(db)
+
+        self.assertEqual(lessons.get_by_day(1)["title"], "Day 1")
+        self.assertIsNone(lessons.get_by_day(2))
+        for _ in range(3):
+            lessons.get_by_day(1)
+            lessons.get_by_day(2)
+            self.assertEqual([r["id"] for r in lessons.list_by_days([1, 2])], [1])
+
+        self.assertEqual(len(db.content_reads()), 2)
+
+    def test_cached_rows_are_copies(self):
+        db = DummyDb()
+        lessons = LessonRepo(db)
+
+        lessons.get_by_day(1)["title"] = "edited by caller"
+        self.assertEqual(lessons.get_by_day(1)["title"], "Day 1")
+
+    def test_entries_expire_after_ttl(self):
+        db = DummyDb()
+        lessons = LessonRepo(db)
+
+        lessons.get_by_day(1)
+        db.now = 61.0
+        lessons.get_by_day(1)
+
+        self.assertEqual(len(db.content_reads()), 2)
+
+    def test_version_bump_from_another_process_clears_after_check_interval(self):
+        db = DummyDb()
+        lessons = LessonRepo(db)
+        lessons.get_by_day(1)
+
+        db.version += 1  # another replica edited content
+        db.lessons = [{"id": 1, "day_index": 1, "title": "Day 1 v2"}]
+        db.now = 1.0
+        self.assertEqual(lessons.get_by_day(1)["title"], "Day 1")
+        db.now = 5.0
+        self.assertEqual(lessons.get_by_day(1)["title"], "Day 1 v2")
+
+    def test_write_invalidates_locally_and_bumps_shared_version(self):
+        db = DummyDb()
+        cache = db.content_cache
+        cache.by_days("lesson", [1], lambda days: {1: {"id": 1}})
+
+        cache.invalidate()
+
+        self.assertEqual(db.version, 1)
+        reloaded = cache.by_days("lesson", [1], lambda days: {1: {"id": 2}})
+        self.assertEqual(reloaded[1], {"id": 2})
+
+    def test_questionnaires_by_day_include_legacy_daily_once(self):
+        db = DummyDb()
+        repo = QuestionnaireRepo(db)
+
+        self.assertEqual([r["id"] for r in repo.list_by_day(2, qtypes=("manual", "daily"))], [3, 5])
+        self.assertEqual([r["id"] for r in repo.list_by_day(2)], [5])
+        self.assertEqual([r["id"] for r in repo.list_by_days([1, 2], qtypes=("manual", "daily"))], [3, 5])
+        repo.list_by_day(2, qtypes=("daily", "manual"))
+
+        # Day rows per qtype set, plus the legacy daily list, each read once.
+        self.assertEqual(len(db.content_reads()), 4)
+
+    def test_zero_ttl_disables_caching(self):
+        db = DummyDb()
+        db.content_cache = ContentCache(db, ttl_sec=0)
+        lessons = LessonRepo(db)
+
+        lessons.get_by_day(1)
+        lessons.get_by_day(1)
+
+        self.assertEqual(len(db.content_reads()), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
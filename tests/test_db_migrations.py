@@ -0,0 +1,77 @@
+import unittest
+from contextlib import contextmanager
+
+from entity.db import BASELINE_VERSION, MIGRATIONS_LOCK_KEY, run_migrations
+
+
+class _Result:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def fetchall(self):
+        return self.rows
+
+
+class _FakeConn:
+    def __init__(self, applied_versions):
+        self.applied_versions = list(applied_versions)
+        self.executed = []
+        self.transactions = 0
+
+    def execute(self, sql, params=None):
+        self.executed.append((sql.strip(), params))
+        if sql.startswith("SELECT version FROM schema_migrations"):
+            return _Result([{"version": v} for v in self.applied_versions])
+        return _Result([])
+
+    @contextmanager
+    def transaction(self):
+        self.transactions += 1
+        yield
+
+
+class MigrationRunnerTests(unittest.TestCase):
+    def test_applies_only_pending_versions_in_order(self):
+        conn = _FakeConn(applied_versions=[BASELINE_VERSION, 2])
+        migrations = [
+            (4, "fourth", ["ALTER TABLE t4 ADD COLUMN x INT"]),
+            (2, "second", ["ALTER TABLE t2 ADD COLUMN x INT"]),
+            (3, "third", ["ALTER TABLE t3 ADD COLUMN x INT"]),
+        ]
+
+        applied = run_migrations(conn, migrations)
+
+        self.assertEqual(applied, [3, 4])
+        sqls = [sql for sql, _ in conn.executed]
+        self.assertNotIn("ALTER TABLE t2 ADD COLUMN x INT", sqls)
+        self.assertLess(sqls.index("ALTER TABLE t3 ADD COLUMN x INT"), sqls.index("ALTER TABLE t4 ADD COLUMN x INT"))
+        recorded = [params[:2] for sql, params in conn.executed if sql.startswith("INSERT INTO schema_migrations")]
+        self.assertEqual(recorded, [(3, "third"), (4, "fourth")])
+        self.assertEqual(conn.transactions, 2)
+
+    def test_takes_and_releases_advisory_lock(self):
+        conn = _FakeConn(applied_versions=[BASELINE_VERSION])
+
+        applied = run_migrations(conn, [])
+
+        self.assertEqual(applied, [])
+        self.assertEqual(conn.executed[0], ("SELECT pg_advisory_lock(%s)", (MIGRATIONS_LOCK_KEY,)))
+        self.assertEqual(conn.executed[-1], ("SELECT pg_advisory_unlock(%s)", (MIGRATIONS_LOCK_KEY,)))
+
+    def test_releases_lock_when_migration_fails(self):
+        conn = _FakeConn(applied_versions=[BASELINE_VERSION])
+
+        def _boom(sql, params=None):
+            if sql.startswith("BROKEN"):
+                raise RuntimeError("syntax error")
+            return _FakeConn.execute(conn, sql, params)
+
+        conn.execute = _boom
+        with self.assertRaises(RuntimeError):
+            run_migrations(conn, [(2, "broken", ["BROKEN SQL"])])
+
+        self.assertEqual(conn.executed[-1][0], "SELECT pg_advisory_unlock(%s)")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,137 @@
+import unittest
+from types import SimpleNamespace
+
+from entity.db import Database
+
+
+class _DummyCursor:
+    def close(self):
+        pass
+
+
+class _DummyConn:
+    def __init__(self):
+        self.commits = 0
+        self.rollbacks = 0
+        self.executed = []
+
+    def cursor(self):
+        return _DummyCursor()
+
+    def execute(self, sql):
+        self.executed.append(sql)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+class _DummyPool:
+    def __init__(self):
+        self.conn = _DummyConn()
+        self.taken = 0
+        self.returned = 0
+
+    def getconn(self):
+        self.taken += 1
+        return self.conn
+
+    def putconn(self, conn):
+        self.returned += 1
+
+    def get_stats(self):
+        return {"pool_size": 4, "pool_available": 1, "requests_waiting": 2}
+
+
+def _make_db():
+    db = Database(SimpleNamespace())
+    db._pool = _DummyPool()
+    return db
+
+
+class DatabasePoolTests(unittest.TestCase):
+    def test_session_commits_and_returns_connection(self):
+        db = _make_db()
+
+        with db.session() as conn:
+            self.assertIs(conn, db._pool.conn)
+
+        self.assertEqual(db._pool.conn.commits, 1)
+        self.assertEqual(db._pool.conn.rollbacks, 0)
+        self.assertEqual((db._pool.taken, db._pool.returned), (1, 1))
+
+    def test_session_rolls_back_and_returns_connection_on_error(self):
+        db = _make_db()
+
+        with self.assertRaises(RuntimeError):
+            with db.session():
+                raise RuntimeError("boom")
+
+        self.assertEqual(db._pool.conn.commits, 0)
+        self.assertEqual(db._pool.conn.rollbacks, 1)
+        self.assertEqual(db._pool.returned, 1)
+
+    def test_pool_stats_report_usage_and_reset_latency(self):
+        db = _make_db()
+        with db.session():
+            pass
+        with db.session():
+            pass
+
+        stats = db.pool_stats(reset=True)
+        self.assertEqual(stats["size"], 4)
+        self.assertEqual(stats["in_use"], 3)
+        self.assertEqual(stats["waiting"], 2)
+        self.assertEqual(stats["checkouts"], 2)
+        self.assertGreaterEqual(stats["checkout_max_ms"], 0.0)
+        self.assertEqual(db.pool_stats()["checkouts"], 0)
+
+
+class UnitOfWorkTests(unittest.TestCase):
+    def test_repository_calls_join_one_connection_and_commit(self):
+        db = _make_db()
+
+        with db.transaction():
+            with db.cursor():
+                pass
+            with db.cursor():
+                pass
+            with db.session():
+                pass
+
+        self.assertEqual(db._pool.taken, 1)
+        self.assertEqual(db._pool.conn.commits, 1)
+
+    def test_error_rolls_back_whole_unit_of_work(self):
+        db = _make_db()
+
+        with self.assertRaises(ValueError):
+            with db.transaction():
+                with db.cursor():
+                    pass
+                raise ValueError("bad")
+
+        self.assertEqual(db._pool.conn.commits, 0)
+        self.assertEqual(db._pool.conn.rollbacks, 1)
+
+    def test_nested_block_uses_savepoint(self):
+        db = _make_db()
+
+        with db.transaction():
+            try:
+                with db.transaction():
+                    raise RuntimeError("best-effort step failed")
+            except RuntimeError:
+                pass
+
+        executed = db._pool.conn.executed
+        self.assertTrue(executed[0].startswith("SAVEPOINT "))
+        self.assertTrue(executed[1].startswith("ROLLBACK TO SAVEPOINT "))
+        self.assertEqual(db._pool.conn.commits, 1)
+        self.assertEqual(db._pool.taken, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,145 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from zoneinfo import ZoneInfo
+
+from scheduling.habit_schedule_service import HabitScheduleService
+
+
+class DummyHabits:
+    def __init__(self, habits):
+        self.habits = habits
+
+    def list_active(self, user_ids=None):
+        return [dict(h) for h in self.habits if user_ids is None or h["user_id"] in user_ids]
+
+    def set_planned_until(self, until_by_habit):
+        for h in self.habits:
+            if h["id"] in until_by_habit:
+                h["planned_until"] = datetime.fromisoformat(until_by_habit[h["id"]])
+        return len(until_by_habit)
+
+    def reset_planned_for_user(self, user_id):
+        for h in self.habits:
+            if h["user_id"] == user_id:
+                h["planned_until"] = None
+
+
+class DummyOccurrences:
+    def __init__(self):
+        self.rows = {}
+        self.calls = []
+
+    def insert_planned_bulk(self, rows):
+        self.calls.append(list(rows))
+        created = {}
+        for habit_id, _user_id, iso in rows:
+            key = (habit_id, datetime.fromisoformat(iso))
+            if key not in self.rows:
+                self.rows[key] = len(self.rows) + 1
+                created[key] = self.rows[key]
+        return created
+
+    def cancel_future_for_user(self, user_id, from_utc_iso):
+        # Cancelled slots may be planned again (insert_planned_bulk revives them).
+        start = datetime.fromisoformat(from_utc_iso)
+        future = [key for key in self.rows if key[1] >= start]
+        for key in future:
+            del self.rows[key]
+        return len(future)
+
+
+class DummyOutbox:
+    def __init__(self):
+        self.calls = []
+
+    def create_jobs_bulk(self, jobs):
+        self.calls.append(list(jobs))
+        return {(uid, payload["job_key"]) for uid, _run_at, payload in jobs}
+
+    def cancel_future_jobs(self, user_id, kinds, from_utc_iso):
+        self.cancelled = (user_id, kinds)
+        return 1
+
+
+class DummyUsers:
+    def __init__(self):
+        self.zone = ZoneInfo("UTC")
+
+    def get_zone(self, user_id):
+        return self.zone
+
+
+def _svc(habits, horizon=2):
+    svc = HabitScheduleService.__new__(HabitScheduleService)
+    svc.settings = SimpleNamespace(habit_plan_days=horizon)
+    svc.habits = DummyHabits(habits)
+    svc.occ = DummyOccurrences()
+    svc.outbox = DummyOutbox()
+    svc.users = DummyUsers()
+    return svc
+
+
+class HabitScheduleServiceTests(unittest.TestCase):
+    def test_slots_are_written_in_one_batch(self):
+        svc = _svc(
+            [
+                {"id": 1, "user_id": 10, "title": "Вода", "remind_time": "23:59", "frequency": "daily"},
+                {"id": 2, "user_id": 11, "title": "Сон", "remind_time": "23:59", "frequency": "daily"},
+            ]
+        )
+
+        created = svc.schedule_due_jobs()
+
+        self.assertEqual(created, 6)
+        self.assertEqual(len(svc.occ.calls), 1)
+        self.assertEqual(len(svc.outbox.calls), 1)
+        payload = svc.outbox.calls[0][0][2]
+        self.assertEqual(payload["kind"], "habit_reminder")
+        self.assertEqual(payload["job_key"], f"habit:{payload['habit_id']}:{payload['occurrence_id']}")
+
+    def test_next_pass_only_plans_past_the_edge(self):
+        svc = _svc([{"id": 1, "user_id": 10, "title": "Вода", "remind_time": "23:59", "frequency": "daily"}])
+        svc.schedule_due_jobs()
+        edge = svc.habits.habits[0]["planned_until"]
+
+        self.assertEqual(svc.schedule_due_jobs(), 0)
+        self.assertEqual(len(svc.occ.calls), 1)  # nothing new to write
+
+        # Pretend a day has passed: the horizon gains one new slot.
+        svc.habits.habits[0]["planned_until"] = edge - timedelta(days=1)
+        del svc.occ.rows[(1, edge)]
+        self.assertEqual(svc.schedule_due_jobs(), 1)
+        self.assertEqual(len(svc.occ.calls[-1]), 1)
+        self.assertEqual(datetime.fromisoformat(svc.occ.calls[-1][0][2]), edge)
+
+    def test_frequency_filters_days(self):
+        svc = _svc(
+            [{"id": 1, "user_id": 10, "title": "Бег", "remind_time": "23:59", "frequency": "weekends"}],
+            horizon=6,
+        )
+
+        svc.schedule_due_jobs()
+
+        days = [datetime.fromisoformat(iso).astimezone(timezone.utc).isoweekday() for _h, _u, iso in svc.occ.calls[0]]
+        self.assertEqual(sorted(days), [6, 7])
+
+    def test_timezone_change_replans_future_slots(self):
+        svc = _svc([{"id": 1, "user_id": 10, "title": "Вода", "remind_time": "12:00", "frequency": "daily"}])
+        svc.schedule_due_jobs()
+        self.assertEqual(svc.schedule_due_jobs(), 0)
+
+        svc.users.zone = ZoneInfo("Asia/Tokyo")
+        svc.cancel_future_for_user(10)
+        svc.schedule_due_jobs()
+
+        self.assertEqual(svc.outbox.cancelled, (10, ["habit_reminder"]))
+        self.assertTrue(svc.outbox.calls[-1])
+        for _uid, run_at, payload in svc.outbox.calls[-1]:
+            local = datetime.fromisoformat(run_at).astimezone(ZoneInfo("Asia/Tokyo"))
+            self.assertEqual(local.strftime("%H:%M"), "12:00")
+            self.assertEqual(payload["for_local_time"], "12:00")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,244 @@
+import asyncio
+import threading
+import unittest
+from datetime import date, timezone
+from types import SimpleNamespace
+
+import psycopg
+from telegram.error import Forbidden, TimedOut
+
+from scheduling import worker
+from scheduling.delivery_stats import DeliveryStats
+from scheduling.job_handlers import HANDLERS, KindLimits, parse_kind_limits
+
+
+class _Outbox:
+    def __init__(self, jobs=None):
+        self.jobs = list(jobs or [])
+        self.sent = []
+        self.retried = []
+        self.failed = []
+
+    async def release_expired_leases(self, max_attempts=None, default_max_attempts=3) -> int:
+        return 0
+
+    async def claim_due(self, owner: str, limit: int = 50, lease_sec: int = 120):
+        jobs, self.jobs = self.jobs, []
+        return jobs
+
+    async def renew_leases(self, owner: str, lease_sec: int = 120) -> int:
+        return 0
+
+    async def mark_sent(self, job_id: int):
+        self.sent.append(job_id)
+
+    async def schedule_retry(self, job_id: int, err: str, delay_sec: float):
+        self.retried.append(job_id)
+
+    async def mark_failed(self, job_id: int, err: str):
+        self.failed.append(job_id)
+
+
+class _SyncOutbox:
+    def __init__(self):
+        self.sent = []
+
+    def mark_sent(self, job_id: int):
+        self.sent.append(job_id)
+
+
+class _SentJobs:
+    def __init__(self):
+        self.marked = []
+
+    def mark_sent(self, user_id, content_type, day_index, for_date):
+        self.marked.append((user_id, content_type, day_index, for_date))
+
+
+class _Bot:
+    def __init__(self, exc=None):
+        self.exc = exc
+        self.sent = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def send_message(self, chat_id: int, text: str, **kwargs):
+        if self.exc:
+            raise self.exc
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        self.sent.append((chat_id, text))
+        return SimpleNamespace(message_id=len(self.sent))
+
+
+def _job(job_id: int, user_id: int, payload: dict, attempts: int = 0) -> dict:
+    return {"id": job_id, "user_id": user_id, "attempts": attempts, "payload_json": payload}
+
+
+def _services(outbox, **extra):
+    settings = SimpleNamespace(tg_global_rate_per_sec=1000, tg_per_chat_rate_per_sec=1000, outbox_concurrency=8)
+    schedule = SimpleNamespace(outbox_async=outbox, outbox=_SyncOutbox(), sent_jobs=_SentJobs(), settings=settings)
+    return {"schedule": schedule, "learning": None, "questionnaire": None, **extra}
+
+
+class JobHandlerTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        worker._limiter = None
+        worker._kind_limits = None
+        worker._stats = DeliveryStats()
+
+    def test_every_planned_kind_has_a_handler(self):
+        self.assertEqual(
+            set(HANDLERS),
+            {
+                "day_content",
+                "day_lesson",
+                "day_quest",
+                "day_extra",
+                "daily_reminder",
+                "questionnaire_broadcast",
+                "habit_reminder",
+                "personal_reminder",
+            },
+        )
+
+    def test_kind_limits_setting(self):
+        self.assertEqual(
+            parse_kind_limits("questionnaire_broadcast=4/10, day_extra=/2.5,broken=x/1,"),
+            {"questionnaire_broadcast": (4, 10.0), "day_extra": (None, 2.5)},
+        )
+        limits = KindLimits({"day_extra": (None, 2.5)})
+        self.assertEqual(limits.limits_for("day_extra"), (None, 2.5))
+        self.assertEqual(limits.limits_for("personal_reminder"), (None, None))
+
+    async def test_done_lesson_is_recorded_without_sending(self):
+        outbox = _Outbox()
+        async def viewed(user_id, day_index):
+            return True
+
+        learning = SimpleNamespace(has_viewed_lesson_async=viewed)
+        services = _services(outbox, learning=learning)
+        bot = _Bot()
+        payload = {"kind": "day_lesson", "day_index": 2, "for_date": "2026-02-17", "lesson": {"title": "L2"}}
+
+        await worker._deliver_job(bot, services, _job(1, 10, payload))
+
+        self.assertEqual(bot.sent, [])
+        self.assertEqual(services["schedule"].sent_jobs.marked, [(10, "lesson", 2, date(2026, 2, 17))])
+        self.assertEqual(services["schedule"].outbox.sent, [1])
+        self.assertEqual(worker.delivery_stats().snapshot()["day_lesson"]["skipped"], 1)
+
+    async def test_errors_before_the_send_are_retried(self):
+        async def db_down(user_id, day_index):
+            raise psycopg.OperationalError("server closed the connection unexpectedly")
+
+        async def bug(user_id, day_index):
+            raise KeyError("points")
+
+        payload = {"kind": "day_lesson", "day_index": 2, "for_date": "2026-02-17", "lesson": {"title": "L2"}}
+        for check in (db_down, bug):
+            outbox = _Outbox()
+            bot = _Bot()
+            services = _services(outbox, learning=SimpleNamespace(has_viewed_lesson_async=check))
+
+            await worker._deliver_job(bot, services, _job(1, 10, payload))
+
+            self.assertEqual((outbox.retried, outbox.failed, bot.sent), ([1], [], []))
+
+    async def test_stats_per_kind(self):
+        outbox = _Outbox()
+        services = _services(outbox)
+        reminder = {"kind": "personal_reminder", "text": "a"}
+        habit = {"kind": "habit_reminder", "occurrence_id": 5, "title": "Вода"}
+
+        await worker._deliver_job(_Bot(), services, _job(1, 10, reminder))
+        await worker._deliver_job(_Bot(TimedOut()), services, _job(2, 10, habit))
+        await worker._deliver_job(_Bot(Forbidden("blocked")), services, _job(3, 10, habit))
+
+        stats = worker.delivery_stats().snapshot()
+        self.assertEqual(stats["personal_reminder"]["sent"], 1)
+        self.assertEqual((stats["habit_reminder"]["retried"], stats["habit_reminder"]["failed"]), (1, 1))
+        self.assertEqual((outbox.sent, outbox.retried, outbox.failed), ([1], [2], [3]))
+
+    async def test_kind_concurrency_limit_applies_across_users(self):
+        jobs = [_job(i, 10 + i, {"kind": "personal_reminder", "text": str(i)}) for i in range(1, 5)]
+        outbox = _Outbox(jobs)
+        services = _services(outbox)
+        worker._kind_limits = KindLimits({"personal_reminder": (1, None)})
+        bot = _Bot()
+
+        await asyncio.wait_for(worker._process_outbox(SimpleNamespace(bot=bot), services), timeout=1)
+
+        self.assertEqual(sorted(outbox.sent), [1, 2, 3, 4])
+        self.assertEqual(bot.max_in_flight, 1)
+
+    async def test_failed_bookkeeping_after_send_is_not_retried(self):
+        def mark_fired(reminder_id):
+            raise RuntimeError("db hiccup")
+
+        outbox = _Outbox()
+        reminders = SimpleNamespace(repo=SimpleNamespace(mark_fired=mark_fired))
+        services = _services(outbox, personal_reminder_schedule=reminders)
+        bot = _Bot()
+
+        await worker._deliver_job(bot, services, _job(1, 10, {"kind": "personal_reminder", "reminder_id": 7, "text": "a"}))
+
+        self.assertEqual(len(bot.sent), 1)
+        self.assertEqual((outbox.sent, outbox.retried, outbox.failed), ([1], [], []))
+
+    async def test_partly_delivered_day_content_is_recorded_not_resent(self):
+        class _SecondSendFails(_Bot):
+            async def send_message(self, chat_id: int, text: str, **kwargs):
+                if self.sent:
+                    raise TimedOut()
+                return await super().send_message(chat_id, text, **kwargs)
+
+        outbox = _Outbox()
+        services = _services(outbox, learning=SimpleNamespace())
+        schedule = services["schedule"]
+        schedule.make_viewed_cb = lambda day_index, pts: f"viewed:{day_index}"
+        schedule._user_tz = lambda user_id: timezone.utc
+        schedule.deliveries = SimpleNamespace(mark_sent=lambda user_id, day_index, content_type: None)
+        bot = _SecondSendFails()
+        payload = {"kind": "day_content", "day_index": 3, "lesson": {"title": "L3"}, "quest": {"prompt": "Q", "points": 1}}
+
+        await worker._deliver_job(bot, services, _job(1, 10, payload))
+
+        self.assertEqual(len(bot.sent), 1)
+        self.assertEqual((outbox.retried, outbox.failed), ([], []))
+        self.assertEqual(schedule.outbox.sent, [1])
+        self.assertEqual([m[1] for m in schedule.sent_jobs.marked], ["lesson"])
+
+    async def test_blocking_repos_run_off_the_event_loop(self):
+        threads = []
+
+        def has_response(user_id, qid):
+            threads.append(threading.get_ident())
+            return False
+
+        def get(qid):
+            threads.append(threading.get_ident())
+            return {"question": "Q"}
+
+        def mark_sent(occurrence_id):
+            threads.append(threading.get_ident())
+
+        outbox = _Outbox()
+        services = _services(
+            outbox,
+            questionnaire=SimpleNamespace(has_response=has_response, get=get),
+            habit=SimpleNamespace(occ=SimpleNamespace(mark_sent=mark_sent)),
+        )
+
+        await worker._deliver_job(_Bot(), services, _job(1, 10, {"kind": "questionnaire_broadcast", "questionnaire_id": 4}))
+        await worker._deliver_job(_Bot(), services, _job(2, 10, {"kind": "habit_reminder", "occurrence_id": 5}))
+
+        self.assertEqual(len(threads), 3)
+        self.assertNotIn(threading.get_ident(), threads)
+        self.assertEqual(outbox.sent, [2])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -49,6 +49,14 @@ class DummyState:
         self.cleared.append(user_id)
 
 
+class DummyOpenItems:
+    def __init__(self):
+        self.closed = []
+
+    def close(self, user_id: int, kind: str, day_index=None, item_id: int = 0):
+        self.closed.append((user_id, kind, day_index, item_id))
+
+
 class DummyOcc:
     def __init__(self):
         self.done_calls = []
@@ -65,12 +73,14 @@ class LearningAndHabitTests(unittest.TestCase):
         svc.points = DummyPoints()
         svc.progress = DummyProgress()
         svc.state = DummyState()
+        svc.open_items = DummyOpenItems()
 
         svc.submit_answer(user_id=11, day_index=3, points=7, answer_text="my answer")
 
         self.assertEqual(svc.answers.saved, [(11, 3, "my answer")])
         self.assertEqual(svc.points.added, [(11, "quest", "day:3", 7)])
         self.assertEqual(svc.progress.done_calls, [(11, 3)])
+        self.assertEqual(svc.open_items.closed, [(11, "quest", 3, 0)])
         self.assertEqual(svc.state.cleared, [11])
         self.assertTrue(svc.has_quest_answer(11, 3))
 
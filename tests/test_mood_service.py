@@ -1,6 +1,7 @@
 import unittest
 from datetime import date
 from types import SimpleNamespace
+from zoneinfo import ZoneInfo
 
 from core.mood_service import MoodService
 
@@ -28,6 +29,9 @@ class DummyUsers:
     def get_timezone(self, user_id: int):
         return "UTC"
 
+    def get_zone(self, user_id: int):
+        return ZoneInfo("UTC")
+
 
 class MoodServiceTests(unittest.TestCase):
     def _svc(self):
@@ -0,0 +1,201 @@
+import asyncio
+import unittest
+from datetime import date, datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from telegram.error import TimedOut
+
+from scheduling import worker
+from scheduling.delivery_stats import DeliveryStats
+from scheduling.job_handlers import KindLimits
+
+
+class _Outbox:
+    def __init__(self, jobs):
+        self.jobs = jobs
+        self.sent = []
+        self.retried = []
+
+    async def release_expired_leases(self, max_attempts=None, default_max_attempts=3) -> int:
+        return 0
+
+    async def claim_due(self, owner: str, limit: int = 50, lease_sec: int = 120):
+        jobs, self.jobs = self.jobs, []
+        return jobs
+
+    async def renew_leases(self, owner: str, lease_sec: int = 120) -> int:
+        return 0
+
+    async def mark_sent(self, job_id: int):
+        self.sent.append(job_id)
+
+    async def schedule_retry(self, job_id: int, err: str, delay_sec: float):
+        self.retried.append(job_id)
+
+    async def mark_failed(self, job_id: int, err: str):
+        raise AssertionError("unexpected permanent failure")
+
+
+class _SyncOutbox:
+    def __init__(self):
+        self.sent = []
+
+    def mark_sent(self, job_id: int):
+        self.sent.append(job_id)
+
+
+class _Recorder:
+    def __init__(self):
+        self.calls = []
+
+    def mark_sent(self, *args):
+        self.calls.append(args)
+
+    def set_state(self, *args):
+        self.calls.append(args)
+
+    def upsert(self, **kwargs):
+        self.calls.append(kwargs)
+
+
+class _Bot:
+    def __init__(self, exc=None):
+        self.exc = exc
+        self.messages = []
+
+    async def send_message(self, chat_id: int, text: str, **kwargs):
+        if self.exc:
+            raise self.exc
+        self.messages.append((chat_id, text, kwargs.get("reply_markup")))
+        return SimpleNamespace(message_id=500 + len(self.messages))
+
+
+T0 = datetime(2026, 2, 17, 9, 0, tzinfo=timezone.utc)
+
+
+def _day_jobs(run_at=T0):
+    return [
+        {"id": 1, "user_id": 7, "run_at": run_at, "payload_json": {
+            "kind": "day_lesson", "day_index": 3, "for_date": "2026-02-17", "lesson": {"title": "Лекция"}}},
+        {"id": 2, "user_id": 7, "run_at": run_at, "payload_json": {
+            "kind": "day_quest", "day_index": 3, "for_date": "2026-02-17", "quest": {"prompt": "Сделай", "points": 5}}},
+        {"id": 3, "user_id": 7, "run_at": run_at, "payload_json": {
+            "kind": "questionnaire_broadcast", "questionnaire_id": 11, "day_index": 3, "for_date": "2026-02-17"}},
+        {"id": 4, "user_id": 7, "run_at": run_at, "payload_json": {
+            "kind": "questionnaire_broadcast", "questionnaire_id": 12, "day_index": 3, "for_date": "2026-02-17"}},
+    ]
+
+
+def _services(outbox, coalesce_sec=60):
+    settings = SimpleNamespace(
+        outbox_coalesce_sec=coalesce_sec,
+        outbox_concurrency=4,
+        tg_global_rate_per_sec=1000,
+        tg_per_chat_rate_per_sec=1000,
+    )
+    schedule = SimpleNamespace(
+        outbox_async=outbox,
+        outbox=_SyncOutbox(),
+        settings=settings,
+        sent_jobs=_Recorder(),
+        deliveries=_Recorder(),
+        material_messages=_Recorder(),
+        make_viewed_cb=lambda day_index, pts: f"viewed:{day_index}:{pts}",
+        questionnaire_content_type=lambda qid: "questionnaire",
+    )
+    async def not_done(user_id, day_index):
+        return False
+
+    learning = SimpleNamespace(
+        has_viewed_lesson_async=not_done,
+        has_quest_answer_async=not_done,
+        state=_Recorder(),
+        progress=_Recorder(),
+    )
+    questionnaire = SimpleNamespace(
+        has_response=lambda user_id, qid: False,
+        get=lambda qid: {"question": f"Вопрос {qid}"},
+    )
+    return {"schedule": schedule, "learning": learning, "questionnaire": questionnaire}
+
+
+class OutboxCoalescingTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        worker._limiter = None
+        worker._kind_limits = None
+        worker._stats = DeliveryStats()
+
+    async def test_simultaneous_day_jobs_share_one_message(self):
+        outbox = _Outbox(_day_jobs())
+        services = _services(outbox)
+        bot = _Bot()
+
+        await worker._process_outbox(SimpleNamespace(bot=bot), services)
+
+        # Lesson, quest and the first questionnaire merged; a second
+        # questionnaire's score row would be ambiguous, so it goes alone.
+        self.assertEqual(len(bot.messages), 2)
+        text = bot.messages[0][1]
+        self.assertIn("Лекция", text)
+        self.assertIn("Сделай", text)
+        self.assertIn("Вопрос 11", text)
+        self.assertEqual(len(bot.messages[0][2].inline_keyboard), 3)
+        self.assertEqual(sorted(services["schedule"].outbox.sent), [1, 2, 3, 4])
+        marked = [c for c in services["schedule"].sent_jobs.calls]
+        self.assertIn((7, "lesson", 3, date(2026, 2, 17)), marked)
+        self.assertIn((7, "quest", 3, date(2026, 2, 17)), marked)
+        # Reminder navigation points at the merged message.
+        saved = [c["message_id"] for c in services["schedule"].material_messages.calls]
+        self.assertEqual(saved[:3], [501, 501, 501])
+
+    async def test_failed_merged_send_retries_every_job(self):
+        outbox = _Outbox(_day_jobs()[:2])
+        services = _services(outbox)
+
+        await worker._process_outbox(SimpleNamespace(bot=_Bot(TimedOut())), services)
+
+        self.assertEqual(sorted(outbox.retried), [1, 2])
+        self.assertEqual(services["schedule"].outbox.sent, [])
+
+    async def test_jobs_outside_the_window_are_sent_apart(self):
+        jobs = _day_jobs()[:2]
+        jobs[1]["run_at"] = T0 + timedelta(minutes=5)
+        outbox = _Outbox(jobs)
+        bot = _Bot()
+
+        await worker._process_outbox(SimpleNamespace(bot=bot), _services(outbox, coalesce_sec=60))
+
+        self.assertEqual(len(bot.messages), 2)
+
+    async def test_disabled_coalescing_sends_each_job(self):
+        outbox = _Outbox(_day_jobs()[:2])
+        bot = _Bot()
+
+        await worker._process_outbox(SimpleNamespace(bot=bot), _services(outbox, coalesce_sec=0))
+
+        self.assertEqual(len(bot.messages), 2)
+
+    async def test_merged_send_holds_a_slot_of_each_kind(self):
+        class _SlowBot(_Bot):
+            in_flight = max_in_flight = 0
+
+            async def send_message(self, chat_id: int, text: str, **kwargs):
+                self.in_flight += 1
+                self.max_in_flight = max(self.max_in_flight, self.in_flight)
+                await asyncio.sleep(0.01)
+                self.in_flight -= 1
+                return await super().send_message(chat_id, text, **kwargs)
+
+        jobs = _day_jobs()[:2] + [dict(j, id=j["id"] + 10, user_id=8) for j in _day_jobs()[:2]]
+        outbox = _Outbox(jobs)
+        worker._kind_limits = KindLimits({"day_quest": (1, None)})
+        bot = _SlowBot()
+
+        await worker._process_outbox(SimpleNamespace(bot=bot), _services(outbox))
+
+        self.assertEqual(len(bot.messages), 2)
+        self.assertEqual(bot.max_in_flight, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
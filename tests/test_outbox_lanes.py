@@ -0,0 +1,137 @@
+import asyncio
+import unittest
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+
+from entity.repositories.outbox_repo import (
+    DEFAULT_LANE_WEIGHTS,
+    LANE_BROADCAST,
+    LANE_CONTENT,
+    LANE_INTERACTIVE,
+    LANE_REMINDER,
+    AsyncOutboxRepo,
+    job_lane,
+    parse_lane_weights,
+)
+from scheduling import worker
+from scheduling.delivery_stats import DeliveryStats
+
+
+class _Cursor:
+    def __init__(self, db):
+        self.db = db
+        self.rowcount = 0
+
+    async def execute(self, sql, params=None):
+        self.db.executed.append((sql, params))
+        self.rowcount = self.db.rowcounts.pop(0) if self.db.rowcounts else 0
+
+    async def fetchall(self):
+        return list(self.db.rows)
+
+
+class _AsyncDb:
+    def __init__(self, rows, rowcounts=None):
+        self.rows = rows
+        self.rowcounts = list(rowcounts or [])
+        self.executed = []
+
+    @asynccontextmanager
+    async def cursor(self):
+        yield _Cursor(self)
+
+
+class _Outbox:
+    def __init__(self, jobs):
+        self.jobs = jobs
+        self.sent = []
+
+    async def release_expired_leases(self, max_attempts=None, default_max_attempts=3) -> int:
+        return 0
+
+    async def claim_due(self, owner: str, limit: int = 50, lease_sec: int = 120):
+        jobs, self.jobs = self.jobs, []
+        return jobs
+
+    async def renew_leases(self, owner: str, lease_sec: int = 120) -> int:
+        return 0
+
+    async def mark_sent(self, job_id: int):
+        self.sent.append(job_id)
+
+
+class _Bot:
+    def __init__(self):
+        self.chats = []
+
+    async def send_message(self, chat_id: int, text: str, **kwargs):
+        self.chats.append(chat_id)
+        await asyncio.sleep(0)
+
+
+class OutboxLaneTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        worker._limiter = None
+        worker._kind_limits = None
+        worker._stats = DeliveryStats()
+
+    def test_lane_weights_setting(self):
+        self.assertEqual(parse_lane_weights(""), DEFAULT_LANE_WEIGHTS)
+        self.assertEqual(parse_lane_weights("10,,x,0.5"), {0: 10.0, 1: 4.0, 2: 2.0, 3: 0.5})
+
+    def test_job_lane_from_payload(self):
+        self.assertEqual(job_lane({"kind": "day_lesson", "lane": LANE_INTERACTIVE}), LANE_INTERACTIVE)
+        self.assertEqual(job_lane({"kind": "personal_reminder", "lane": "7"}), LANE_REMINDER)
+        self.assertEqual(job_lane({"kind": "habit_reminder"}), LANE_REMINDER)
+        self.assertEqual(job_lane({"kind": "questionnaire_broadcast", "questionnaire_id": 3}), LANE_BROADCAST)
+        self.assertEqual(job_lane({"kind": "questionnaire_broadcast", "day_index": 4}), LANE_CONTENT)
+        self.assertEqual(job_lane({"kind": "day_quest"}), LANE_CONTENT)
+
+    async def test_lane_backfill_runs_in_batches_until_done(self):
+        db = _AsyncDb([], rowcounts=[2, 2, 1])
+        repo = AsyncOutboxRepo(db)
+
+        self.assertEqual(await repo.backfill_lanes(batch_size=2), 5)
+        self.assertEqual([params for _, params in db.executed], [(2,), (2,), (2,)])
+
+    async def test_reaper_counts_the_attempt_and_fails_exhausted_jobs(self):
+        db = _AsyncDb([], rowcounts=[2])
+        repo = AsyncOutboxRepo(db)
+
+        self.assertEqual(await repo.release_expired_leases({"day_quest": 6, "habit_reminder": 3}, 4), 2)
+        sql, params = db.executed[0]
+        self.assertIn("attempts = j.attempts + 1", sql)
+        self.assertIn("THEN 'failed'", sql)
+        self.assertEqual((params["kinds"], params["limits"], params["default_max"]), (["day_quest", "habit_reminder"], [6, 3], 4))
+
+    async def test_claim_passes_lane_weights_and_keeps_run_at_order(self):
+        db = _AsyncDb([{"id": 2, "run_at": 2}, {"id": 1, "run_at": 1}])
+        repo = AsyncOutboxRepo(db, parse_lane_weights("8,4,2,1"))
+
+        rows = await repo.claim_due("w1", limit=10, lease_sec=60)
+
+        self.assertEqual([r["id"] for r in rows], [1, 2])
+        params = db.executed[0][1]
+        self.assertEqual(params["lanes"], [0, 1, 2, 3])
+        self.assertEqual(params["weights"], [8.0, 4.0, 2.0, 1.0])
+        self.assertEqual((params["limit"], params["owner"], params["lease_sec"]), (10, "w1", 60))
+
+    async def test_reminder_users_are_served_before_broadcast_users(self):
+        broadcast = [
+            {"id": i, "user_id": 100 + i, "lane": LANE_BROADCAST, "payload_json": {"kind": "personal_reminder"}}
+            for i in range(1, 4)
+        ]
+        reminder = {"id": 9, "user_id": 7, "lane": LANE_REMINDER, "payload_json": {"kind": "personal_reminder"}}
+        outbox = _Outbox(broadcast + [reminder])
+        settings = SimpleNamespace(outbox_concurrency=1, tg_global_rate_per_sec=1000, tg_per_chat_rate_per_sec=1000)
+        services = {"schedule": SimpleNamespace(outbox_async=outbox, settings=settings)}
+        bot = _Bot()
+
+        await asyncio.wait_for(worker._process_outbox(SimpleNamespace(bot=bot), services), timeout=1)
+
+        self.assertEqual(bot.chats[0], 7)
+        self.assertEqual(sorted(outbox.sent), [1, 2, 3, 9])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,7 @@
 import unittest
 from datetime import datetime, timezone
 from types import SimpleNamespace
+from zoneinfo import ZoneInfo
 
 from scheduling.personal_reminder_schedule_service import PersonalReminderScheduleService
 
@@ -8,9 +9,12 @@ from scheduling.personal_reminder_schedule_service import PersonalReminderSchedu
 class DummyRepo:
     def __init__(self, rows):
         self.rows = rows
+        self.windows = []
 
-    def list_active(self):
-        return self.rows
+    def list_due_window(self, from_iso, until_iso, user_ids=None):
+        self.windows.append((from_iso, until_iso))
+        start, until = datetime.fromisoformat(from_iso), datetime.fromisoformat(until_iso)
+        return [r for r in self.rows if start <= r["start_at"] < until]
 
 
 class DummyUsers:
@@ -20,6 +24,9 @@ class DummyUsers:
     def get_timezone(self, user_id: int) -> str:
         return self.tz_name
 
+    def get_zone(self, user_id: int) -> ZoneInfo:
+        return ZoneInfo(self.tz_name)
+
 
 class DummyOutbox:
     def __init__(self, existing=None):
@@ -32,6 +39,15 @@ class DummyOutbox:
     def create_job(self, user_id: int, run_at_iso: str, payload: dict):
         self.created.append((user_id, run_at_iso, payload))
 
+    def create_jobs_bulk(self, jobs):
+        inserted = set()
+        for user_id, run_at_iso, payload in jobs:
+            if self.exists_job_for(user_id, payload["job_key"]):
+                continue
+            self.create_job(user_id, run_at_iso, payload)
+            inserted.add((user_id, payload["job_key"]))
+        return inserted
+
 
 class PersonalReminderScheduleServiceTests(unittest.TestCase):
     def test_creates_one_job_for_future_one_time_reminder(self):
@@ -92,6 +108,23 @@ class PersonalReminderScheduleServiceTests(unittest.TestCase):
         self.assertEqual(created, 0)
         self.assertEqual(svc.outbox.created, [])
 
+    def test_reminders_beyond_the_window_wait(self):
+        svc = PersonalReminderScheduleService.__new__(PersonalReminderScheduleService)
+        svc.settings = SimpleNamespace(default_timezone="UTC", personal_reminder_window_hours=24)
+        svc.repo = DummyRepo(
+            [
+                {"id": 10, "user_id": 1, "text": "Скоро", "start_at": datetime(2026, 2, 18, 7, 0, tzinfo=timezone.utc)},
+                {"id": 11, "user_id": 1, "text": "Потом", "start_at": datetime(2026, 3, 1, 9, 0, tzinfo=timezone.utc)},
+            ]
+        )
+        svc.outbox = DummyOutbox()
+        svc.users = DummyUsers("UTC")
+        svc._now_utc = lambda: datetime(2026, 2, 17, 8, 0, tzinfo=timezone.utc)
+
+        self.assertEqual(svc.schedule_due_jobs(), 1)
+        self.assertEqual(svc.outbox.created[0][2]["reminder_id"], 10)
+        self.assertEqual(svc.repo.windows, [("2026-02-17T08:00:00+00:00", "2026-02-18T08:00:00+00:00")])
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,113 @@
+import unittest
+from contextlib import nullcontext
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from zoneinfo import ZoneInfo
+
+from scheduling.planner_service import PlannerService
+
+
+class DummyDb:
+    def transaction(self):
+        return nullcontext()
+
+
+class DummyQueue:
+    def __init__(self, rows):
+        self.rows = rows
+        self.horizons = None
+
+    def claim_due(self, limit: int = 500):
+        rows, self.rows = self.rows, []
+        return rows
+
+    def set_horizons(self, horizons, reason: str = "horizon"):
+        self.horizons = horizons
+        return len(horizons)
+
+
+class DummyPlanner:
+    def __init__(self, created: int = 1):
+        self.created = created
+        self.calls = []
+
+    def schedule_due_jobs(self, user_ids=None):
+        self.calls.append(user_ids)
+        return self.created
+
+
+class DummySchedule(DummyPlanner):
+    def __init__(self):
+        super().__init__()
+        self.settings = SimpleNamespace(default_timezone="Europe/Moscow")
+        self.cancelled = []
+
+    def _zone(self, tz_name):
+        try:
+            return ZoneInfo(tz_name or self.settings.default_timezone)
+        except Exception:
+            return ZoneInfo(self.settings.default_timezone)
+
+    def cancel_future_day_jobs(self, user_id: int, now_utc=None) -> int:
+        self.cancelled.append(user_id)
+        return 0
+
+
+class DummyUsers:
+    def __init__(self, tz_by_user):
+        self.tz_by_user = tz_by_user
+
+    def get_timezones(self, user_ids):
+        return {u: self.tz_by_user.get(u) for u in user_ids}
+
+
+def _svc(rows, tz_by_user=None):
+    svc = PlannerService.__new__(PlannerService)
+    svc.db = DummyDb()
+    svc.schedule = DummySchedule()
+    svc.habit_schedule = DummyPlanner()
+    svc.personal_reminder_schedule = DummyPlanner()
+    svc.queue = DummyQueue(rows)
+    svc.users = DummyUsers(tz_by_user or {})
+    return svc
+
+
+class PlannerServiceTests(unittest.TestCase):
+    def test_run_due_plans_only_queued_users_and_sets_horizons(self):
+        svc = _svc(
+            [
+                {"user_id": 2, "reason": "horizon", "reschedule": False},
+                {"user_id": 1, "reason": "delivery_time", "reschedule": True},
+            ],
+            {1: "Asia/Tokyo", 2: None},
+        )
+
+        self.assertEqual(svc.run_due(), 2)
+
+        self.assertEqual(svc.schedule.calls, [[1, 2]])
+        self.assertEqual(svc.habit_schedule.calls, [[1, 2]])
+        self.assertEqual(svc.personal_reminder_schedule.calls, [[1, 2]])
+        # Only the user whose delivery time moved drops already planned day jobs.
+        self.assertEqual(svc.schedule.cancelled, [1])
+        self.assertEqual(sorted(svc.queue.horizons), [1, 2])
+
+    def test_run_due_with_empty_queue_does_nothing(self):
+        svc = _svc([])
+        self.assertEqual(svc.run_due(), 0)
+        self.assertEqual(svc.schedule.calls, [])
+        self.assertIsNone(svc.queue.horizons)
+
+    def test_next_horizon_is_just_after_local_midnight(self):
+        svc = _svc([])
+        now_utc = datetime(2024, 3, 10, 20, 0, tzinfo=timezone.utc)  # 05:00 on Mar 11 in Tokyo
+
+        tokyo = svc.next_horizon("Asia/Tokyo", now_utc)
+        self.assertEqual(tokyo, datetime(2024, 3, 11, 15, 1, tzinfo=timezone.utc))
+
+        # Unknown zones fall back to the default (Moscow, UTC+3): Mar 10 23:00 local.
+        moscow = svc.next_horizon("Mars/Olympus", now_utc)
+        self.assertEqual(moscow, datetime(2024, 3, 10, 21, 1, tzinfo=timezone.utc))
+
+
+if __name__ == "__main__":
+    unittest.main()
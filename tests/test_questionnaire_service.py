@@ -48,6 +48,14 @@ class DummyQuestionnaireRepo:
         return {"id": qid, "points": self.points_by_qid.get(qid, 0)}
 
 
+class DummyOpenItems:
+    def __init__(self):
+        self.closed = []
+
+    def close(self, user_id: int, kind: str, day_index=None, item_id: int = 0):
+        self.closed.append((user_id, kind, day_index, item_id))
+
+
 class QuestionnaireServiceTests(unittest.TestCase):
     def test_start_comment_flow_sets_wait_state_without_points(self):
         svc = QuestionnaireService.__new__(QuestionnaireService)
@@ -55,6 +63,7 @@ class QuestionnaireServiceTests(unittest.TestCase):
         svc.r = DummyResponses()
         svc.state = DummyState()
         svc.q = DummyQuestionnaireRepo()
+        svc.open_items = DummyOpenItems()
 
         svc.start_comment_flow(user_id=11, qid=5, score=4, points=2)
 
@@ -72,12 +81,14 @@ class QuestionnaireServiceTests(unittest.TestCase):
         svc.r = DummyResponses()
         svc.state = DummyState()
         svc.q = DummyQuestionnaireRepo()
+        svc.open_items = DummyOpenItems()
 
         created = svc.submit_score_only(user_id=11, qid=7, score=3, points=1)
 
         self.assertTrue(created)
         self.assertEqual(svc.points.calls, [(11, "questionnaire_score", "q:7", 1)])
         self.assertEqual(svc.r.calls, [(7, 11, 3, "")])
+        self.assertEqual(svc.open_items.closed, [(11, "questionnaire", None, 7)])
         self.assertEqual(svc.state.set_calls, [])
         self.assertEqual(svc.state.clear_calls, [])
 
@@ -87,6 +98,7 @@ class QuestionnaireServiceTests(unittest.TestCase):
         svc.r = DummyResponses()
         svc.state = DummyState()
         svc.q = DummyQuestionnaireRepo()
+        svc.open_items = DummyOpenItems()
         svc.q.responded.add((11, 7))
 
         created = svc.submit_score_only(user_id=11, qid=7, score=3, points=1)
@@ -101,6 +113,7 @@ class QuestionnaireServiceTests(unittest.TestCase):
         svc.r = DummyResponses()
         svc.state = DummyState()
         svc.q = DummyQuestionnaireRepo()
+        svc.open_items = DummyOpenItems()
         svc.q.points_by_qid[5] = 4
 
         saved = svc.save_comment(user_id=11, qid=5, score=4, comment="ok")
@@ -108,6 +121,7 @@ class QuestionnaireServiceTests(unittest.TestCase):
         self.assertTrue(saved)
         self.assertEqual(svc.points.calls, [(11, "questionnaire_score", "q:5", 4)])
         self.assertEqual(svc.r.calls, [(5, 11, 4, "ok")])
+        self.assertEqual(svc.open_items.closed, [(11, "questionnaire", None, 5)])
         self.assertEqual(svc.state.clear_calls, [11])
 
     def test_save_comment_when_already_answered_does_not_duplicate(self):
@@ -116,6 +130,7 @@ class QuestionnaireServiceTests(unittest.TestCase):
         svc.r = DummyResponses()
         svc.state = DummyState()
         svc.q = DummyQuestionnaireRepo()
+        svc.open_items = DummyOpenItems()
         svc.q.responded.add((11, 5))
 
         saved = svc.save_comment(user_id=11, qid=5, score=4, comment="ok")
@@ -0,0 +1,73 @@
+import unittest
+
+from scheduling.rate_limiter import RateLimitedBot, TelegramRateLimiter, TokenBucket
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TokenBucketTests(unittest.TestCase):
+    def test_burst_then_waits_proportionally(self):
+        clock = _Clock()
+        bucket = TokenBucket(rate=2, clock=clock)
+        self.assertEqual(bucket.reserve(), 0.0)
+        self.assertEqual(bucket.reserve(), 0.0)
+        self.assertAlmostEqual(bucket.reserve(), 0.5)
+        self.assertAlmostEqual(bucket.reserve(), 1.0)
+
+    def test_refills_over_time_up_to_capacity(self):
+        clock = _Clock()
+        bucket = TokenBucket(rate=1, capacity=1, clock=clock)
+        bucket.reserve()
+        clock.now = 10.0
+        self.assertTrue(bucket.is_idle())
+        self.assertEqual(bucket.reserve(), 0.0)
+        self.assertAlmostEqual(bucket.reserve(), 1.0)
+
+
+class _Bot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id: int, text: str):
+        self.sent.append((chat_id, text))
+        return text
+
+    def get_me(self):
+        return "me"
+
+
+class RateLimitedBotTests(unittest.IsolatedAsyncioTestCase):
+    async def test_send_goes_through_limiter_other_calls_pass_through(self):
+        limiter = TelegramRateLimiter(global_rate=1000, per_chat_rate=1000)
+        acquired = []
+        orig = limiter.acquire
+
+        async def _acquire(chat_id):
+            acquired.append(chat_id)
+            await orig(chat_id)
+
+        limiter.acquire = _acquire
+        bot = _Bot()
+        limited = RateLimitedBot(bot, limiter)
+
+        self.assertEqual(await limited.send_message(chat_id=5, text="hi"), "hi")
+        self.assertEqual(limited.get_me(), "me")
+        self.assertEqual(acquired, [5])
+        self.assertEqual(bot.sent, [(5, "hi")])
+
+    def test_per_chat_buckets_are_independent(self):
+        clock = _Clock()
+        limiter = TelegramRateLimiter(global_rate=100, per_chat_rate=1, clock=clock)
+        self.assertEqual(limiter._chat_bucket(1).reserve(), 0.0)
+        self.assertEqual(limiter._chat_bucket(2).reserve(), 0.0)
+        self.assertAlmostEqual(limiter._chat_bucket(1).reserve(), 1.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+from unittest import mock
+
+import psycopg
+from psycopg_pool import PoolTimeout
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TimedOut
+
+from scheduling.retry_policy import (
+    PERMANENT,
+    TRANSIENT,
+    RetryPolicy,
+    classify_error,
+    next_delay,
+    policy_for,
+    retry_after_seconds,
+)
+
+
+class RetryPolicyTests(unittest.TestCase):
+    def test_classifies_blocked_and_bad_requests_as_permanent(self):
+        self.assertEqual(classify_error(Forbidden("bot was blocked by the user")), PERMANENT)
+        self.assertEqual(classify_error(BadRequest("chat not found")), PERMANENT)
+        self.assertEqual(classify_error(TimedOut()), TRANSIENT)
+        self.assertEqual(classify_error(RetryAfter(5)), TRANSIENT)
+        self.assertEqual(classify_error(NetworkError("connection reset")), TRANSIENT)
+        self.assertEqual(classify_error(RuntimeError("bug")), PERMANENT)
+
+    def test_classifies_lost_database_connections_as_transient(self):
+        self.assertEqual(classify_error(psycopg.OperationalError("server closed the connection")), TRANSIENT)
+        self.assertEqual(classify_error(psycopg.InterfaceError("connection already closed")), TRANSIENT)
+        self.assertEqual(classify_error(PoolTimeout("couldn't get a connection")), TRANSIENT)
+
+    def test_backoff_grows_exponentially_within_jitter_and_cap(self):
+        policy = RetryPolicy(max_attempts=10, base_delay_sec=10, max_delay_sec=60)
+        with mock.patch("scheduling.retry_policy.random.uniform", side_effect=lambda a, b: b):
+            self.assertEqual(next_delay(policy, 1), 10)
+            self.assertEqual(next_delay(policy, 2), 20)
+            self.assertEqual(next_delay(policy, 3), 40)
+            self.assertEqual(next_delay(policy, 5), 60)
+        for _ in range(20):
+            self.assertTrue(5 <= next_delay(policy, 1) <= 10)
+
+    def test_retry_after_overrides_backoff(self):
+        policy = RetryPolicy(max_attempts=10, base_delay_sec=10, max_delay_sec=60)
+        self.assertEqual(retry_after_seconds(RetryAfter(30)), 30.0)
+        self.assertIsNone(retry_after_seconds(TimedOut()))
+        delay = next_delay(policy, 1, retry_after=30.0)
+        self.assertTrue(30 <= delay <= 34)
+
+    def test_unknown_kind_uses_default_policy(self):
+        self.assertEqual(policy_for("nope"), policy_for(None))
+        self.assertLess(policy_for("habit_reminder").max_attempts, policy_for("day_lesson").max_attempts)
+
+
+if __name__ == "__main__":
+    unittest.main()
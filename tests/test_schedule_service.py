@@ -1,13 +1,41 @@
 import unittest
 from datetime import datetime, date, timezone
+from types import SimpleNamespace
 from zoneinfo import ZoneInfo
 
 from scheduling.schedule_service import ScheduleService
 
 
-class DummyUsers:
-    def list_user_ids(self, limit: int = 20000):
-        return [1, 2, 3]
+class DummySnapshots:
+    def __init__(self):
+        self.ids = {}
+        self.stored = []
+
+    def ensure(self, kind: str, body: dict) -> int:
+        key = (kind, repr(sorted(body.items())))
+        if key not in self.ids:
+            self.stored.append((kind, body))
+            self.ids[key] = len(self.ids) + 1
+        return self.ids[key]
+
+
+class DummyBroadcasts:
+    def __init__(self, user_ids, existing_users=()):
+        self.user_ids = sorted(user_ids)
+        self.existing_users = set(existing_users)
+        self.calls = []
+
+    def count_recipients(self) -> int:
+        return len(self.user_ids)
+
+    def questionnaire_batch(self, questionnaire_id, hhmm, optional, default_tz, after_id=None, limit=5000):
+        self.calls.append((questionnaire_id, hhmm, optional, default_tz, after_id, limit))
+        batch = [u for u in self.user_ids if after_id is None or u > after_id][:limit]
+        return {
+            "scanned": len(batch),
+            "last_id": batch[-1] if batch else None,
+            "created": len([u for u in batch if u not in self.existing_users]),
+        }
 
 
 class DummyOutbox:
@@ -23,6 +51,12 @@ class DummyOutbox:
     def create_job(self, user_id: int, run_at_iso: str, payload: dict):
         self.created.append((user_id, run_at_iso, payload))
 
+    def create_job_if_absent(self, user_id: int, run_at_iso: str, payload: dict) -> bool:
+        if self.exists_job_for(user_id, payload["job_key"]):
+            return False
+        self.create_job(user_id, run_at_iso, payload)
+        return True
+
 
 class DummyQuestionnairesByDay:
     def list_by_day(self, day_index: int, qtypes=("manual",)):
@@ -69,23 +103,57 @@ class DummySentJobsNever:
         return False
 
 
-class DummyPoints:
-    def __init__(self, viewed_days=None):
-        self.viewed_days = set(viewed_days or [])
+class DummyOpenItems:
+    def __init__(self, open_days_by_user=None):
+        # user_id -> days with something unfinished
+        self.open_days_by_user = open_days_by_user or {}
+        self.opened = []
+        self.lookups = []
+
+    def open_through(self, items):
+        self.opened.append(list(items))
+        return 0
+
+    def with_open_items(self, items):
+        self.lookups.append(list(items))
+        return {
+            (user_id, day_index)
+            for user_id, day_index in items
+            if any(d <= day_index for d in self.open_days_by_user.get(user_id, ()))
+        }
+
+
+class DummyByDays:
+    def __init__(self, rows):
+        self.rows = rows
+        self.calls = 0
+
+    def list_by_days(self, day_indexes, qtypes=("manual",)):
+        self.calls += 1
+        return [r for r in self.rows if r.get("day_index") in day_indexes or r.get("day_index") is None]
+
 
-    def has_entry(self, user_id: int, source_type: str, source_key: str | None) -> bool:
-        _ = user_id, source_type
-        day = int(str(source_key).split(":")[1])
-        return day in self.viewed_days
+class DummyBulkSentJobs:
+    def __init__(self, sent=None):
+        self.sent = set(sent or [])
+        self.calls = 0
 
+    def sent_keys(self, user_ids, for_dates):
+        self.calls += 1
+        return {k for k in self.sent if k[0] in user_ids and k[3] in for_dates}
 
-class DummyAnswers:
-    def __init__(self, answered_days=None):
-        self.answered_days = set(answered_days or [])
 
-    def exists_for_day(self, user_id: int, day_index: int) -> bool:
-        _ = user_id
-        return day_index in self.answered_days
+class DummyBulkOutbox:
+    def __init__(self, live=None):
+        self.live = set(live or [])
+        self.inserted = []
+
+    def live_job_keys(self, keys):
+        return {k for k in keys if k in self.live}
+
+    def create_jobs_bulk(self, jobs):
+        self.inserted.append(list(jobs))
+        return {(user_id, payload["job_key"]) for user_id, _run_at, payload in jobs}
 
 
 class ScheduleServiceTests(unittest.TestCase):
@@ -107,27 +175,25 @@ class ScheduleServiceTests(unittest.TestCase):
         self.assertIsNone(svc.parse_extra_viewed_payload("extra:viewed:broken"))
         self.assertIsNone(svc.parse_extra_viewed_payload("other:data"))
 
-    def test_questionnaire_broadcast_skips_existing_jobs(self):
+    def test_questionnaire_broadcast_plans_in_batches_and_reports_progress(self):
         svc = ScheduleService.__new__(ScheduleService)
-        svc.users = DummyUsers()
-        svc.outbox = DummyOutbox(existing_users={2})
-        svc._user_tz = lambda user_id: ZoneInfo("UTC")
-
-        created = svc.schedule_questionnaire_broadcast(questionnaire_id=77, hhmm="09:30", optional=True)
-
-        self.assertEqual(created, 2)
-        self.assertEqual(len(svc.outbox.created), 2)
-
-        created_user_ids = {row[0] for row in svc.outbox.created}
-        self.assertEqual(created_user_ids, {1, 3})
+        svc.settings = SimpleNamespace(default_timezone="Europe/Moscow")
+        svc.broadcasts = DummyBroadcasts(user_ids=[1, 2, 3, 4, 5], existing_users={2})
+        progress = []
+
+        created = svc.schedule_questionnaire_broadcast(
+            questionnaire_id=77,
+            hhmm="9:30",
+            optional=True,
+            progress=lambda *args: progress.append(args),
+            batch_size=2,
+        )
 
-        for user_id, run_at_iso, payload in svc.outbox.created:
-            self.assertIsInstance(user_id, int)
-            self.assertIn("T", run_at_iso)
-            self.assertEqual(payload["kind"], "questionnaire_broadcast")
-            self.assertEqual(payload["questionnaire_id"], 77)
-            self.assertTrue(payload["optional"])
-            self.assertTrue(payload["job_key"].startswith("qcast:77:"))
+        self.assertEqual(created, 4)
+        # Keyset pagination over user ids; HH:MM is normalized for the job_key.
+        self.assertEqual([c[4] for c in svc.broadcasts.calls], [None, 2, 4])
+        self.assertEqual(svc.broadcasts.calls[0], (77, "09:30", True, "Europe/Moscow", None, 2))
+        self.assertEqual(progress, [(2, 5, 1), (4, 5, 3), (5, 5, 4)])
 
     def test_schedules_multiple_day_questionnaires_for_same_day(self):
         svc = ScheduleService.__new__(ScheduleService)
@@ -178,13 +244,10 @@ class ScheduleServiceTests(unittest.TestCase):
         svc.questionnaires = type(
             "QQ",
             (),
-            {
-                "list_by_day": staticmethod(lambda _day, qtypes=("manual", "daily"): []),
-                "has_user_response": staticmethod(lambda _uid, _qid: False),
-            },
+            {"list_by_day": staticmethod(lambda _day, qtypes=("manual", "daily"): [])},
         )()
-        svc.points = DummyPoints(viewed_days=set())  # day 1 lesson is not viewed -> backlog exists
-        svc.answers = DummyAnswers(answered_days=set())
+        # Day 1 lesson is not viewed -> backlog exists.
+        svc.open_items = DummyOpenItems({951667241: {1}})
         svc.sent_jobs = DummySentJobsNever()
         svc.outbox = DummyOutbox()
         svc._user_tz = lambda _uid: ZoneInfo("UTC")
@@ -216,6 +279,7 @@ class ScheduleServiceTests(unittest.TestCase):
             {"list_by_day": staticmethod(lambda _day, qtypes=("manual", "daily"): [])},
         )()
         svc.sent_jobs = DummySentJobsNever()
+        svc.open_items = DummyOpenItems()
         svc.outbox = DummyOutbox()
         svc._user_tz = lambda _uid: ZoneInfo("UTC")
         svc._log_job = lambda *args, **kwargs: None
@@ -237,5 +301,119 @@ class ScheduleServiceTests(unittest.TestCase):
         self.assertEqual(int(p["extra"]["points"]), 2)
 
 
+    def test_bulk_planner_uses_set_queries_and_one_insert(self):
+        svc = ScheduleService.__new__(ScheduleService)
+        svc.settings = type("S", (), {"delivery_grace_minutes": 15, "default_timezone": "UTC"})()
+        svc.lesson = DummyByDays([
+            {"id": 1, "day_index": 1, "title": "L1", "description": "", "video_url": "", "points_viewed": 1},
+            {"id": 2, "day_index": 2, "title": "L2", "description": "", "video_url": "", "points_viewed": 1},
+        ])
+        svc.quest = DummyByDays([])
+        svc.extra = DummyByDays([])
+        svc.questionnaires = DummyByDays([{"id": 5, "day_index": None, "qtype": "daily"}])
+        base_date = date(2026, 2, 23)
+        # User 1 already got today's lesson; tomorrow's questionnaire job already exists.
+        svc.sent_jobs = DummyBulkSentJobs(
+            sent={
+                (1, "lesson", 1, base_date),
+                (1, "daily_reminder", 1, base_date),
+                (1, "daily_reminder", 2, date(2026, 2, 24)),
+            }
+        )
+        svc.outbox = DummyBulkOutbox(live={(1, "questionnaire:5:day=2:date=2026-02-24")})
+        svc.open_items = DummyOpenItems()
+        svc._log_job = lambda *args, **kwargs: None
+
+        enrollments = [
+            {
+                "user_id": 1,
+                "delivery_time": "21:00",
+                "enrolled_at": datetime(2026, 2, 23, 8, 0, tzinfo=timezone.utc),
+                "timezone": "Europe/Moscow",
+            }
+        ]
+        created = svc._schedule_bulk(enrollments, datetime(2026, 2, 23, 10, 0, tzinfo=timezone.utc))
+
+        self.assertEqual(len(svc.outbox.inserted), 1)
+        keys = sorted(payload["job_key"] for _uid, _run_at, payload in svc.outbox.inserted[0])
+        self.assertEqual(
+            keys,
+            sorted(["day:2:l2:q:q0:v:0", "questionnaire:5:day=1:date=2026-02-23"]),
+        )
+        self.assertEqual(created, 2)
+        self.assertEqual(svc.lesson.calls, 1)
+        self.assertEqual(svc.questionnaires.calls, 1)
+        self.assertEqual(svc.sent_jobs.calls, 1)
+        run_ats = {payload["day_index"]: run_at for _uid, run_at, payload in svc.outbox.inserted[0]}
+        # 21:00 Moscow == 18:00 UTC
+        self.assertEqual(run_ats[2], "2026-02-24T18:00:00+00:00")
+
+    def test_day_jobs_reference_one_shared_content_snapshot(self):
+        svc = ScheduleService.__new__(ScheduleService)
+        svc.settings = type("S", (), {"delivery_grace_minutes": 15, "default_timezone": "UTC"})()
+        svc.lesson = DummyByDays([
+            {"id": 1, "day_index": 1, "title": "L1", "description": "Long text", "video_url": "", "points_viewed": 1},
+        ])
+        svc.quest = DummyByDays([])
+        svc.extra = DummyByDays([])
+        svc.questionnaires = DummyByDays([])
+        svc.sent_jobs = DummyBulkSentJobs()
+        svc.outbox = DummyBulkOutbox()
+        svc.open_items = DummyOpenItems()
+        svc.snapshots = DummySnapshots()
+        svc._log_job = lambda *args, **kwargs: None
+
+        enrolled_at = datetime(2026, 2, 23, 8, 0, tzinfo=timezone.utc)
+        enrollments = [
+            {"user_id": uid, "delivery_time": "21:00", "enrolled_at": enrolled_at, "timezone": "UTC"}
+            for uid in (1, 2, 3)
+        ]
+        svc._schedule_bulk(enrollments, datetime(2026, 2, 23, 10, 0, tzinfo=timezone.utc))
+
+        lessons = [p for _uid, _run_at, p in svc.outbox.inserted[0] if p["kind"] == "day_lesson"]
+        self.assertEqual(len(lessons), 3)
+        self.assertEqual({p["snapshot_id"] for p in lessons}, {1})
+        self.assertTrue(all("lesson" not in p for p in lessons))
+        self.assertEqual(svc.snapshots.stored, [("lesson", {"title": "L1", "description": "Long text", "video_url": "", "points_viewed": 1})])
+
+    def test_bulk_planner_looks_up_open_items_once_for_all_reminders(self):
+        svc = ScheduleService.__new__(ScheduleService)
+        svc.settings = type(
+            "S",
+            (),
+            {
+                "delivery_grace_minutes": 15,
+                "default_timezone": "UTC",
+                "remind_after_hours": 12,
+                "reminder_fallback_time": "09:30",
+                "quiet_hours_start": "23:00",
+                "quiet_hours_end": "09:00",
+            },
+        )()
+        svc.lesson = DummyByDays([])
+        svc.quest = DummyByDays([])
+        svc.extra = DummyByDays([])
+        svc.questionnaires = DummyByDays([])
+        svc.sent_jobs = DummyBulkSentJobs()
+        svc.outbox = DummyBulkOutbox()
+        # Only user 1 has something unfinished (day 1 lesson).
+        svc.open_items = DummyOpenItems({1: {1}})
+        svc._log_job = lambda *args, **kwargs: None
+
+        enrolled_at = datetime(2026, 2, 23, 8, 0, tzinfo=timezone.utc)
+        enrollments = [
+            {"user_id": uid, "delivery_time": "10:00", "enrolled_at": enrolled_at, "timezone": "UTC"}
+            for uid in (1, 2)
+        ]
+        svc._schedule_bulk(enrollments, datetime(2026, 2, 23, 9, 0, tzinfo=timezone.utc))
+
+        self.assertEqual(len(svc.open_items.opened), 1)
+        self.assertEqual(len(svc.open_items.lookups), 1)
+        reminder_users = {
+            uid for uid, _run_at, payload in svc.outbox.inserted[0] if payload["kind"] == "daily_reminder"
+        }
+        self.assertEqual(reminder_users, {1})
+
+
 if __name__ == "__main__":
     unittest.main()
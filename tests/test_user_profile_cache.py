@@ -0,0 +1,132 @@
+import unittest
+from contextlib import contextmanager
+from datetime import datetime
+from types import SimpleNamespace
+from zoneinfo import ZoneInfo
+
+from entity.repositories.enrollment_repo import EnrollmentRepo
+from entity.repositories.users_repo import UsersRepo
+from entity.user_profile_cache import UserProfileCache
+
+
+class DummyCursor:
+    def __init__(self, db):
+        self.db = db
+        self._rows = []
+        self.rowcount = 0
+
+    def execute(self, sql, params=None):
+        self.db.executed.append(sql)
+        if "SET unreachable_at = NULL" in sql:
+            user = self.db.users[params[0]]
+            self.rowcount = int(user.get("unreachable_at") is not None)
+            user["unreachable_at"] = None
+        elif "FROM users u" in sql:
+            self._rows = [dict(self.db.users[u], id=u) for u in params[0] if u in self.db.users]
+        elif "UPDATE users SET timezone" in sql:
+            self.db.users[params[1]]["timezone"] = params[0]
+        elif "UPDATE users SET pd_consent=TRUE" in sql:
+            self.db.users[params[0]]["pd_consent"] = True
+        elif "INSERT INTO users" in sql:
+            self.db.users.setdefault(params[0], {"timezone": params[3], "pd_consent": False, "delivery_time": None})
+        elif "INSERT INTO enrollments" in sql:
+            self.db.users[params[0]].update(delivery_time=params[1], enrolled_at=datetime(2024, 1, 1), is_active=True)
+
+    def fetchall(self):
+        return list(self._rows)
+
+
+class DummyDb:
+    def __init__(self):
+        self.settings = SimpleNamespace(default_timezone="Europe/Moscow")
+        self.users = {
+            1: {"timezone": "Asia/Tokyo", "pd_consent": True, "delivery_time": "09:30", "is_active": True},
+            2: {"timezone": None, "pd_consent": False, "delivery_time": None},
+        }
+        self.executed = []
+        self.now = 0.0
+        self.user_profiles = UserProfileCache(max_size=2, ttl_sec=60, clock=lambda: self.now)
+
+    @contextmanager
+    def cursor(self):
+        yield DummyCursor(self)
+
+    def profile_reads(self):
+        return [sql for sql in self.executed if "FROM users u" in sql]
+
+
+class UserProfileCacheTests(unittest.TestCase):
+    def test_profile_lookups_share_one_cached_query(self):
+        db = DummyDb()
+        users = UsersRepo(db)
+
+        self.assertEqual(users.get_timezone(1), "Asia/Tokyo")
+        self.assertEqual(users.get_zone(1), ZoneInfo("Asia/Tokyo"))
+        self.assertEqual(EnrollmentRepo(db).get(1)["delivery_time"], "09:30")
+        self.assertTrue(users.get_profile(1)["pd_consent"])
+        # Unset timezone falls back to the default zone.
+        self.assertEqual(users.get_zone(2), ZoneInfo("Europe/Moscow"))
+        self.assertIsNone(EnrollmentRepo(db).get(2))
+
+        self.assertEqual(len(db.profile_reads()), 2)
+
+    def test_writes_invalidate_the_profile(self):
+        db = DummyDb()
+        users = UsersRepo(db)
+        users.get_profile(2)
+
+        users.set_timezone(2, "Asia/Tokyo")
+        self.assertEqual(users.get_zone(2), ZoneInfo("Asia/Tokyo"))
+        users.set_pd_consent(2, True)
+        self.assertTrue(users.get_profile(2)["pd_consent"])
+        EnrollmentRepo(db).upsert(2, "08:00")
+        self.assertEqual(EnrollmentRepo(db).get(2)["delivery_time"], "08:00")
+
+    def test_clearing_unreachable_invalidates_the_profile(self):
+        db = DummyDb()
+        db.users[1]["unreachable_at"] = datetime(2026, 2, 17)
+        users = UsersRepo(db)
+        self.assertTrue(users.get_profile(1)["unreachable"])
+
+        self.assertTrue(users.mark_reachable(1))
+        self.assertFalse(users.get_profile(1)["unreachable"])
+        reads = len(db.profile_reads())
+        # Called on every update: a no-op keeps the cached profile.
+        self.assertFalse(users.mark_reachable(1))
+        users.get_profile(1)
+        self.assertEqual(len(db.profile_reads()), reads)
+
+    def test_new_user_is_not_stuck_as_unknown(self):
+        db = DummyDb()
+        users = UsersRepo(db)
+        self.assertIsNone(users.get_profile(3))
+
+        users.upsert_user(3, "new", "New", None)
+        self.assertIsNotNone(users.get_profile(3))
+        reads = len(db.profile_reads())
+        # Repeated upserts of a known user keep the cached profile.
+        users.upsert_user(3, "new", "New", None)
+        users.get_profile(3)
+        self.assertEqual(len(db.profile_reads()), reads)
+
+    def test_lru_and_ttl_eviction(self):
+        db = DummyDb()
+        users = UsersRepo(db)
+        users.get_profile(1)
+        users.get_profile(2)
+        users.get_profile(1)
+        users.get_profile(3)  # evicts 2, the least recently used
+        reads = len(db.profile_reads())
+
+        users.get_profile(1)
+        self.assertEqual(len(db.profile_reads()), reads)
+        users.get_profile(2)
+        self.assertEqual(len(db.profile_reads()), reads + 1)
+
+        db.now = 61.0
+        users.get_profile(2)
+        self.assertEqual(len(db.profile_reads()), reads + 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+import threading
+import unittest
+
+from user.user_service import UserService, _PersistedUsers
+
+
+class DummyUsersAsync:
+    def __init__(self):
+        self.upserts = []
+        self.unreachable = set()
+        self.cleared = []
+
+    async def upsert_user(self, tg_id, username, display_name, timezone):
+        self.upserts.append((tg_id, username, display_name, timezone))
+
+    async def mark_reachable(self, tg_id):
+        if tg_id not in self.unreachable:
+            return False
+        self.unreachable.discard(tg_id)
+        self.cleared.append(tg_id)
+        return True
+
+
+class DummyClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _svc(clock):
+    svc = UserService.__new__(UserService)
+    svc.users_async = DummyUsersAsync()
+    svc.persisted = _PersistedUsers(max_size=2, ttl_sec=3600, clock=clock)
+    return svc
+
+
+class EnsureUserTests(unittest.IsolatedAsyncioTestCase):
+    async def test_unchanged_user_is_written_once(self):
+        svc = _svc(DummyClock())
+
+        for _ in range(5):
+            await svc.ensure_user_async(1, "alice", "Alice")
+
+        self.assertEqual(svc.users_async.upserts, [(1, "alice", "Alice", None)])
+
+    async def test_changed_names_and_expired_entries_are_written(self):
+        clock = DummyClock()
+        svc = _svc(clock)
+
+        await svc.ensure_user_async(1, "alice", "Alice")
+        await svc.ensure_user_async(1, "alice_new", "Alice")
+        clock.now = 3601.0
+        await svc.ensure_user_async(1, "alice_new", "Alice")
+
+        self.assertEqual(len(svc.users_async.upserts), 3)
+
+    async def test_least_recently_seen_user_is_evicted(self):
+        svc = _svc(DummyClock())
+
+        await svc.ensure_user_async(1, "a", "A")
+        await svc.ensure_user_async(2, "b", "B")
+        await svc.ensure_user_async(1, "a", "A")
+        await svc.ensure_user_async(3, "c", "C")  # evicts 2
+        await svc.ensure_user_async(1, "a", "A")
+        await svc.ensure_user_async(2, "b", "B")
+
+        self.assertEqual([u[0] for u in svc.users_async.upserts], [1, 2, 3, 2])
+
+
+    async def test_unreachable_user_is_cleared_on_next_update(self):
+        svc = _svc(DummyClock())
+        await svc.ensure_user_async(1, "alice", "Alice")
+
+        # The worker flagged the user (bot blocked) while the upsert memo still holds.
+        svc.users_async.unreachable.add(1)
+        await svc.ensure_user_async(1, "alice", "Alice")
+        await svc.ensure_user_async(1, "alice", "Alice")
+
+        self.assertEqual(svc.users_async.cleared, [1])
+        self.assertEqual(len(svc.users_async.upserts), 1)
+
+
+class PersistedUsersTests(unittest.TestCase):
+    def test_concurrent_threads_keep_the_lru_bounded(self):
+        memo = _PersistedUsers(max_size=50, ttl_sec=3600)
+
+        def churn(offset):
+            for i in range(2000):
+                uid = offset + i % 200
+                if not memo.is_current(uid, ("u", None)):
+                    memo.remember(uid, ("u", None))
+
+        threads = [threading.Thread(target=churn, args=(n * 100,)) for n in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertLessEqual(len(memo._entries), 50)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,71 +1,36 @@
 import unittest
 
-from scheduling.worker import _collect_pending_backlog
+from scheduling.job_handlers import _collect_pending_backlog
 
 
-class _DummyLessonRepo:
-    def __init__(self, day_map):
-        self.day_map = day_map
+class _DummyBacklog:
+    def __init__(self, items):
+        self.items = items
+        self.calls = []
 
-    def get_by_day(self, day_index: int):
-        return self.day_map.get(day_index)
-
-
-class _DummyQuestRepo:
-    def __init__(self, day_map):
-        self.day_map = day_map
-
-    def get_by_day(self, day_index: int):
-        return self.day_map.get(day_index)
+    async def unfinished(self, user_id: int, day_index: int):
+        self.calls.append((user_id, day_index))
+        return [i for i in self.items if i["day_index"] <= day_index]
 
 
 class _DummySchedule:
-    def __init__(self, lessons, quests):
-        self.lesson = _DummyLessonRepo(lessons)
-        self.quest = _DummyQuestRepo(quests)
-
-
-class _DummyLearning:
-    def __init__(self, viewed_days, answered_days):
-        self.viewed_days = set(viewed_days)
-        self.answered_days = set(answered_days)
-
-    def has_viewed_lesson(self, _uid: int, day_index: int) -> bool:
-        return day_index in self.viewed_days
-
-    def has_quest_answer(self, _uid: int, day_index: int) -> bool:
-        return day_index in self.answered_days
-
+    def __init__(self, items):
+        self.backlog_async = _DummyBacklog(items)
 
-class _DummyQuestionnaireSvc:
-    def __init__(self, q_by_day, responded_ids):
-        self.q_by_day = q_by_day
-        self.responded_ids = set(responded_ids)
 
-    def list_for_day(self, day_index: int, qtypes=("manual", "daily")):
-        _ = qtypes
-        return self.q_by_day.get(day_index, [])
-
-    def has_response(self, _uid: int, questionnaire_id: int) -> bool:
-        return questionnaire_id in self.responded_ids
-
-
-class DailyReminderBacklogTests(unittest.TestCase):
-    def test_collect_pending_backlog_includes_previous_days(self):
+class DailyReminderBacklogTests(unittest.IsolatedAsyncioTestCase):
+    async def test_collect_pending_backlog_includes_previous_days(self):
+        # Day 1: lesson not viewed, questionnaire 101 open; day 2: quest not answered.
         schedule = _DummySchedule(
-            lessons={1: {"id": 1}, 2: {"id": 2}},
-            quests={1: {"id": 10}, 2: {"id": 20}},
-        )
-        learning = _DummyLearning(viewed_days={2}, answered_days={1})
-        qsvc = _DummyQuestionnaireSvc(
-            q_by_day={1: [{"id": 101}], 2: [{"id": 201}]},
-            responded_ids={201},
+            [
+                {"day_index": 1, "kind": "lesson", "questionnaire_id": None},
+                {"day_index": 1, "kind": "questionnaire", "questionnaire_id": 101},
+                {"day_index": 2, "kind": "quest", "questionnaire_id": None},
+            ]
         )
 
-        pending, first_lesson_day, first_quest_day, first_questionnaire = _collect_pending_backlog(
+        pending, first_lesson_day, first_quest_day, first_questionnaire = await _collect_pending_backlog(
             schedule=schedule,
-            learning=learning,
-            qsvc=qsvc,
             user_id=42,
             day_index=2,
         )
@@ -74,22 +39,14 @@ class DailyReminderBacklogTests(unittest.TestCase):
         self.assertEqual(first_lesson_day, 1)
         self.assertEqual(first_quest_day, 2)
         self.assertEqual(first_questionnaire, (1, 101))
+        # One backlog lookup regardless of how many days are covered.
+        self.assertEqual(schedule.backlog_async.calls, [(42, 2)])
 
-    def test_collect_pending_backlog_returns_empty_when_done(self):
-        schedule = _DummySchedule(
-            lessons={1: {"id": 1}, 2: {"id": 2}},
-            quests={1: {"id": 10}, 2: {"id": 20}},
-        )
-        learning = _DummyLearning(viewed_days={1, 2}, answered_days={1, 2})
-        qsvc = _DummyQuestionnaireSvc(
-            q_by_day={1: [{"id": 101}], 2: [{"id": 201}]},
-            responded_ids={101, 201},
-        )
+    async def test_collect_pending_backlog_returns_empty_when_done(self):
+        schedule = _DummySchedule([])
 
-        pending, first_lesson_day, first_quest_day, first_questionnaire = _collect_pending_backlog(
+        pending, first_lesson_day, first_quest_day, first_questionnaire = await _collect_pending_backlog(
             schedule=schedule,
-            learning=learning,
-            qsvc=qsvc,
             user_id=42,
             day_index=2,
         )
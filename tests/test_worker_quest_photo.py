@@ -1,7 +1,7 @@
 import unittest
 from types import SimpleNamespace
 
-from scheduling.worker import _send_quest_message
+from scheduling.job_handlers import _send_quest_message
 
 
 class _DummyBot:
@@ -0,0 +1,387 @@
+import asyncio
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+
+from telegram.error import BadRequest, Forbidden, RetryAfter, TimedOut
+
+from scheduling import job_handlers
+from scheduling.delivery_stats import DeliveryStats
+from scheduling import planner as planner_main
+from scheduling import worker
+
+
+class _BlockingPlanner:
+    def __init__(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.calls = 0
+
+    def schedule_due_jobs(self):
+        self.calls += 1
+        self.started.set()
+        self.release.wait(timeout=5)
+        return 0
+
+
+class _DummyAsyncOutbox:
+    def __init__(self):
+        self.fetches = 0
+
+    async def release_expired_leases(self, max_attempts=None, default_max_attempts=3) -> int:
+        return 0
+
+    async def claim_due(self, owner: str, limit: int = 50, lease_sec: int = 120):
+        self.fetches += 1
+        return []
+
+
+class _JobsOutbox:
+    def __init__(self, jobs):
+        self.jobs = jobs
+        self.claims = []
+        self.reaped = 0
+        self.sent = []
+        self.retried = []
+        self.failed = []
+        self.cancelled = []
+
+    async def backfill_lanes(self) -> int:
+        return 0
+
+    async def release_expired_leases(self, max_attempts=None, default_max_attempts=3) -> int:
+        self.reaped += 1
+        self.reap_limits = (max_attempts, default_max_attempts)
+        return 0
+
+    async def claim_due(self, owner: str, limit: int = 50, lease_sec: int = 120):
+        self.claims.append((owner, limit, lease_sec))
+        jobs, self.jobs = self.jobs, []
+        return jobs
+
+    async def renew_leases(self, owner: str, lease_sec: int = 120) -> int:
+        return 0
+
+    async def schedule_retry(self, job_id: int, err: str, delay_sec: float):
+        self.retried.append((job_id, err, delay_sec))
+
+    async def mark_failed(self, job_id: int, err: str):
+        self.failed.append((job_id, err))
+
+    async def mark_sent(self, job_id: int):
+        self.sent.append(job_id)
+
+    async def cancel_claimed(self, job_ids: list[int], err: str) -> int:
+        self.cancelled.extend(job_ids)
+        return len(job_ids)
+
+
+class _SlowBot:
+    def __init__(self):
+        self.sent = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def send_message(self, chat_id: int, text: str, **kwargs):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.sent.append((chat_id, text))
+        self.in_flight -= 1
+
+
+class _NotifyConn:
+    def __init__(self, queue: asyncio.Queue):
+        self.queue = queue
+        self.executed = []
+
+    async def execute(self, sql: str):
+        self.executed.append(sql)
+
+    async def notifies(self):
+        while True:
+            yield await self.queue.get()
+
+    async def close(self):
+        pass
+
+
+class _ListenDb:
+    def __init__(self):
+        self.queue = asyncio.Queue()
+        self.conn = _NotifyConn(self.queue)
+
+    async def connect(self):
+        return self.conn
+
+
+class _FailingBot:
+    def __init__(self, exc):
+        self.exc = exc
+
+    async def send_message(self, chat_id: int, text: str, **kwargs):
+        raise self.exc
+
+
+class _UnreachableUsers:
+    def __init__(self):
+        self.marked = []
+
+    async def mark_unreachable(self, user_id: int, err: str) -> dict:
+        self.marked.append((user_id, err))
+        return {"flagged": True, "cancelled": 0}
+
+
+def _reminder(job_id: int, user_id: int, text: str, attempts: int = 0) -> dict:
+    return {
+        "id": job_id,
+        "user_id": user_id,
+        "attempts": attempts,
+        "payload_json": {"kind": "personal_reminder", "text": text},
+    }
+
+
+class WorkerTickTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        worker._last_plan_ts = 0.0
+        worker._last_full_plan_ts = 0.0
+        worker._plan_task = None
+        worker._limiter = None
+        worker._kind_limits = None
+        worker._stats = DeliveryStats()
+
+    async def test_planning_runs_off_loop_and_does_not_block_outbox(self):
+        planner = _BlockingPlanner()
+        outbox = _DummyAsyncOutbox()
+        schedule = SimpleNamespace(schedule_due_jobs=planner.schedule_due_jobs, outbox_async=outbox)
+        services = {"schedule": schedule, "learning": None, "questionnaire": None}
+
+        await asyncio.wait_for(worker.tick(SimpleNamespace(bot=None), services), timeout=1)
+        self.assertEqual(outbox.fetches, 1)
+        self.assertTrue(await asyncio.to_thread(planner.started.wait, 1))
+
+        # A second tick while planning is still running delivers but does not re-plan.
+        worker._last_plan_ts = 0.0
+        await asyncio.wait_for(worker.tick(SimpleNamespace(bot=None), services), timeout=1)
+        self.assertEqual(outbox.fetches, 2)
+        self.assertEqual(planner.calls, 1)
+
+        planner.release.set()
+        await worker._plan_task
+
+    async def test_planner_queue_replaces_full_rescans(self):
+        full = []
+        queued = []
+        schedule = SimpleNamespace(schedule_due_jobs=lambda: full.append(1))
+        planner = SimpleNamespace(run_due=lambda: queued.append(1))
+        services = {"schedule": schedule, "planner": planner}
+
+        worker._run_planners(services)
+        worker._run_planners(services)
+
+        self.assertEqual(len(queued), 2)
+        # The full pass is only an occasional safety net.
+        self.assertEqual(len(full), 1)
+
+    async def test_standalone_planner_runs_passes_until_stopped(self):
+        stop = threading.Event()
+        queued = []
+
+        def run_due():
+            queued.append(1)
+            if len(queued) == 3:
+                stop.set()
+
+        services = {"schedule": SimpleNamespace(schedule_due_jobs=lambda: 0), "planner": SimpleNamespace(run_due=run_due)}
+
+        await asyncio.wait_for(asyncio.to_thread(planner_main.run_forever, services, stop, 0.0), timeout=1)
+
+        self.assertEqual(len(queued), 3)
+
+    async def test_outbox_sends_users_in_parallel_keeping_per_user_order(self):
+        outbox = _JobsOutbox(
+            [_reminder(1, 10, "a1"), _reminder(2, 20, "b1"), _reminder(3, 10, "a2"), _reminder(4, 30, "c1")]
+        )
+        settings = SimpleNamespace(
+            outbox_batch_size=7,
+            outbox_concurrency=2,
+            outbox_lease_sec=60,
+            tg_global_rate_per_sec=1000,
+            tg_per_chat_rate_per_sec=1000,
+        )
+        schedule = SimpleNamespace(outbox_async=outbox, settings=settings)
+        services = {"schedule": schedule, "learning": None, "questionnaire": None}
+        bot = _SlowBot()
+
+        await asyncio.wait_for(worker._process_outbox(SimpleNamespace(bot=bot), services), timeout=1)
+
+        self.assertEqual(outbox.reaped, 1)
+        # Expired leases count against each kind's retry budget.
+        self.assertEqual(outbox.reap_limits[0]["personal_reminder"], 5)
+        self.assertEqual(outbox.reap_limits[1], 3)
+        self.assertEqual(outbox.claims, [(worker.WORKER_ID, 7, 60)])
+        self.assertEqual(sorted(outbox.sent), [1, 2, 3, 4])
+        self.assertEqual(bot.max_in_flight, 2)
+        user_10 = [text for chat_id, text in bot.sent if chat_id == 10]
+        self.assertEqual(user_10, ["🔔 Персональное напоминание\n\na1", "🔔 Персональное напоминание\n\na2"])
+
+    async def test_jobs_of_unreachable_users_are_cancelled_unsent(self):
+        blocked = dict(_reminder(2, 20, "b"), unreachable_at="2026-02-17T09:00:00+00:00")
+        outbox = _JobsOutbox([_reminder(1, 10, "a"), blocked])
+        settings = SimpleNamespace(tg_global_rate_per_sec=1000, tg_per_chat_rate_per_sec=1000)
+        services = {"schedule": SimpleNamespace(outbox_async=outbox, settings=settings)}
+        bot = _SlowBot()
+
+        claimed = await asyncio.wait_for(worker._process_outbox(SimpleNamespace(bot=bot), services), timeout=1)
+
+        self.assertEqual(claimed, 2)
+        self.assertEqual(outbox.cancelled, [2])
+        self.assertEqual(outbox.sent, [1])
+        self.assertEqual([chat_id for chat_id, _ in bot.sent], [10])
+
+    async def _run_failing(self, exc, jobs, users=None):
+        outbox = _JobsOutbox(jobs)
+        settings = SimpleNamespace(tg_global_rate_per_sec=1000, tg_per_chat_rate_per_sec=1000)
+        schedule = SimpleNamespace(outbox_async=outbox, settings=settings)
+        services = {"schedule": schedule, "learning": None, "questionnaire": None}
+        if users is not None:
+            services["user"] = SimpleNamespace(users_async=users)
+        await asyncio.wait_for(worker._process_outbox(SimpleNamespace(bot=_FailingBot(exc)), services), timeout=1)
+        return outbox
+
+    async def test_transient_error_reschedules_with_retry_after(self):
+        outbox = await self._run_failing(RetryAfter(7), [_reminder(1, 10, "a")])
+        self.assertEqual(outbox.failed, [])
+        self.assertEqual(len(outbox.retried), 1)
+        job_id, err, delay = outbox.retried[0]
+        self.assertEqual(job_id, 1)
+        self.assertIn("RetryAfter", err)
+        self.assertGreaterEqual(delay, 7)
+
+    async def test_permanent_error_and_exhausted_attempts_fail_the_job(self):
+        outbox = await self._run_failing(Forbidden("bot was blocked by the user"), [_reminder(1, 10, "a")])
+        self.assertEqual([job_id for job_id, _ in outbox.failed], [1])
+        self.assertEqual(outbox.retried, [])
+
+        outbox = await self._run_failing(TimedOut(), [_reminder(2, 20, "b", attempts=4)])
+        self.assertEqual([job_id for job_id, _ in outbox.failed], [2])
+        self.assertEqual(outbox.retried, [])
+
+    async def test_blocked_bot_flags_user_unreachable(self):
+        users = _UnreachableUsers()
+        outbox = await self._run_failing(Forbidden("bot was blocked by the user"), [_reminder(1, 10, "a")], users)
+        self.assertEqual([job_id for job_id, _ in outbox.failed], [1])
+        self.assertEqual([user_id for user_id, _ in users.marked], [10])
+        self.assertIn("Forbidden", users.marked[0][1])
+
+        users = _UnreachableUsers()
+        await self._run_failing(BadRequest("message is too long"), [_reminder(2, 20, "b")], users)
+        await self._run_failing(TimedOut(), [_reminder(3, 30, "c", attempts=4)], users)
+        self.assertEqual(users.marked, [])
+
+
+    async def test_outbox_loop_sleeps_until_notify(self):
+        outbox = _JobsOutbox([])
+        outbox.next_due_calls = 0
+
+        async def seconds_until_next_due():
+            outbox.next_due_calls += 1
+            return None
+
+        outbox.seconds_until_next_due = seconds_until_next_due
+        adb = _ListenDb()
+        settings = SimpleNamespace(
+            outbox_safety_poll_sec=30,
+            tg_global_rate_per_sec=1000,
+            tg_per_chat_rate_per_sec=1000,
+        )
+        schedule = SimpleNamespace(
+            outbox_async=outbox,
+            settings=settings,
+            db=SimpleNamespace(aio=adb),
+            schedule_due_jobs=lambda: 0,
+        )
+        services = {"schedule": schedule, "learning": None, "questionnaire": None}
+        bot = _SlowBot()
+        worker._last_plan_ts = time.time()
+
+        loop_task = asyncio.create_task(worker.run_outbox_loop(SimpleNamespace(bot=bot), services))
+        try:
+            for _ in range(100):
+                if outbox.next_due_calls >= 2:
+                    break
+                await asyncio.sleep(0.01)
+            self.assertEqual(adb.conn.executed, ["LISTEN outbox_jobs"])
+            claims_before = len(outbox.claims)
+            await asyncio.sleep(0.05)
+            # Idle: no polling while nothing is due and nothing was notified.
+            self.assertEqual(len(outbox.claims), claims_before)
+
+            outbox.jobs = [_reminder(1, 10, "now")]
+            await adb.queue.put("notify")
+            for _ in range(100):
+                if outbox.sent:
+                    break
+                await asyncio.sleep(0.01)
+            self.assertEqual(outbox.sent, [1])
+        finally:
+            loop_task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await loop_task
+
+
+
+class _Snapshots:
+    def __init__(self, bodies):
+        self.bodies = bodies
+        self.calls = []
+
+    async def get(self, snapshot_id: int):
+        self.calls.append(snapshot_id)
+        return self.bodies.get(snapshot_id)
+
+
+class JobContentTests(unittest.IsolatedAsyncioTestCase):
+    async def test_snapshot_reference_and_embedded_body(self):
+        schedule = SimpleNamespace(snapshots_async=_Snapshots({7: {"title": "L1"}}))
+
+        by_ref = await job_handlers._job_content(schedule, {"kind": "day_lesson", "snapshot_id": 7}, "lesson")
+        embedded = await job_handlers._job_content(schedule, {"kind": "day_lesson", "lesson": {"title": "old"}}, "lesson")
+
+        self.assertEqual(by_ref, {"title": "L1"})
+        self.assertEqual(embedded, {"title": "old"})
+        self.assertEqual(schedule.snapshots_async.calls, [7])
+
+
+class _Reminders:
+    def __init__(self):
+        self.fired = []
+
+    def mark_fired(self, reminder_id: int) -> int:
+        self.fired.append(reminder_id)
+        return 1
+
+
+class PersonalReminderDeliveryTests(unittest.IsolatedAsyncioTestCase):
+    async def test_fired_reminder_is_deactivated_with_the_job(self):
+        sent = []
+        schedule = SimpleNamespace(outbox=SimpleNamespace(mark_sent=sent.append), outbox_async=_JobsOutbox([]))
+        reminders = _Reminders()
+        services = {
+            "schedule": schedule,
+            "learning": None,
+            "questionnaire": None,
+            "personal_reminder_schedule": SimpleNamespace(repo=reminders),
+        }
+        job = _reminder(5, 1, "Позвонить")
+        job["payload_json"]["reminder_id"] = 42
+
+        await worker._deliver_job(_SlowBot(), services, job)
+
+        self.assertEqual(reminders.fired, [42])
+        self.assertEqual(sent, [5])
+
+
+if __name__ == "__main__":
+    unittest.main()
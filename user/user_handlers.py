@@ -12,6 +12,7 @@ from telegram.ext import (
     CommandHandler,
     ContextTypes,
     MessageHandler,
+    TypeHandler,
     filters,
 )
 
@@ -601,16 +602,29 @@ def register_user_handlers(app, settings: Settings, services: dict):
             reply_markup=menus.kb_back_only(),
         )
 
+    # ----------------------------
+    # Every update (messages and buttons)
+    # ----------------------------
+    async def touch_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        # Runs before every other group: later handlers can rely on the user
+        # row, and any update (a button press too) lifts the unreachable flag.
+        u = update.effective_user
+        if not u or u.is_bot:
+            return
+        display_name = u.first_name or u.full_name or (u.username or "")
+        try:
+            await user_svc.ensure_user_async(u.id, u.username, display_name)
+        except Exception:
+            log.exception("ensure_user failed uid=%s", u.id)
+
     # ----------------------------
     # /start
     # ----------------------------
     async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         u = update.effective_user
-        display_name = u.first_name or u.full_name or (u.username or "")
-        user_svc.ensure_user(u.id, u.username, display_name)
         _ai_history_clear(u.id)
 
-        if not user_svc.has_pd_consent(u.id):
+        if not await user_svc.has_pd_consent_async(u.id):
             user_svc.set_step(u.id, STEP_PD_CONSENT, {})
             text = (
                 "👋 Привет! Перед началом мне нужно твоё согласие на обработку персональных данных.\n\n"
@@ -852,7 +866,7 @@ def register_user_handlers(app, settings: Settings, services: dict):
         # Plan occurrences/outbox for the next days right away.
         try:
             if habit_schedule:
-                habit_schedule.schedule_due_jobs()
+                habit_schedule.schedule_due_jobs([q.from_user.id])
         except Exception:
             pass
 
@@ -911,7 +925,7 @@ def register_user_handlers(app, settings: Settings, services: dict):
             await q.edit_message_text("✅ Обновил. Открой «Мои привычки» ещё раз, чтобы увидеть актуальный статус.")
             try:
                 if habit_schedule:
-                    habit_schedule.schedule_due_jobs()
+                    habit_schedule.schedule_due_jobs([q.from_user.id])
             except Exception:
                 pass
         else:
@@ -1409,7 +1423,7 @@ def register_user_handlers(app, settings: Settings, services: dict):
             ok = habit_svc.update_time(uid, hid, hhmm)
             if ok and habit_schedule:
                 # Cancelled jobs/occurrences are handled inside HabitService; now re-plan.
-                habit_schedule.schedule_due_jobs()
+                habit_schedule.schedule_due_jobs([uid])
             user_svc.set_step(uid, None)
             await update.effective_message.reply_text(
                 f"✅ Время обновлено: {hhmm}" if ok else "❌ Не смог обновить (проверь номер привычки).",
@@ -1443,7 +1457,7 @@ def register_user_handlers(app, settings: Settings, services: dict):
             hid = int(payload.get("habit_id") or 0)
             ok = habit_svc.update_frequency(uid, hid, freq)
             if ok and habit_schedule:
-                habit_schedule.schedule_due_jobs()
+                habit_schedule.schedule_due_jobs([uid])
             user_svc.set_step(uid, None)
             await update.effective_message.reply_text(
                 "✅ Периодичность обновлена." if ok else "❌ Не смог обновить (проверь номер привычки).",
@@ -1492,7 +1506,7 @@ def register_user_handlers(app, settings: Settings, services: dict):
             except Exception:
                 ok = False
             if ok and habit_schedule:
-                habit_schedule.schedule_due_jobs()
+                habit_schedule.schedule_due_jobs([uid])
             user_svc.set_step(uid, None)
             await update.effective_message.reply_text(
                 "✅ Привычка удалена." if ok else "❌ Не смог удалить (проверь номер привычки).",
@@ -1542,7 +1556,7 @@ def register_user_handlers(app, settings: Settings, services: dict):
                 start_local=dt,
             )
             if reminder_id and pr_schedule:
-                pr_schedule.schedule_due_jobs()
+                pr_schedule.schedule_due_jobs([uid])
             user_svc.set_step(uid, None)
             await update.effective_message.reply_text(
                 f"✅ Напоминание создано: #{reminder_id}" if reminder_id else "❌ Не смог создать напоминание.",
@@ -1638,7 +1652,7 @@ def register_user_handlers(app, settings: Settings, services: dict):
                 raise ApplicationHandlerStop
             ok = bool(pr_svc and pr_svc.update_datetime(uid, rid, dt))
             if ok and pr_schedule:
-                pr_schedule.schedule_due_jobs()
+                pr_schedule.schedule_due_jobs([uid])
             user_svc.set_step(uid, None)
             await update.effective_message.reply_text(
                 "✅ Дата и время обновлены." if ok else "❌ Не смог обновить напоминание.",
@@ -1692,7 +1706,7 @@ def register_user_handlers(app, settings: Settings, services: dict):
                 raise ApplicationHandlerStop
             ok = bool(pr_svc and pr_svc.delete(uid, rid))
             if ok and pr_schedule:
-                pr_schedule.schedule_due_jobs()
+                pr_schedule.schedule_due_jobs([uid])
             user_svc.set_step(uid, None)
             await update.effective_message.reply_text(
                 "✅ Напоминание удалено." if ok else "❌ Не смог удалить напоминание.",
@@ -1831,16 +1845,12 @@ def register_user_handlers(app, settings: Settings, services: dict):
             texts.REMINDERS_DELETE,
         ):
             try:
-                learning.state.clear_state(uid)
+                await learning.state_async.clear_state(uid)
             except Exception:
                 pass
 
-        # Ensure user exists
-        display_name = u.first_name or u.full_name or (u.username or "")
-        user_svc.ensure_user(uid, u.username, display_name)
-
         # Onboarding gate
-        if not user_svc.has_pd_consent(uid):
+        if not await user_svc.has_pd_consent_async(uid):
             user_svc.set_step(uid, STEP_PD_CONSENT, {})
             await update.effective_message.reply_text(
                 "👋 Перед началом нужно согласие на обработку персональных данных.",
@@ -1848,7 +1858,7 @@ def register_user_handlers(app, settings: Settings, services: dict):
             )
             raise ApplicationHandlerStop
 
-        if not user_svc.get_timezone(uid):
+        if not await user_svc.get_timezone_async(uid):
             # If user clicked "change time" before setting tz, remember it
             after_tz = "change_time" if text == texts.SETTINGS_TIME else None
             user_svc.set_step(uid, STEP_WAIT_TZ, {"after_tz": after_tz} if after_tz else {})
@@ -1863,7 +1873,7 @@ def register_user_handlers(app, settings: Settings, services: dict):
         # If another feature is waiting for free-form text (quest answer / AI chat,
         # questionnaire comment, admin wizard, etc.), don't intercept it here.
         # Only explicit menu navigation buttons are handled by this router.
-        st_any = user_svc.get_step(uid)
+        st_any = await user_svc.get_step_async(uid)
         user_steps = {
             STEP_WAIT_NAME,
             STEP_WAIT_TIME,
@@ -2397,6 +2407,7 @@ def register_user_handlers(app, settings: Settings, services: dict):
     # ----------------------------
     # Register handlers
     # ----------------------------
+    app.add_handler(TypeHandler(Update, touch_user), group=-20)
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("enroll", enroll_cmd))
 
@@ -1,20 +1,84 @@
-from entity.repositories.users_repo import UsersRepo
-from entity.repositories.state_repo import StateRepo
+import threading
+import time
+from collections import OrderedDict
+
+from entity.repositories.users_repo import AsyncUsersRepo, UsersRepo
+from entity.repositories.state_repo import AsyncStateRepo, StateRepo
 from entity.repositories.enrollment_repo import EnrollmentRepo
+from entity.repositories.planner_queue_repo import PlannerQueueRepo
+from scheduling.habit_schedule_service import HabitScheduleService
+
+# ensure_user() re-writes an unchanged (username, display_name) at most this often.
+_UPSERT_MEMO_SEC = 3600
+
+
+class _PersistedUsers:
+    """LRU of the last (username, display_name) written per user, with expiry.
+
+    Shared by the event loop and the sync ensure_user() run from worker
+    threads, hence the lock.
+    """
+
+    def __init__(self, max_size: int, ttl_sec: float, clock=time.monotonic):
+        self.max_size = int(max_size)
+        self.ttl_sec = float(ttl_sec)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: OrderedDict = OrderedDict()
+
+    def is_current(self, tg_id: int, ident: tuple) -> bool:
+        now = self._clock()
+        with self._lock:
+            hit = self._entries.get(tg_id)
+            if hit is None or hit[1] != ident or hit[0] <= now:
+                return False
+            self._entries.move_to_end(tg_id)
+            return True
+
+    def remember(self, tg_id: int, ident: tuple):
+        if self.max_size <= 0:
+            return
+        expires_at = self._clock() + self.ttl_sec
+        with self._lock:
+            self._entries[tg_id] = (expires_at, ident)
+            self._entries.move_to_end(tg_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
 
 class UserService:
     def __init__(self, db, settings):
+        self.db = db
         self.settings = settings
         self.users = UsersRepo(db)
         self.state = StateRepo(db)
         self.enroll = EnrollmentRepo(db)
+        self.planner_queue = PlannerQueueRepo(db)
+        self.habit_schedule = HabitScheduleService(db, settings)
+        # Awaitable repos for handler hot paths (don't block the event loop).
+        self.users_async = AsyncUsersRepo(db.aio)
+        self.state_async = AsyncStateRepo(db.aio)
+        self.persisted = _PersistedUsers(getattr(settings, "user_cache_size", 10000), _UPSERT_MEMO_SEC)
 
     def ensure_user(self, tg_id: int, username: str | None, display_name: str | None):
         # IMPORTANT:
         # We do NOT auto-fill timezone with default_timezone on first contact.
         # Onboarding must explicitly ask the user to confirm/select timezone.
         # This prevents the classic bug where everyone silently gets Europe/Moscow.
-        self.users.upsert_user(tg_id, username, display_name, None)
+        ident = (username, display_name)
+        if not self.persisted.is_current(tg_id, ident):
+            self.users.upsert_user(tg_id, username, display_name, None)
+            self.persisted.remember(tg_id, ident)
+        # Any update means the user can be reached again after blocking the bot
+        # (a no-op UPDATE unless the flag is set).
+        self.users.mark_reachable(tg_id)
+
+    async def ensure_user_async(self, tg_id: int, username: str | None, display_name: str | None):
+        ident = (username, display_name)
+        if not self.persisted.is_current(tg_id, ident):
+            await self.users_async.upsert_user(tg_id, username, display_name, None)
+            self.persisted.remember(tg_id, ident)
+        await self.users_async.mark_reachable(tg_id)
 
     def set_step(self, user_id: int, step: str | None, payload: dict | None = None):
         if step is None:
@@ -25,27 +89,41 @@ class UserService:
     def get_step(self, user_id: int):
         return self.state.get_state(user_id)
 
+    async def get_step_async(self, user_id: int):
+        return await self.state_async.get_state(user_id)
+
     def update_display_name(self, user_id: int, name: str):
         self.users.update_display_name(user_id, name)
 
     def enroll_user(self, user_id: int, delivery_time: str):
         self.enroll.upsert(user_id, delivery_time)
+        self.planner_queue.enqueue([user_id], "enrolled", reschedule=True)
 
     def update_delivery_time(self, user_id: int, delivery_time: str):
         self.enroll.upsert(user_id, delivery_time)
+        self.planner_queue.enqueue([user_id], "delivery_time", reschedule=True)
 
     def has_pd_consent(self, user_id: int) -> bool:
-        u = self.users.get_user(user_id)
-        return bool(u and u.get("pd_consent"))
+        profile = self.users.get_profile(user_id)
+        return bool(profile and profile["pd_consent"])
+
+    async def has_pd_consent_async(self, user_id: int) -> bool:
+        profile = await self.users_async.get_profile(user_id)
+        return bool(profile and profile["pd_consent"])
 
     def set_pd_consent(self, user_id: int, consent: bool):
         self.users.set_pd_consent(user_id, consent)
 
     def get_timezone(self, user_id: int) -> str | None:
-        u = self.users.get_user(user_id)
-        if not u:
-            return None
-        return u.get("timezone")
+        return self.users.get_timezone(user_id)
+
+    async def get_timezone_async(self, user_id: int) -> str | None:
+        return await self.users_async.get_timezone(user_id)
 
     def set_timezone(self, user_id: int, tz_name: str):
+        # Committed on its own so the profile cache is invalidated after the write.
         self.users.set_timezone(user_id, tz_name)
+        with self.db.transaction():
+            # Habit slots were planned in the old zone; the replan below rebuilds them.
+            self.habit_schedule.cancel_future_for_user(user_id)
+            self.planner_queue.enqueue([user_id], "timezone", reschedule=True)